@@ -62,7 +62,7 @@ def main(db_list):
             res[1] = res[1].split('_')[0]
             db.add_row(res)
 
-        db.flush()
+        db.close()
 
 
 if __name__ == "__main__":
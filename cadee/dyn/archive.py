@@ -0,0 +1,642 @@
+#!/usr/bin/env python
+
+"""
+Simpack archive with a sidecar index.
+
+A simpack is a plain tar archive, that grows by appending new versions of
+changed files. tarfile.open(simpack, 'a') has to walk every header to find
+the end of the archive, and extracting it writes every old version of
+every file again.
+
+SimpackArchive keeps an index next to the tar (simpack.tar.idx), which
+records the end of the archive and the offset of the latest version of
+each member. Appending seeks to the end and costs only the size of the new
+data; the latest version of any file is read with a single seek.
+
+The tar itself is unchanged, and stays readable with tar or tarfile.
+If the index is missing or does not match the tar (eg. the tar was
+modified with another tool), it is rebuilt with one scan of the tar.
+
+Members can be compressed, one by one, with a codec chosen by the type of
+the file (see parse_compression): eg. trajectory.dcd is stored as the
+member trajectory.dcd.gz, with pax headers, that record the name, the
+codec and the size of the original. The index refers to the original
+name; extract() and extractfile() decompress. Without the index, tar
+extracts the compressed files, that gunzip (bunzip2, unxz) can read.
+
+Run as a script, it extracts the latest version of every member of a
+simpack, decompressed (eg. for the tools repair_simpack and lossy_repack).
+
+Archiver appends snapshots of files to simpacks in a background thread,
+so a worker can continue computing while its backup is written. Files
+are compressed in that thread, before the IO-ticket is requested.
+
+Author: {0} ({1})
+
+This module is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import argparse
+import bz2
+import errno
+import gzip
+import hashlib
+import json
+import os
+import Queue
+import shutil
+import tarfile
+import tempfile
+import threading
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+logger = tools.getLogger('dyn.archive')
+
+INDEX_SUFFIX = '.idx'
+INDEX_VERSION = 2  # 2: compressed members
+
+CHUNKSIZE = 1024 * 1024  # [bytes] copy buffer
+DIGEST_MAX = 16 * 1024 * 1024  # [bytes] digested, when the index is rebuilt
+
+# pax headers of compressed members
+PAX_NAME = 'CADEE.name'
+PAX_CODEC = 'CADEE.codec'
+PAX_SIZE = 'CADEE.size'
+
+# trajectories compress poorly, but are large: fast level
+DEFAULT_COMPRESSION = 'dcd=gz:1,re=gz:6,en=gz:6'
+
+
+def _open_gz(path, level):
+    return gzip.GzipFile(path, 'wb', level)
+
+
+def _open_bz2(path, level):
+    return bz2.BZ2File(path, 'w', compresslevel=level)
+
+
+def _open_xz(path, level):
+    return lzma.LZMAFile(path, 'w', preset=level)
+
+
+# codec: suffix, opens a file for compressed writing, decompressor
+CODECS = {
+    'gz': ('.gz', _open_gz, lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)),
+    'bz2': ('.bz2', _open_bz2, bz2.BZ2Decompressor)}
+if lzma is not None:
+    CODECS['xz'] = ('.xz', _open_xz, lzma.LZMADecompressor)
+
+
+def _padded(size):
+    """ Return size rounded up to full tar blocks """
+    blocks, remainder = divmod(size, tarfile.BLOCKSIZE)
+    if remainder > 0:
+        blocks += 1
+    return blocks * tarfile.BLOCKSIZE
+
+
+def _copy(fil_in, fil_out, size):
+    """ Copy size bytes from fil_in to fil_out in chunks """
+    while size > 0:
+        buf = fil_in.read(min(CHUNKSIZE, size))
+        if not buf:
+            raise IOError('unexpected end of data')
+        fil_out.write(buf)
+        size -= len(buf)
+
+
+def _decompress(fil_in, fil_out, size, codec):
+    """ Decompress size bytes from fil_in to fil_out in chunks """
+    decompressor = CODECS[codec][2]()
+    while size > 0:
+        buf = fil_in.read(min(CHUNKSIZE, size))
+        if not buf:
+            raise IOError('unexpected end of data')
+        fil_out.write(decompressor.decompress(buf))
+        size -= len(buf)
+    if hasattr(decompressor, 'flush'):
+        fil_out.write(decompressor.flush())
+
+
+def parse_compression(spec):
+    """ Return the compression of file types in spec.
+
+    spec is like 'dcd=gz:1,re=xz:6': file extension, codec (gz, bz2 or
+    xz) and level. xz needs lzma (backports.lzma for python 2); without
+    it, gz is used.
+
+    @return: dict {'.dcd': ('gz', 1), ...}
+    @raises ValueError
+    """
+    compression = {}
+    if not spec:
+        return compression
+    for item in spec.split(','):
+        try:
+            ext, codec = item.split('=')
+            codec, level = codec.split(':')
+            level = int(level)
+        except ValueError:
+            raise ValueError('expected ext=codec:level', item)
+        codec = codec.strip().lower()
+        if codec == 'xz' and codec not in CODECS:
+            logger.warning('lzma is not available, using gz for %s.', ext)
+            codec = 'gz'
+            level = max(1, min(9, level))
+        if codec not in CODECS:
+            raise ValueError('unknown codec', codec)
+        ext = '.' + ext.strip().lstrip('.').lower()
+        compression[ext] = (codec, level)
+    return compression
+
+
+def compress(fnames, compression, root='.'):
+    """ Compress the files, whose type is in compression, in place.
+
+    Every file is replaced by a new, compressed file: other hardlinks
+    (see snapshot) still point to the original.
+
+    @param fnames: list of paths, relative to root
+    @param compression: see parse_compression
+    @return: dict {fname: [codec, original size]}
+    """
+    codecs = {}
+    for fname in fnames:
+        ext = os.path.splitext(fname)[1].lower()
+        path = os.path.join(root, fname)
+        if ext not in compression or not os.path.isfile(path):
+            continue
+        codec, level = compression[ext]
+        size = os.path.getsize(path)
+        tmp = path + CODECS[codec][0]
+        with open(path, 'rb') as fil_in:
+            fil_out = CODECS[codec][1](tmp, level)
+            try:
+                shutil.copyfileobj(fil_in, fil_out, CHUNKSIZE)
+            finally:
+                fil_out.close()
+        shutil.copystat(path, tmp)
+        os.rename(tmp, path)
+        codecs[fname] = [codec, size]
+    return codecs
+
+
+class _Hashing(object):
+    """ File wrapper, that computes the md5 of the data read """
+
+    def __init__(self, fil):
+        self.fil = fil
+        self.md5 = hashlib.md5()
+
+    def read(self, size=-1):
+        buf = self.fil.read(size)
+        self.md5.update(buf)
+        return buf
+
+
+class SimpackArchive(object):
+    """ tar archive with a sidecar index of its members """
+
+    def __init__(self, path):
+        """
+        @param path: path to the tar archive, does not need to exist
+        @type path: str
+        """
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.members = {}  # name: dict with latest offset_data, size, ...
+        self.end = 0       # offset of the end-of-archive marker
+        self.load()
+
+    def _stat(self):
+        """ Return [size, mtime] of the tar, or None if it does not exist """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return [stat.st_size, stat.st_mtime]
+
+    def load(self):
+        """ Load the index, rebuild it if it is missing or stale """
+        stat = self._stat()
+        if stat is None:
+            self.members = {}
+            self.end = 0
+            return
+        try:
+            with open(self.index_path) as fil:
+                index = json.load(fil)
+            if (index['version'] == INDEX_VERSION and
+                    [index['size'], index['mtime']] == stat):
+                self.members = index['members']
+                self.end = index['end']
+                return
+            logger.debug('Stale index %s.', self.index_path)
+        except (IOError, ValueError, KeyError):
+            logger.debug('No valid index %s.', self.index_path)
+        self.rebuild()
+
+    def rebuild(self):
+        """ Scan the tar and write the index """
+        stat = self._stat()
+        found = []
+        tar = tarfile.open(self.path)
+        try:
+            while True:
+                try:
+                    member = tar.next()
+                except tarfile.ReadError:
+                    if not found:
+                        raise
+                    member = None  # data of last member is truncated
+                if member is None:
+                    break
+                found.append(member)
+            end = tar.offset
+        finally:
+            tar.close()
+        # an interrupted append leaves a member with truncated data behind,
+        # the next append overwrites it
+        while found and found[-1].offset_data + found[-1].size > stat[0]:
+            end = found.pop().offset
+            logger.warning('Truncated member in %s at %s', self.path, end)
+        members = {}
+        for member in found:
+            name = member.pax_headers.get(PAX_NAME, member.name)
+            members[name] = self._entry(member, member.offset_data)
+        # keep digests of unchanged members
+        for name, entry in members.items():
+            old = self.members.get(name)
+            if (old is not None and 'md5' in old and
+                    old['offset_data'] == entry['offset_data']):
+                entry['md5'] = old['md5']
+        self.members = members
+        self.end = end
+        # eg. a tar packed without an index: the node cache (nodecache.py)
+        # only shares members with a digest, which are small inputs
+        for name, entry in members.items():
+            if ('md5' not in entry and entry['size'] <= DIGEST_MAX and
+                    entry['type'] in tarfile.REGULAR_TYPES):
+                entry['md5'] = hashlib.md5(self.extractfile(name)).hexdigest()
+        self._save(stat)
+        logger.debug('Rebuilt index %s.', self.index_path)
+
+    @staticmethod
+    def _entry(tarinfo, offset_data):
+        """ Index entry of tarinfo; size is the size of the original,
+        stored the size in the tar, if the member is compressed """
+        entry = {'offset_data': offset_data, 'size': tarinfo.size,
+                 'mtime': tarinfo.mtime, 'mode': tarinfo.mode,
+                 'type': tarinfo.type}
+        codec = tarinfo.pax_headers.get(PAX_CODEC)
+        if codec is not None:
+            entry['codec'] = codec
+            entry['stored'] = tarinfo.size
+            entry['size'] = int(tarinfo.pax_headers[PAX_SIZE])
+        return entry
+
+    def _save(self, stat=None):
+        """ Write the index atomically """
+        if stat is None:
+            stat = self._stat()
+        index = {'version': INDEX_VERSION, 'size': stat[0], 'mtime': stat[1],
+                 'end': self.end, 'members': self.members}
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w') as fil:
+            json.dump(index, fil)
+        os.rename(tmp, self.index_path)
+
+    def names(self):
+        """ Return names of all members """
+        return self.members.keys()
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def digest(self, name):
+        """ Return md5 of the latest version of name, or None if unknown """
+        entry = self.members.get(name)
+        if entry is None:
+            return None
+        return entry.get('md5')
+
+    def append(self, fnames, digests=None, root='.', codecs=None):
+        """ Append files (and directories, recursively) to the archive.
+
+        @param fnames: list of paths, relative to root
+        @param digests: optional dict {fname: md5}, stored in the index;
+                        the digests of other files are computed
+        @param root: directory the files are read from
+        @param codecs: dict {fname: [codec, original size]} of the files,
+                       that are compressed already, see compress()
+        @return: number of bytes appended
+        """
+        if digests is None:
+            digests = {}
+        if codecs is None:
+            codecs = {}
+        # make sure, nobody else has appended since the index was written
+        self.load()
+
+        paths = []
+        for fname in fnames:
+            paths.append(fname)
+            if os.path.isdir(os.path.join(root, fname)):
+                for dirpath, dirs, files in os.walk(os.path.join(root, fname)):
+                    dirpath = os.path.relpath(dirpath, root)
+                    for name in sorted(dirs) + sorted(files):
+                        paths.append(os.path.join(dirpath, name))
+
+        if os.path.exists(self.path):
+            fil = open(self.path, 'r+b')
+        else:
+            fil = open(self.path, 'w+b')
+        try:
+            fil.seek(self.end)
+            tar = tarfile.open(fileobj=fil, mode='w',
+                               format=tarfile.PAX_FORMAT)
+            start = tar.offset
+            for path in paths:
+                if path in codecs:
+                    codec, size = codecs[path]
+                    tarinfo = tar.gettarinfo(os.path.join(root, path),
+                                             path + CODECS[codec][0])
+                    tarinfo.pax_headers = {PAX_NAME: path, PAX_CODEC: codec,
+                                           PAX_SIZE: str(size)}
+                else:
+                    tarinfo = tar.gettarinfo(os.path.join(root, path), path)
+                md5 = digests.get(path)
+                if tarinfo.isreg():
+                    with open(os.path.join(root, path), 'rb') as fil_in:
+                        if md5 is None and path not in codecs:
+                            # the digest comes for free, see nodecache.py
+                            fil_in = _Hashing(fil_in)
+                            tar.addfile(tarinfo, fil_in)
+                            md5 = fil_in.md5.hexdigest()
+                        else:
+                            tar.addfile(tarinfo, fil_in)
+                else:
+                    tar.addfile(tarinfo)
+                offset_data = tar.offset - _padded(tarinfo.size)
+                entry = self._entry(tarinfo, offset_data)
+                if md5 is not None:
+                    entry['md5'] = md5
+                self.members[path] = entry
+            self.end = tar.offset
+            appended = self.end - start
+            # writes the end-of-archive marker, but does not close fil
+            tar.close()
+            fil.truncate()
+        finally:
+            fil.close()
+        self._save()
+        return appended
+
+    def extractfile(self, name):
+        """ Return the content of the latest version of member name """
+        entry = self.members[name]
+        with open(self.path, 'rb') as fil:
+            fil.seek(entry['offset_data'])
+            data = fil.read(entry.get('stored', entry['size']))
+        if 'codec' in entry:
+            decompressor = CODECS[entry['codec']][2]()
+            data = decompressor.decompress(data)
+            if hasattr(decompressor, 'flush'):
+                data += decompressor.flush()
+        return data
+
+    def extract(self, names=None, path='.'):
+        """ Extract (and decompress) the latest version of members.
+
+        @param names: names of members to extract, default: all
+        @param path: directory to extract to
+        @return: number of bytes read from the archive
+        """
+        if names is None:
+            names = self.names()
+        extracted = 0
+        dirs = []
+        with open(self.path, 'rb') as fil:
+            for name in sorted(names,
+                               key=lambda n: self.members[n]['offset_data']):
+                entry = self.members[name]
+                target = os.path.join(path, name)
+                if os.path.isabs(name) or '..' in name.split('/'):
+                    logger.warning('Skip unsafe member %s', name)
+                    continue
+                parent = os.path.dirname(target)
+                if parent != '' and not os.path.isdir(parent):
+                    os.makedirs(parent)
+                if entry['type'] == tarfile.DIRTYPE:
+                    if not os.path.isdir(target):
+                        os.makedirs(target)
+                    dirs.append([target, entry])
+                    continue
+                if entry['type'] not in tarfile.REGULAR_TYPES:
+                    logger.warning('Skip member %s of type %s',
+                                   name, entry['type'])
+                    continue
+                stored = entry.get('stored', entry['size'])
+                fil.seek(entry['offset_data'])
+                with open(target, 'wb') as fil_out:
+                    if 'codec' in entry:
+                        _decompress(fil, fil_out, stored, entry['codec'])
+                    else:
+                        _copy(fil, fil_out, stored)
+                os.chmod(target, entry['mode'])
+                os.utime(target, (entry['mtime'], entry['mtime']))
+                extracted += stored
+        for target, entry in dirs:
+            os.chmod(target, entry['mode'])
+            os.utime(target, (entry['mtime'], entry['mtime']))
+        return extracted
+
+
+def replace(src, dst):
+    """ Rename simpack src (and its index) to dst, dst is overwritten """
+    os.rename(src, dst)
+    if os.path.exists(src + INDEX_SUFFIX):
+        os.rename(src + INDEX_SUFFIX, dst + INDEX_SUFFIX)
+    elif os.path.exists(dst + INDEX_SUFFIX):
+        os.remove(dst + INDEX_SUFFIX)
+
+
+def remove(path):
+    """ Remove simpack path and its index, if they exist """
+    for fname in (path, path + INDEX_SUFFIX):
+        try:
+            os.remove(fname)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+
+
+def hardlink(src, dst):
+    """ Hardlink src to dst, copy if linking is not possible """
+    try:
+        os.link(src, dst)
+    except OSError as err:
+        if err.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        shutil.copy2(src, dst)
+
+
+def snapshot(fnames, snapdir):
+    """ Hardlink files (and directories, recursively) to snapdir.
+
+    Qdyn writes the output of every step to new files, so a hardlink
+    keeps the content, even if the file is replaced in the meantime.
+
+    @param fnames: list of paths, relative to cwd
+    @param snapdir: existing directory
+    """
+    for fname in fnames:
+        if os.path.isdir(fname):
+            for dirpath, dirs, files in os.walk(fname):
+                os.makedirs(os.path.join(snapdir, dirpath))
+                for name in files:
+                    hardlink(os.path.join(dirpath, name),
+                          os.path.join(snapdir, dirpath, name))
+                shutil.copystat(dirpath, os.path.join(snapdir, dirpath))
+        else:
+            hardlink(fname, os.path.join(snapdir, fname))
+
+
+class Archiver(object):
+    """ Append snapshots of files to simpacks, one after the other.
+
+    Snapshots are appended in the order they are submitted, so files
+    of a later snapshot never end up in a simpack before the files of
+    an earlier one; and within a snapshot the order of fnames is kept.
+    """
+
+    def __init__(self, ticket, stage, threaded=True, done=None,
+                 compression=None):
+        """
+        @param ticket: callable, returns IO-ticket context manager
+        @param stage: directory for snapshots (same filesystem as cwd)
+        @param threaded: append in background thread, else immediately
+        @param done: callable(path, ticket), called after every append
+        @param compression: compress members, see parse_compression
+        """
+        self.ticket = ticket
+        self.stage = stage
+        self.done = done
+        self.compression = compression or {}
+        self.failed = []  # fnames, that could not be appended
+        self.lock = threading.Lock()
+        if not os.path.exists(stage):
+            os.makedirs(stage)
+        self.jobs = None
+        if threaded:
+            self.jobs = Queue.Queue()
+            self.thread = threading.Thread(target=self._loop,
+                                           name='archiver')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def submit(self, path, fnames, digests=None):
+        """ Snapshot fnames now, and append them to simpack path.
+        @param path: path to simpack
+        @param fnames: list of paths, relative to cwd
+        @param digests: optional dict {fname: md5}
+        """
+        snapdir = tempfile.mkdtemp(dir=self.stage)
+        try:
+            snapshot(fnames, snapdir)
+        except (IOError, OSError):
+            shutil.rmtree(snapdir)
+            raise
+        job = (path, snapdir, fnames, digests)
+        if self.jobs is None:
+            self._append(*job)
+        else:
+            self.jobs.put(job)
+
+    def _append(self, path, snapdir, fnames, digests):
+        try:
+            # on the cores of the worker, not while holding the ticket
+            try:
+                codecs = compress(fnames, self.compression, snapdir)
+            except (IOError, OSError, EOFError):
+                logger.exception('Could not compress the files for %s',
+                                 path)
+                self._fail(fnames)
+                return
+            with self.ticket() as ticket:
+                try:
+                    ticket.nbytes = SimpackArchive(path).append(
+                        fnames, digests, root=snapdir, codecs=codecs)
+                except (IOError, OSError, ValueError, tarfile.TarError):
+                    logger.exception('Could not append to %s', path)
+                    self._fail(fnames)
+            if self.done is not None:
+                self.done(path, ticket)
+        finally:
+            shutil.rmtree(snapdir, ignore_errors=True)
+
+    def _loop(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                self._append(*job)
+            except Exception:
+                logger.exception('Archiver failed')
+                self._fail(job[2])
+            finally:
+                self.jobs.task_done()
+
+    def flush(self):
+        """ Wait until all submitted snapshots are appended """
+        if self.jobs is not None:
+            self.jobs.join()
+
+    def _fail(self, fnames):
+        with self.lock:
+            self.failed.extend(fnames)
+
+    def pop_failed(self):
+        """ Return and forget fnames, that could not be appended """
+        with self.lock:
+            failed = self.failed
+            self.failed = []
+        return failed
+
+    def close(self):
+        """ Append remaining snapshots and stop the thread """
+        if self.jobs is not None:
+            self.jobs.put(None)
+            self.thread.join()
+            self.jobs = None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        'CADEE: extract the latest version of every member of a simpack.')
+    parser.add_argument('simpack')
+    parser.add_argument('--path', default='.',
+                        help='directory to extract to (default: cwd)')
+    args = parser.parse_args()
+    SimpackArchive(args.simpack).extract(path=args.path)
+
+
+if __name__ == "__main__":
+    main()
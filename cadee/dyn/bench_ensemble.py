@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of the master/worker machinery of ensemble.py.
+
+Rank 0 runs the Master, all other ranks run Workers, like 'cadee dyn',
+but Qdyn is the stand-in of standin_q.py and the simpacks are synthetic
+(see synthetic.py). Nothing is computed, but inputs are extracted, logs,
+restarts, trajectories and energies written, checked, compressed and
+archived, like in production. Run it oversubscribed, eg.:
+
+    mpirun -n 33 --oversubscribe python bench_ensemble.py /tmp/bench \\
+        --mutants 32 --replicas 4 --steps_scale 0.01
+
+At the end, rank 0 reports the makespan, the utilisation of the worker
+ranks, the distribution of the waits for IO-tickets and the CPU time of
+the master. Simpacks in the folder are used, if there are any; remove
+the folder (or use a new one) to start over.
+
+With --alpha and --hij, the simpacks are mapped with the Qfep stand-in.
+A folder bin/ with the stand-ins is put first in the PATH, so qscripts
+finds it when it creates its configuration (qscripts/qscripts.cfg); an
+existing configuration is used as it is.
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import time
+
+import archive
+import compression
+import ensemble
+import jobqueue
+import metrics
+import mpi
+import synthetic
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+logger = tools.getLogger('dyn.bench')
+
+STANDIN = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'standin_q.py')
+STANDIN_NAMES = ('Qdyn6', 'Qdyn6p', 'Qfep6', 'qfep')
+
+
+def percentile(values, fraction):
+    """ The fraction-percentile of values (nearest rank), or 0. """
+    if not values:
+        return 0.
+    values = sorted(values)
+    idx = int(round(fraction * (len(values) - 1)))
+    return values[idx]
+
+
+class BenchMetrics(metrics.Metrics):
+    """ Metrics, that keeps every wait for an IO-ticket """
+
+    def __init__(self, *args, **kwargs):
+        metrics.Metrics.__init__(self, *args, **kwargs)
+        self.wait_samples = []
+
+    def io_wait(self, seconds):
+        metrics.Metrics.io_wait(self, seconds)
+        self.wait_samples.append(seconds)
+
+
+class BenchMaster(ensemble.Master):
+    """ The Master, measuring the busy time of every rank """
+
+    def __init__(self, *args, **kwargs):
+        ensemble.Master.__init__(self, *args, **kwargs)
+        self.metrics = BenchMetrics(self.simpackdir)
+        self.busy = {}  # rank: seconds with a simpack
+        self.cpu = os.times()
+        self.report = None
+
+    def _process_mpi(self, tag, source, data):
+        if (tag in (mpi.Tags.DONE, mpi.Tags.SHUTDOWN) and
+                source in self.running):
+            self.busy[source] = (self.busy.get(source, 0.) + time.time() -
+                                 self.running[source][1])
+        ensemble.Master._process_mpi(self, tag, source, data)
+
+    def _summary(self):
+        """ Return the results of the benchmark as dict """
+        makespan = time.time() - self.start
+        cpu = os.times()
+        cpu = cpu[0] + cpu[1] - self.cpu[0] - self.cpu[1]
+        workers = mpi.size - 1
+        utilisation = [self.busy.get(rank, 0.) / makespan
+                       for rank in range(1, mpi.size)]
+        waits = self.metrics.wait_samples
+        return {
+            'ranks': mpi.size,
+            'simpacks_done': self.queue.count(jobqueue.DONE),
+            'simpacks_failed': self.queue.count(jobqueue.FAILED),
+            'simpacks_quarantined': self.queue.count(jobqueue.QUARANTINED),
+            'makespan_seconds': makespan,
+            'utilisation': sum(utilisation) / max(1, workers),
+            'utilisation_min': min(utilisation or [0.]),
+            'utilisation_median': percentile(utilisation, 0.5),
+            'utilisation_max': max(utilisation or [0.]),
+            'io_ticket_waits': len(waits),
+            'io_ticket_wait_mean': sum(waits) / max(1, len(waits)),
+            'io_ticket_wait_p50': percentile(waits, 0.5),
+            'io_ticket_wait_p90': percentile(waits, 0.9),
+            'io_ticket_wait_p99': percentile(waits, 0.99),
+            'io_ticket_wait_max': max(waits or [0.]),
+            'master_cpu_seconds': cpu,
+            'master_cpu_fraction': cpu / makespan}
+
+    def _shutdown(self):
+        self.report = self._summary()
+        print('BENCHMARK', json.dumps(self.report, sort_keys=True))
+        print('makespan: {makespan_seconds:.1f}s, simpacks: '
+              '{simpacks_done} done, {simpacks_failed} failed\n'
+              'utilisation of {0} workers: {utilisation:.1%} (min '
+              '{utilisation_min:.1%}, median {utilisation_median:.1%}, max '
+              '{utilisation_max:.1%})\n'
+              'IO-ticket waits: {io_ticket_waits}, mean '
+              '{io_ticket_wait_mean:.3f}s, p50 {io_ticket_wait_p50:.3f}s, '
+              'p90 {io_ticket_wait_p90:.3f}s, p99 {io_ticket_wait_p99:.3f}s, '
+              'max {io_ticket_wait_max:.3f}s\n'
+              'master CPU: {master_cpu_seconds:.1f}s '
+              '({master_cpu_fraction:.1%} of the makespan)'.format(
+                  mpi.size - 1, **self.report))
+        ensemble.Master._shutdown(self)
+
+
+def create_standins(folder):
+    """ Create folder with links to the stand-ins """
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    for name in STANDIN_NAMES:
+        link = os.path.join(folder, name)
+        if not os.path.lexists(link):
+            os.symlink(STANDIN, link)
+
+
+def use_standins(folder):
+    """ Put folder first in the PATH, and make its stand-ins the
+    executables of the workers """
+    os.environ['PATH'] = folder + os.pathsep + os.environ.get('PATH', '')
+    os.environ['CADEE_QDYN'] = os.path.join(folder, 'Qdyn6')
+    os.environ['CADEE_QDYN_PARALLEL'] = os.path.join(folder, 'Qdyn6p')
+
+
+def main():
+    parser = argparse.ArgumentParser('CADEE: ensemble benchmark.')
+    parser.add_argument('folder', help='folder with the (synthetic) simpacks')
+    parser.add_argument('--mutants', type=int, default=16)
+    parser.add_argument('--replicas', type=int, default=1)
+    parser.add_argument('--atoms', type=int, default=synthetic.ATOMS)
+    parser.add_argument('--steps_scale', type=float, default=0.01,
+                        help='scale the MD steps of the template')
+    parser.add_argument('--template', default=synthetic.TEMPLATE)
+    parser.add_argument('--step_seconds', type=float, default=None,
+                        help='seconds per MD step of the stand-in')
+    parser.add_argument('--fail', type=float, default=None,
+                        help='probability of a failing step')
+    parser.add_argument('--alpha', type=float, default=None)
+    parser.add_argument('--hij', type=float, default=None)
+    parser.add_argument('--no_prefetch', action='store_true', default=False)
+    parser.add_argument('--compress', nargs='?', default=None,
+                        const=archive.DEFAULT_COMPRESSION,
+                        help='compress the members appended to the simpacks')
+    parser.add_argument('--log_compression',
+                        default=compression.DEFAULT_POLICY,
+                        help='gzip levels of logs and energies')
+    parser.add_argument('--compress_threads', type=int, default=1,
+                        help='threads compressing large logs and energies')
+    parser.add_argument('--json', default=None,
+                        help='write the results to this file')
+    args = parser.parse_args()
+
+    folder = os.path.abspath(args.folder)
+    bindir = os.path.join(folder, 'bin')
+    use_standins(bindir)
+    if args.step_seconds is not None:
+        os.environ['CADEE_STANDIN_STEP_SECONDS'] = str(args.step_seconds)
+    if args.fail is not None:
+        os.environ['CADEE_STANDIN_FAIL'] = str(args.fail)
+
+    tempdir = ensemble.scratch_dir()
+    if mpi.rank == mpi.root:
+        create_standins(bindir)
+        inputs = ensemble.find_simpacks(folder)
+        if not inputs:
+            inputs = synthetic.generate(folder, args.mutants, args.replicas,
+                                        args.template, args.atoms,
+                                        args.steps_scale)
+    mpi.comm.Barrier()
+
+    if mpi.rank == mpi.root:
+        master = BenchMaster(tempdir, time.time(), folder,
+                             prefetch=not args.no_prefetch)
+        master.enqueue(inputs)
+        try:
+            master.run()
+        except SystemExit:
+            pass
+        if args.json is not None:
+            with open(args.json, 'w') as fil:
+                json.dump(master.report, fil, indent=1, sort_keys=True)
+    else:
+        while True:
+            try:
+                ensemble.Worker(tempdir, args.alpha, args.hij, False,
+                                compress=args.compress,
+                                log_compression=args.log_compression,
+                                compress_threads=args.compress_threads).run()
+                break
+            except KeyboardInterrupt:
+                break
+            except Exception as err:
+                logger.exception('Rank %s raised exception %s', mpi.rank, err)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of the message load on rank 0, with and without sub-masters.
+
+Synthetic workers send IO-requests, logs and results like real workers,
+but do not compute anything. Rank 0 only counts the messages it
+receives. Run it oversubscribed, eg.:
+
+    mpirun -n 257 --oversubscribe python bench_hierarchy.py
+    mpirun -n 257 --oversubscribe python bench_hierarchy.py --group_size 16
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+from __future__ import print_function
+from platform import node as hostname
+import argparse
+import time
+
+import ensemble
+import hierarchy
+import mpi
+
+from mpi4py import MPI
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+
+class Sink(ensemble.Listener):
+    """ Rank 0: grant all IO-requests, count messages """
+    def __init__(self, numranks):
+        self.comm = mpi.comm
+        self.listen = [(tag, MPI.ANY_SOURCE) for tag in ensemble.LISTEN_TAGS]
+        self.numranks = numranks
+        self.messages = 0
+        self.items = 0
+
+    def run(self):
+        self._post_receives()
+        start = time.time()
+        while self.numranks > 0:
+            tag, source, data = self._wait()
+            self.messages += 1
+            if tag == mpi.Tags.BATCH:
+                self.items += len(data)
+            else:
+                self.items += 1
+            if tag == mpi.Tags.IO_REQUEST:
+                self.comm.send('', source, tag=mpi.Tags.IO_TICKET)
+            elif tag == mpi.Tags.SHUTDOWN:
+                self.numranks -= 1
+        return time.time() - start
+
+
+def synthetic_worker(steps, logs, compute):
+    """ Send the messages of steps MD-steps """
+    for _ in range(steps):
+        with ensemble.IOTicket(mpi.comm, mpi.parent) as ticket:
+            ticket.nbytes = 1024 * 1024
+        for i in range(logs):
+            mpi.comm.send('synthetic log line {0}'.format(i), mpi.parent,
+                          tag=mpi.Tags.LOG)
+        mpi.comm.send([time.time(), 'wt', mpi.rank, 'synthetic', 'fep'],
+                      mpi.parent, tag=mpi.Tags.RESULTS)
+        time.sleep(compute)
+    mpi.comm.send('GoodBye!', mpi.root, tag=mpi.Tags.SHUTDOWN)
+    if mpi.parent != mpi.root:
+        mpi.comm.send('GoodBye!', mpi.parent, tag=mpi.Tags.SHUTDOWN)
+
+
+def main():
+    parser = argparse.ArgumentParser('CADEE: sub-master benchmark.')
+    parser.add_argument('--group_size', default=0,
+                        type=hierarchy.parse_group_size)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--logs', type=int, default=20,
+                        help='log messages per step')
+    parser.add_argument('--compute', type=float, default=0.01,
+                        help='seconds per step')
+    args = parser.parse_args()
+
+    hosts = mpi.comm.allgather(hostname())
+    submasters = hierarchy.groups(hosts, args.group_size, mpi.root)
+    mpi.parent = hierarchy.parents(hosts, args.group_size, mpi.root)[mpi.rank]
+
+    mpi.comm.Barrier()
+    if mpi.rank == mpi.root:
+        sink = Sink(mpi.size - 1)
+        elapsed = sink.run()
+        print('ranks: {0} sub-masters: {1} messages at rank 0: {2} '
+              '(items: {3}) time: {4:.2f}s, {5:.0f} messages/s'.format(
+                  mpi.size, len(submasters), sink.messages, sink.items,
+                  elapsed, sink.messages / elapsed))
+    elif mpi.rank in submasters:
+        ensemble.SubMaster(submasters[mpi.rank]).run()
+    else:
+        synthetic_worker(args.steps, args.logs, args.compute)
+
+
+if __name__ == "__main__":
+    main()
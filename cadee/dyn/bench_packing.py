@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+"""
+Check the placement of multi-core simpacks (see packing.py).
+
+Packs the ranks like 'cadee dyn --cores_per_simpack', and every leader
+runs the stand-in (standin_qdyn.py) through the launcher, like it would
+run Qdyn6p. Rank 0 prints the groups, and where the processes of every
+group did run. Eg. on two nodes with 20 cores each:
+
+    mpirun --bind-to none -n 40 python bench_packing.py --cores 8
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+from __future__ import print_function
+from platform import node as hostname
+import argparse
+import os
+import subprocess
+
+import mpi
+import packing
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+STANDIN = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'standin_qdyn.py')
+
+
+def main():
+    parser = argparse.ArgumentParser('CADEE: multi-core placement check.')
+    parser.add_argument('--cores', type=int, default=4,
+                        help='cores per simpack')
+    parser.add_argument('--exe', default=STANDIN,
+                        help='stand-in for Qdyn6p (default: %(default)s)')
+    args = parser.parse_args()
+
+    hosts = mpi.comm.allgather(hostname())
+    allowed = mpi.comm.allgather(packing.allowed_cpus())
+    leaders = packing.pack(hosts, args.cores, exclude=[mpi.root])
+
+    output = ''
+    if mpi.rank in leaders:
+        group = [mpi.rank] + leaders[mpi.rank]
+        cpus = None
+        if all(allowed[rank] is not None for rank in group):
+            cpus = set().union(*[allowed[rank] for rank in group])
+        cmd = packing.command(args.exe, len(group), cpus)
+        output = subprocess.check_output(cmd + ['eq1.inp'],
+                                         env=packing.launch_env())
+    outputs = mpi.comm.gather(output, root=mpi.root)
+
+    if mpi.rank == mpi.root:
+        used = 0
+        for leader in sorted(leaders):
+            group = [leader] + leaders[leader]
+            lines = [line for line in outputs[leader].splitlines()
+                     if line.startswith('PLACEMENT')]
+            used += len(lines)
+            print('group {0} ({1} ranks on {2}): {3} processes'.format(
+                leader, len(group), hosts[leader], len(lines)))
+            for line in lines:
+                print('    ' + line)
+        print('ranks: {0}, master: 1, processes of the stand-in: {1}, '
+              'stranded: {2}'.format(mpi.size, used, mpi.size - 1 - used))
+
+
+if __name__ == "__main__":
+    main()
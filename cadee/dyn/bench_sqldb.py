@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of the results database (tools.SqlDB).
+
+Inserts synthetic Results rows, with the old write path (one execute per
+row, default journal, commits in the caller), and with SqlDB (writer
+thread, executemany, WAL, group commit). Reports the time the caller is
+blocked in total and at most for a single row (eg. by a commit), and the
+time until all rows are committed. Use --dir to place the databases on
+the filesystem of interest, the cost of a commit depends on it.
+
+    python bench_sqldb.py --rows 1000000 --dir /path/to/simpacks
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+
+def synthetic_rows(num):
+    """ Return num rows of synthetic Results """
+    rows = []
+    for i in range(num):
+        res = tools.Results('wt', i % 10, 'fep_{0:03d}'.format(i % 51), 'us')
+        res.dg(12.5 + i % 7, -3.2)
+        res.temp(300.1, 299.8, 300.4, 298.9)
+        res.ene(1200.5, -5400.2, -4199.7)
+        rows.append(res.items())
+    return rows
+
+
+def old_write_path(name, rows, interval):
+    """ one execute per row, commit every interval seconds """
+    conn = sqlite3.connect(name)
+    cursor = conn.cursor()
+    cursor.execute('''CREATE TABLE IF NOT EXISTS results
+    (time int, mutant text, replik int, name text, feptype text, barr_forw real, exo real, barr_back real, ttot real, tfree real, tfreesolute real, tfreesolvent real,  ene_kin real, ene_pot real, ene_tot real); ''')  # NOPEP8
+    template = 'INSERT INTO results VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)'
+    start = time.time()
+    last_commit = start
+    stall = 0
+    for row in rows:
+        before = time.time()
+        cursor.execute(template, row)
+        if last_commit + interval < time.time():
+            conn.commit()
+            last_commit = time.time()
+        stall = max(stall, time.time() - before)
+    blocked = time.time() - start
+    conn.commit()
+    conn.close()
+    return blocked, stall, time.time() - start
+
+
+def new_write_path(name, rows, interval):
+    """ tools.SqlDB """
+    db = tools.SqlDB(name, interval)
+    start = time.time()
+    stall = 0
+    for row in rows:
+        before = time.time()
+        db.add_row(row)
+        stall = max(stall, time.time() - before)
+    blocked = time.time() - start
+    db.close()
+    return blocked, stall, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser('CADEE: results database benchmark.')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--dir', default=None,
+                        help='directory for the databases (default: tmp)')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(dir=args.dir)
+    try:
+        rows = synthetic_rows(args.rows)
+        for label, func, interval in [
+                ('old, commit every 300s', old_write_path, 300),
+                ('old, commit every 2s', old_write_path,
+                 tools.SQL_COMMIT_INTERVAL),
+                ('SqlDB, commit every 2s', new_write_path,
+                 tools.SQL_COMMIT_INTERVAL)]:
+            name = os.path.join(tmp, label.split(',')[0] + str(interval))
+            blocked, stall, total = func(name, rows, interval)
+            print('{0:24s}: {1} rows, caller blocked {2:6.2f}s '
+                  '(max. {3:7.1f}ms per row), committed after {4:6.2f}s '
+                  '({5:8.0f} rows/s)'.format(
+                      label, len(rows), blocked, stall * 1000., total,
+                      len(rows) / total))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+
+"""
+Background compression of the logs and energies of Qdyn.
+
+WorkUnit.checklogfile compresses the log and the energy file of every
+step, that has finished. Done in place, the worker does not compute
+meanwhile. A Compressor does it in a thread, while the next step runs.
+On Linux, the nice value is per thread: the thread runs at low priority,
+and Qdyn keeps the core.
+The callbacks run in that thread and may log, which sends MPI messages
+from a worker rank: the worker only compresses in the background, if
+MPI is THREAD_MULTIPLE (see mpi.thread_multiple).
+
+    compressor = Compressor(parse('log=gz:6,en=gz:1'), threads=4)
+    compressor.submit('md_eq1.log', skip, count, done)
+    ...
+    compressor.flush()  # before the files are mapped or archived
+
+fname is written to fname.gz.tmp, renamed to fname.gz and then removed:
+a fname.gz is always complete. Files of BLOCK_MIN bytes or more are
+compressed in blocks of BLOCK_SIZE by `threads` threads (zlib releases
+the GIL); every block is a gzip member of its own, and the standard gzip
+module reads the concatenated members as one file. Lines in skip are
+dropped, and the lines with count are counted, in the same pass.
+
+The seconds spent compressing, less the seconds the worker waited in
+flush(), are the stall, that the background compression removed.
+
+Author: {0} ({1})
+
+This module is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import collections
+import errno
+import gzip
+import os
+import Queue
+import struct
+import sys
+import threading
+import time
+import zlib
+from multiprocessing.pool import ThreadPool
+
+import archive
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+logger = tools.getLogger('dyn.compression')
+
+DEFAULT_POLICY = 'log=gz:6,en=gz:6'
+DEFAULT_LEVEL = 6
+BLOCK_SIZE = 4 * 1024 * 1024  # [bytes] compressed at once by a thread
+BLOCK_MIN = 4 * BLOCK_SIZE    # [bytes] smaller files are one gzip stream
+NICE = 19  # added to the nice value of the compressing threads
+TMP = '.gz.tmp'
+
+# gzip member: magic, deflate, no flags, no mtime, no extra flags, unknown OS
+GZIP_HEADER = '\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+
+def parse(spec):
+    """ Return the compression levels of file types in spec.
+
+    spec is like archive.parse_compression, eg. 'log=gz:6,en=gz:1'; logs
+    and energies are read with gzip, gz is the only codec.
+
+    @return: dict {'.log': ('gz', 6), ...}
+    @raises ValueError
+    """
+    policy = archive.parse_compression(spec)
+    for ext, (codec, level) in policy.items():
+        if codec != 'gz':
+            raise ValueError('logs and energies are read with gzip',
+                             ext, codec)
+        if not 0 <= level <= 9:
+            raise ValueError('gzip levels are 0 to 9', ext, level)
+    return policy
+
+
+def level(policy, fname):
+    """ The compression level of fname in policy """
+    ext = os.path.splitext(fname)[1].lower()
+    return policy.get(ext, ('gz', DEFAULT_LEVEL))[1]
+
+
+def lower_priority():
+    """ Lower the priority of the calling thread.
+    Elsewhere than on Linux, the nice value is the one of the process,
+    it is left as it is. """
+    if not sys.platform.startswith('linux'):
+        return
+    try:
+        os.nice(NICE)
+    except OSError as err:
+        logger.debug('Could not lower the priority: %s', err)
+
+
+def _blocks(fil, size):
+    """ Yield blocks of about size bytes of fil, that end with a line """
+    rest = ''
+    while True:
+        data = fil.read(size)
+        if not data:
+            if rest:
+                yield rest
+            return
+        data = rest + data
+        end = data.rfind('\n') + 1
+        if end == 0:
+            # no line end, eg. in binary energies
+            end = len(data)
+        rest = data[end:]
+        yield data[:end]
+
+
+def _filter(block, skip, count):
+    """ Return block without the lines in skip, and the number of lines
+    with count """
+    found = block.count(count) if count else 0
+    if skip and any(line in block for line in skip):
+        block = ''.join(line for line in block.splitlines(True)
+                        if line not in skip)
+    return block, found
+
+
+def _member(data, lvl):
+    """ data as a gzip member of its own """
+    deflate = zlib.compressobj(lvl, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return ''.join((GZIP_HEADER, deflate.compress(data), deflate.flush(),
+                    struct.pack('<II', zlib.crc32(data) & 0xffffffff,
+                                len(data) & 0xffffffff)))
+
+
+def _remove(fname):
+    """ Remove fname, if it exists """
+    try:
+        os.remove(fname)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+
+
+def gzip_file(fname, lvl=DEFAULT_LEVEL, skip=(), count=None, pool=None,
+              threads=1):
+    """ Compress fname to fname.gz, and remove fname.
+
+    @param skip: lines, that are dropped
+    @param count: the lines with count are counted
+    @param pool: ThreadPool, compresses large files in blocks
+    @param threads: of pool
+    @return: number of lines with count
+    """
+    tmp = fname + TMP
+    found = 0
+    try:
+        with open(fname, 'rb') as fil_in:
+            with open(tmp, 'wb') as fil_out:
+                if pool is not None and os.path.getsize(fname) >= BLOCK_MIN:
+                    pending = collections.deque()
+                    for block in _blocks(fil_in, BLOCK_SIZE):
+                        block, num = _filter(block, skip, count)
+                        found += num
+                        pending.append(pool.apply_async(_member,
+                                                        (block, lvl)))
+                        # bounded memory: a few blocks per thread
+                        if len(pending) > 2 * threads:
+                            fil_out.write(pending.popleft().get())
+                    while pending:
+                        fil_out.write(pending.popleft().get())
+                else:
+                    fil_gz = gzip.GzipFile(os.path.basename(fname), 'wb',
+                                           lvl, fil_out)
+                    try:
+                        for block in _blocks(fil_in, BLOCK_SIZE):
+                            block, num = _filter(block, skip, count)
+                            found += num
+                            fil_gz.write(block)
+                    finally:
+                        fil_gz.close()
+        os.rename(tmp, fname + '.gz')
+    except BaseException:
+        _remove(tmp)
+        raise
+    _remove(fname)
+    return found
+
+
+class Compressor(object):
+    """ Compresses files in a thread at low priority, see module doc """
+
+    def __init__(self, policy=None, threads=1, background=True):
+        """
+        @param policy: levels per file type, see parse,
+                       default: DEFAULT_POLICY
+        @param threads: compress files of BLOCK_MIN bytes or more in
+                        blocks, with this many threads
+        @param background: False: compress in submit, as before
+        """
+        if policy is None:
+            policy = parse(DEFAULT_POLICY)
+        self.policy = policy
+        self.threads = threads
+        self.background = background
+        self.jobs = Queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = set()  # files, that are compressed or written
+        self.files = 0
+        self.errors = 0
+        self.busy = 0.    # [s] compressing
+        self.waited = 0.  # [s] waiting for the compressor
+        self._thread = None
+        self._pool = None
+
+    def submit(self, fname, skip=(), count=None, done=None):
+        """ Compress fname to fname.gz.
+
+        @param skip: lines, that are dropped
+        @param count: the lines with count are counted
+        @param done: called with fname.gz and the number of lines with
+                     count, in the thread of the compressor; it is not
+                     called, if compression fails (fname is left)
+        """
+        with self.lock:
+            self.pending.update((fname, fname + TMP))
+        job = (fname, skip, count, done)
+        if not self.background:
+            start = time.time()
+            self._run(job)
+            self.waited += time.time() - start
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop,
+                                            name='compressor')
+            self._thread.daemon = True
+            self._thread.start()
+        self.jobs.put(job)
+
+    def is_pending(self, fname):
+        """ True, if fname is being compressed, or written """
+        with self.lock:
+            return fname in self.pending
+
+    def flush(self):
+        """ Wait until all submitted files are compressed """
+        if self._thread is None:
+            return
+        start = time.time()
+        self.jobs.join()
+        self.waited += time.time() - start
+
+    def saved(self):
+        """ [s] of compression, the worker did not wait for """
+        return max(0., self.busy - self.waited)
+
+    def _loop(self):
+        """ Compress the submitted files """
+        lower_priority()
+        if self.threads > 1:
+            # the threads of the pool inherit the priority
+            self._pool = ThreadPool(self.threads)
+        while True:
+            job = self.jobs.get()
+            try:
+                self._run(job)
+            finally:
+                self.jobs.task_done()
+
+    def _run(self, job):
+        """ Compress fname of job, and call done """
+        fname, skip, count, done = job
+        start = time.time()
+        try:
+            found = gzip_file(fname, level(self.policy, fname), skip, count,
+                              self._pool, self.threads)
+        except (IOError, OSError) as err:
+            self.errors += 1
+            logger.warning('Could not compress %s: %s', fname, err)
+            # fname is left as it is, and archived
+            with self.lock:
+                self.pending.difference_update((fname, fname + TMP))
+            return
+        finally:
+            self.busy += time.time() - start
+        with self.lock:
+            self.pending.discard(fname + TMP)
+        self.files += 1
+        try:
+            if done is not None:
+                done(fname + '.gz', found)
+        except Exception:
+            logger.exception('Failed to process compressed %s', fname)
+        finally:
+            with self.lock:
+                self.pending.discard(fname)
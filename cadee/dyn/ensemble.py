@@ -19,6 +19,7 @@ Computer-Aided Directed Evolution of Enzymes.
 from __future__ import print_function
 from platform import node as hostname
 import argparse
+import errno
 import os
 import signal
 import sys
@@ -26,23 +27,39 @@ import shutil
 import time
 import tarfile
 import cPickle
-import hashlib
+import heapq
 import traceback
 
 import scan
 
+import archive
+import compression
+import extraction
+import failures
+import jobqueue
+import metrics
 import mpi
-
+import nodecache
+
+import hierarchy
+import iocontrol
+import manifest
+import packing
+import resources
+import scratch
+import speculation
+import staging
 import tools
 import trajectory
 
 logger = tools.getLogger('dyn')
 
+# Without MPI, Worker and Master run with the local backend (local.py)
 if mpi.mpi:
     from mpi4py import MPI
+    ANY_SOURCE = MPI.ANY_SOURCE
 else:
-    logger.fatal('You can not run ensemble simulation without MPI!')
-    sys.exit(1)
+    ANY_SOURCE = -1
 
 __author__ = "Beat Amrein"
 __email__ = "beat.amrein@gmail.com"
@@ -65,8 +82,8 @@ DEBUG = False
 
 RAISE_EXCEPTIONS = False
 
-# 'Dynamic' IO Adjustment, at least 8 files at the same time,
-#  or mpi.size/16 (whatever is bigger)
+# Initial number of concurrent IO-tickets, at least 8 files at the same time,
+#  or mpi.size/16 (whatever is bigger). Adjusted at runtime by the master.
 PARALLEL_IO = 8
 if int(mpi.size / 16) > PARALLEL_IO:
     PARALLEL_IO = int(mpi.size / 16)
@@ -76,12 +93,30 @@ DONT_LOG_LINES_WITH = ["--- Nonbonded pair list generation -----",
                        "---------- Timing ----------",
                        "Seconds per step (wall-clock):"]
 
+# Tags the master listens to, each with a posted non-blocking receive.
+# The order is the order of precedence, if several messages are pending.
+LISTEN_TAGS = (mpi.Tags.IO_FINISHED, mpi.Tags.IO_REQUEST, mpi.Tags.DONE,
+               mpi.Tags.RESULTS, mpi.Tags.LOG, mpi.Tags.BATCH,
+               mpi.Tags.HEARTBEAT, mpi.Tags.SHUTDOWN)
+
+RECV_BUFFER_SIZE = 1024 * 1024  # [bytes] max. size of a pickled message
+
 MIN_BACKUP_INTERVAL = 600  # [s] min. sec between backups to persistent storage
 
+SUBMASTER_FLUSH = 2.0  # [s] max. delay of logs and results at a sub-master
+# [s] first and longest sleep between the tests of a wait with timeout
+WAIT_POLL_MIN = 0.001
+WAIT_POLL_MAX = 0.05
+SUBMASTER_REUSE = 4    # IO-tickets passed on within a group, before returned
+
+IDLE_POLL = 5.0  # [s] members of a multi-core group check for their release
+
 NLC = '\n'
 
+ABORTED = 'ABORTED'  # DONE of a worker, that was aborted
+
 # TODO: scale parallel_io with jobsize
-MD5, MTIME, SIZE = (1, 2, 3)
+MD5, MTIME, SIZE, INODE = (1, 2, 3, 4)
 
 if DEBUG:
     RAISE_EXCEPTIONS = True
@@ -118,15 +153,64 @@ def log_speed(elapsed, fsize, name):
         return
     logger.info(msg)
 
+class IOTicket(object):
+    """Context manager for an IO-ticket.
+    Requests a ticket from the master, waits for it, and returns it
+    with the number of bytes moved and the seconds used.
+    """
+    def __init__(self, comm, root):
+        self.comm = comm
+        self.root = root
+        self.nbytes = 0
+        self.start = None
+        self.elapsed = None
+
+    def __enter__(self):
+        self.comm.send('', self.root, tag=mpi.Tags.IO_REQUEST)
+        self.comm.recv(source=self.root, tag=mpi.Tags.IO_TICKET)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        # RETURN TICKET, ALSO IN CASE OF E.G. IO-ERROR
+        self.elapsed = time.time() - self.start
+        self.comm.send([self.nbytes, self.elapsed], self.root,
+                       tag=mpi.Tags.IO_FINISHED)
+
+
+class Aborted(Exception):
+    """ The master has aborted the simpack, a copy has finished first """
+    pass
+
+
 class Worker(object):
     """ MPI - Worker
         This is a MPI-worker. (rank>0).
     """
 
-    def __init__(self, tempdir, a, h, force_remap):
+    def __init__(self, tempdir, a, h, force_remap, cores=1, members=(),
+                 cpus=None, ticket=None, verify=False, compress=None,
+                 cache_mb=nodecache.DEFAULT_MB,
+                 log_compression=compression.DEFAULT_POLICY,
+                 compress_threads=1):
         """
         @param tempdir: path to store temporary files
         @type tempdir: str
+        @param cores: cores per simpack, >1 runs the parallel Qdyn6p
+        @param members: idle ranks of the group, released by _goodbye
+        @param cpus: cpus of the group, see packing.command
+        @param ticket: returns a new IO-ticket, default: IOTicket
+        @param verify: check the logs of finished steps again, instead of
+                       trusting the progress manifest of the simpack
+        @param compress: compression of the members, that are appended
+                         to simpacks, see archive.parse_compression
+        @param cache_mb: size of the node-local cache of inputs [MB],
+                         0 disables it, see nodecache.py
+        @param log_compression: gzip levels of logs and energies, that
+                                are compressed in the background, see
+                                compression.parse
+        @param compress_threads: threads, that compress large logs and
+                                 energies in blocks
         @return: None
         """
 
@@ -136,23 +220,71 @@ class Worker(object):
         self.hij = h
         self.force_remap = force_remap
         self.root = 0
+        self.parent = mpi.parent  # grants IO-tickets
+        if ticket is None:
+            ticket = lambda: IOTicket(self.comm, self.parent)
+        self.ticket = ticket
         self.nanos = -1.0
         self.steps = -1
+        self.cores = cores
+        self.members = list(members)
+        self.cpus = cpus
+        self.verify = verify
         self._executable()
+        self.tempdir = tempdir
         self._tempdir(tempdir, mpi.rank)
+        self.tiers = scratch.tiers()
+        self.cache = None
+        if cache_mb > 0:
+            self.cache = nodecache.NodeCache(
+                os.environ.get('CADEE_CACHE') or
+                os.path.join(os.path.dirname(os.path.normpath(tempdir)),
+                             'cache'), cache_mb)
+        self.archiver = archive.Archiver(
+            self.ticket,
+            self.tmp.rstrip('/') + '_archive',
+            threaded=mpi.thread_multiple,
+            done=lambda path, ticket: log_speed(
+                ticket.elapsed, ticket.nbytes / 1024 / 1024., path),
+            compression=archive.parse_compression(compress))
+        # its callbacks log, and a warning is sent to the master at once
+        self.compressor = compression.Compressor(
+            compression.parse(log_compression), compress_threads,
+            background=mpi.thread_multiple)
+        self.deferred = False  # files were not stored, see _store
+        self.prefetcher = staging.Prefetcher(
+            self.ticket,
+            self.tmp.rstrip('/') + '_stage',
+            threaded=mpi.thread_multiple,
+            plan=self._plan,
+            cache=self.cache)
         self._md = None
         self.archive = None
         self.saved_files = {}
+        self._extracted = {}
         self.lastbackup = time.time()
         self.alive = True
+        self._heartbeat = self._new_heartbeat()
+        self.sampler = resources.Sampler()
+        self.failure = None  # of the simpack, see failures.py
 
     def _executable(self):
         """ Create executable and mark it executable """
         from cadee.executables import exe
-        exe = exe.which('Qdyn6')
-        if exe is None:
-            raise 'Qdyn6 not found'
-        self.exe = exe
+        if self.cores > 1:
+            name = 'Qdyn6p'
+            path = os.environ.get('CADEE_QDYN_PARALLEL') or exe.which(name)
+        else:
+            name = 'Qdyn6'
+            path = os.environ.get('CADEE_QDYN') or exe.which(name)
+        if path is None:
+            raise Exception(name + ' not found')
+        self.exe = path
+        self.command = path
+        self.env = None
+        if self.cores > 1:
+            self.command = packing.command(path, self.cores, self.cpus)
+            self.env = packing.launch_env()
 
     def _next(self):
         """Receive next unit of work from Master (rank0).
@@ -165,34 +297,80 @@ class Worker(object):
         except AttributeError:
             intar = 'START'
 
+        # the master marks intar as done: the backups must be complete
+        self.compressor.flush()
+        self.archiver.flush()
+        if self.compressor.files:
+            logger.info('Compressed %s files in the background, %.1f s of '
+                        'compute stall removed.', self.compressor.files,
+                        self.compressor.saved())
+
         logger.debug('Worker send data')
-        self.comm.send(intar, self.root, tag=mpi.Tags.DONE)
+        tools.flush_logs()
+        self.comm.send([intar, self._scratch_report(), self.sampler.take(),
+                        self.failure], self.root, tag=mpi.Tags.DONE)
+        self.failure = None
         logger.debug('Worker wait data')
         data = self.comm.recv(source=self.root, tag=mpi.Tags.INPUTS)
         logger.debug('Worker recd data')
 
         if data == 'SHUTDOWN':
             logger.debug('Worker %s received shutdown signal!', mpi.rank)
+            self.prefetcher.discard()
             logger.debug('Create last backup ...')
             try:
-                self._store()
+                self._store(wait=True)
             except ValueError:
                 logger.exception(
                     'Could not store before exiting %s', self.archive)
             logger.debug('Message rank0 that this rank stopped.')
-            self.comm.send('GoodBye!', self.root, tag=mpi.Tags.SHUTDOWN)
+            self._goodbye()
             self.alive = False
             sys.exit(0)
         else:
             logger.debug('Worker reinitializing.')
-            intar, outtar = data
-            self.reinit(intar, outtar)
+            intar, outtar = data[:2]
+            # data[3] is the scratch tier, see scratch.py
+            self.reinit(intar, outtar, data[3] if len(data) > 3 else None)
+            # data[2] is the simpack that follows, if the master knows it
+            if len(data) > 2:
+                self.prefetcher.prefetch(data[2])
             return True
 
-    def _tar2md(self, tarchive, map_settings):
+    def _plan(self, simpack):
+        """ Members of simpack, that are extracted, see extraction.py
+        @param simpack: archive.SimpackArchive
+        @return: list of names, or None for all
+        """
+        if self.verify:
+            # the logs of all steps are checked again
+            return None
+        return extraction.plan(simpack, self.alpha is not None,
+                               self.force_remap)
+
+    def _extract(self, simpack, names):
+        """ Extract members of simpack to cwd, the ones in the node-local
+        cache are linked (see nodecache.py).
+        @param names: list of names, or None for all
+        @return: the IO-ticket, or None if all members were cached
+        """
+        if self.cache is not None:
+            names = self.cache.link(simpack, names)
+            if not names:
+                return None
+        with self.ticket() as ticket:
+            # only the latest version of every file is extracted
+            ticket.nbytes = simpack.extract(names)
+        if self.cache is not None:
+            self.cache.add(simpack, names)
+        return ticket
+
+    def _tar2md(self, tarchive, map_settings, complete=False):
         """
         @param tarchive: the archive that will be extracted.
         @type tarchive: str
+        @param complete: extract every member, not only the ones needed
+                         to continue (the results go to another archive)
         @return mdobj
         ::note::
         WARNING: The md-object has to be re-initialized.
@@ -202,39 +380,58 @@ class Worker(object):
         # UNIT: make sure there is only 1 executable in this folder
         logger.debug(str(os.listdir(os.getcwd())))
 
-        # REQUEST AND WAIT FOR IO-TICKET
-        self.comm.send('', self.root, tag=mpi.Tags.IO_REQUEST)
-        self.comm.recv(source=self.root, tag=mpi.Tags.IO_TICKET)
-        start = time.time()
-        try:
-            tarfile.open(tarchive).extractall()  # TODO: UNSAVE IF TARCHIVE $@!
-            fsize = os.path.getsize(tarchive) / 1024 / 1024.  # TODO:Do in scan
-        # RETURN TICKET. DO NOT FORGET 'FINALLY' IS FOR E.G. CASE OF IO-ERROR
-        finally:
-            self.comm.send('', dest=self.root, tag=mpi.Tags.IO_FINISHED)
-
-        elapsed = time.time() - start
-
-        log_speed(elapsed, fsize, self.archive)
+        simpack = archive.SimpackArchive(tarchive)
+        if not complete and self.prefetcher.take(tarchive, os.getcwd()):
+            logger.info('Using prefetched %s.', tarchive)
+        else:
+            names = None
+            if not complete:
+                names = self._plan(simpack)
+            ticket = self._extract(simpack, names)
+            if ticket is not None:
+                log_speed(ticket.elapsed, ticket.nbytes / 1024 / 1024.,
+                          self.archive)
+
+        # files, as they are in the archive; digests are from the index
+        self._extracted = {}
+        for fname in simpack.names():
+            if os.path.isfile(fname):
+                stat = os.stat(fname)
+                md5 = simpack.digest(fname)
+                self._extracted[fname] = [stat.st_mtime, md5,
+                                          stat.st_size, stat.st_ino]
+        archived = dict((fname, simpack.members[fname]['size'])
+                        for fname in simpack.names()
+                        if fname not in self._extracted)
+        if archived:
+            logger.info('Left %s members (%6.2f MB) in %s.', len(archived),
+                        sum(archived.values()) / 1024. / 1024., tarchive)
 
         # TODO: scan for pdbfile(s) and or description
         topology, fepfile, inputfiles, self.steps, self.nanos = scan.Scan().scan()  # NOPEP8
         pdbfile = None
         description = None
 
-        mdobj = trajectory.MolDynSim(self.tmp, self.exe, topology, inputfiles,
-                                     fepfile, None, None, description, pdbfile,
-                                     map_settings)
+        mdobj = trajectory.MolDynSim(self.tmp, self.command, topology,
+                                     inputfiles, fepfile, None, None,
+                                     description, pdbfile, map_settings)
+        mdobj.set_executable(self.command, self.env)
+        mdobj.set_monitor(self._monitor)
+        mdobj.set_compressor(self.compressor)
+        mdobj.set_verify(self.verify)
+        mdobj.set_archived(archived)
         return mdobj
 
-    def reinit(self, inputarchive, outputarchive):
+    def reinit(self, inputarchive, outputarchive, tier=None):
         """
         @param tempdir: a path to store temporary files
         @param inputarchive: tarchive with input files
         @param outputarchive: tarchive where results are written to
+        @param tier: scratch folder to work in, default: the current one
         """
 
         logger.info('Working on %s.', inputarchive)
+        self.inputarchive = inputarchive
 
         try:
             shutil.rmtree(self.tmp)
@@ -242,10 +439,20 @@ class Worker(object):
         except AttributeError:
             pass
 
+        if tier:
+            self.tmp = scratch.workdir(tier, self.tempdir, self.rank)
+            # snapshots are hardlinks, on the filesystem of the files
+            self.archiver.stage = self.tmp.rstrip('/') + '_archive'
+            if not os.path.exists(self.archiver.stage):
+                os.makedirs(self.archiver.stage)
+            logger.debug('Scratch tier: %s', tier)
         os.makedirs(self.tmp)
         os.chdir(self.tmp)
         self._executable()
 
+        # members left in the archive are only kept, if it is appended to
+        complete = outputarchive not in (None, inputarchive)
+
         if self.alpha is not None:
             import analysis
             fname = os.path.basename(inputarchive)
@@ -263,9 +470,9 @@ class Worker(object):
                     mutant, replik, self.alpha,
                     self.hij, self.force_remap)
 
-            self._md = self._tar2md(inputarchive, mset)
+            self._md = self._tar2md(inputarchive, mset, complete)
         else:
-            self._md = self._tar2md(inputarchive, None)
+            self._md = self._tar2md(inputarchive, None, complete)
 
         if outputarchive is None:
             logger.warning("NO OUTPUTARCHIVE. Appending data to inputarchive.")
@@ -276,122 +483,211 @@ class Worker(object):
         self.saved_files = {}
 
         # initizalize self.saved_files, so we do not add files to archive 2x
+        # the extracted files are known, no need to hash them
         if inputarchive == outputarchive:
-            for obj in self._check_files_to_store():
-                fname, mtim, md5, size = obj
-                self.saved_files[MTIME][fname] = mtim
-                self.saved_files[SIZE][fname] = size
-                self.saved_files[MD5][fname] = md5
+            for fname, (mtim, md5, size, inode) in self._extracted.items():
+                self._saved(fname, mtim, md5, size, inode)
 
         self.lastbackup = time.time()
+        self._heartbeat = self._new_heartbeat()
 
         logger.debug('Initialized on %s, in %s',
                      hostname(), os.getcwd())
 
 
 
+    def _check_abort(self):
+        """ Raise Aborted, if the master has aborted the current simpack.
+        Aborts of simpacks this worker has already finished are ignored. """
+        while self.comm.iprobe(source=self.root, tag=mpi.Tags.ABORT):
+            simpack = self.comm.recv(source=self.root, tag=mpi.Tags.ABORT)
+            if simpack == self.inputarchive:
+                raise Aborted(simpack)
+
+    @staticmethod
+    def _new_heartbeat():
+        """ State of the heartbeats of a simpack, see _monitor """
+        now = time.time()
+        return {'start': now,    # of the simpack
+                'last': now,     # last heartbeat
+                'sampled': 0,    # MD steps done at the last heartbeat
+                'unit': None,    # the running WorkUnit
+                'done': 0,       # MD steps of the WorkUnits before
+                'steps': 0,      # MD steps of the running WorkUnit
+                'stepsize': 0.}  # [fs] of the running WorkUnit
+
+    def _monitor(self, workunit):
+        """ Called while Qdyn runs: checks for aborts, and sends heartbeats.
+
+        A heartbeat is [simpack, MD steps done, steps/s since the start of
+        the simpack, sample, scratch report, resource samples], the sample
+        is [steps/s since the last heartbeat, stepsize, wall-clock seconds
+        per step of Qdyn or None], the report is the one of scratch.report,
+        the resource samples are the ones of resources.Sampler.
+        """
+        self._check_abort()
+        if self.sampler.due():
+            self.sampler.sample(workunit.pid, self.tmp, self.inputarchive)
+        beat = self._heartbeat
+        if workunit is not beat['unit']:
+            if beat['unit'] is not None:
+                beat['done'] += beat['steps']
+            with open(workunit.inputfile[0]) as fil:
+                beat['steps'], beat['stepsize'] = scan.Scan.get_simtime(
+                    fil.readlines())
+            beat['unit'] = workunit
+        now = time.time()
+        if now - beat['last'] < speculation.HEARTBEAT_INTERVAL:
+            return
+        step, seconds = workunit.progress()
+        done = beat['done'] + step
+        rate = (done - beat['sampled']) / (now - beat['last'])
+        if rate <= 0 and seconds:
+            rate = 1. / seconds
+        beat['last'], beat['sampled'] = now, done
+        self.comm.send([self.inputarchive, done,
+                        done / max(1., now - beat['start']),
+                        [rate, beat['stepsize'], seconds],
+                        self._scratch_report(), self.sampler.take()],
+                       self.root, tag=mpi.Tags.HEARTBEAT)
+
+    def _scratch_report(self):
+        """ Free space of the scratch tiers, see scratch.py """
+        return scratch.report(self.tiers, [self.tmp])
+
+    def _saved(self, fname, mtim, md5, size, inode):
+        """ Remember that fname is saved in self.archive """
+        for key in (MTIME, MD5, SIZE, INODE):
+            if key not in self.saved_files:
+                self.saved_files[key] = {}
+        self.saved_files[MTIME][fname] = mtim
+        self.saved_files[MD5][fname] = md5
+        self.saved_files[SIZE][fname] = size
+        self.saved_files[INODE][fname] = inode
+
     def _check_files_to_store(self):
         """
         Walks cwd and checks if files were changed and/or added.
-        Return list of files to save with fn, modtime, md5hash, size
-        Return: [ [path,mtim,md5,size], [path2,mtim2,md5_2,size2] ... ]
+        Return list of files to save with fn, modtime, md5hash, size, inode
+        Return: [ [path,mtim,md5,size,inode], [path2,...] ... ]
+
+        ::note::
+        Files with unchanged size, mtime and inode are not read.
+        Files with a new size are changed and are not read either.
+        Only if the size is the same, but mtime or inode changed, the
+        file is hashed (in chunks) and compared with the saved digest.
+        md5 is None, if the file was not hashed.
         """
 
-        if MTIME not in self.saved_files:
-            self.saved_files[MTIME] = {}
-        if MD5 not in self.saved_files:
-            self.saved_files[MD5] = {}
-        if SIZE not in self.saved_files:
-            self.saved_files[SIZE] = {}
+        for key in (MTIME, MD5, SIZE, INODE):
+            if key not in self.saved_files:
+                self.saved_files[key] = {}
 
         to_store = []
+        self.deferred = False
 
         for fname in os.listdir('.'):
-            mtim = os.path.getmtime(fname)
-            size = os.path.getsize(fname)
-
             # never backup executable
             if fname == self.exe or fname == os.path.basename(self.exe):
                 continue
 
-            # check if fn was seen before and if size or mtime changed:
-            if (fname in self.saved_files[MTIME] and
-                    fname in self.saved_files[MD5] and
-                    fname in self.saved_files[SIZE] and
-                    self.saved_files[MTIME][fname] == mtim and
-                    self.saved_files[SIZE][fname] == size):
+            # stored, when it is compressed
+            if self.compressor.is_pending(fname):
+                self.deferred = True
                 continue
 
-            # hashing (since expensive, only if mtime, size or hash chgd)
-            md5 = hashlib.md5(open(fname, 'rb').read()).hexdigest()
-            if (fname in self.saved_files[MD5] and
-                    self.saved_files[MD5][fname] == md5):
-                logger.debug('rehashed %s but hash didnt change!', fname)
+            try:
+                stat = os.stat(fname)
+            except OSError as err:
+                # compressed and removed, since it was listed
+                if err.errno != errno.ENOENT:
+                    raise
                 continue
-            to_store.append([fname, mtim, md5, size])
+            mtim = stat.st_mtime
+            size = stat.st_size
+            inode = stat.st_ino
 
-        # TODO: pickle self.saved_files and add it to to_store
+            if fname not in self.saved_files[SIZE]:
+                to_store.append([fname, mtim, None, size, inode])
+                continue
+
+            # check if size, mtime or inode changed:
+            if self.saved_files[SIZE][fname] != size:
+                to_store.append([fname, mtim, None, size, inode])
+                continue
+            if (self.saved_files[MTIME][fname] == mtim and
+                    self.saved_files[INODE][fname] == inode):
+                continue
+
+            if not os.path.isfile(fname):
+                to_store.append([fname, mtim, None, size, inode])
+                continue
+
+            # ambiguous: same size, but touched. hashing is expensive.
+            md5 = tools.md5sum(fname)
+            if self.saved_files[MD5][fname] == md5:
+                logger.debug('rehashed %s but hash didnt change!', fname)
+                self._saved(fname, mtim, md5, size, inode)
+                continue
+            to_store.append([fname, mtim, md5, size, inode])
 
         # because logfile is used to check if a run was
         # successful, logfiles must be written last, to ensure "save restarts";
         # eg. crash during writing the data out, could cause a corrupt md run!
         #     => move logfiles to end of list
+        # the progress manifest describes the logs, it comes after them
         logs = []
         other = []
+        progress = []
         for fil in to_store:
-            if fil[0][-7:] == ".log.gz":
+            if fil[0] == manifest.MANIFEST_NAME:
+                progress.append(fil)
+            elif fil[0][-7:] == ".log.gz":
                 logs.append(fil)
             else:
                 other.append(fil)
 
         to_store = other
         to_store.extend(logs)
+        to_store.extend(progress)
 
         return to_store
 
-    def _store(self):
+    def _store(self, wait=False):
         """ append new data to self.archive
 
         check if file is in self.saved_files and modification time,
               else append to archive
 
-        WARN: THIS IS NOT THREAD SAVE:
-              ITS NOT POSSIBLE TO COMPUTE & STORE SIMULTANIOUSLY"""
+        The files are snapshot (hardlinked) and appended by self.archiver
+        in the background, while the computation continues. .log.gz files
+        are appended last, snapshots are appended in order. Files, that
+        self.compressor compresses, are stored the next time.
 
-        to_store = self._check_files_to_store()
+        @param wait: wait until the files are compressed, and the
+                     snapshot is appended
+        """
+        if wait:
+            self.compressor.flush()
 
-        if len(to_store) == 0:
-            return
+        # forget files, that could not be appended, they are stored again
+        for fname in self.archiver.pop_failed():
+            for key in self.saved_files:
+                self.saved_files[key].pop(fname, None)
 
-        # To avoid reading harddisk while having IO-Ticket:
-        # http://stackoverflow.com/questions/15857792/how-to-construct-a-tarfile-object-in-memory-from-byte-buffer-in-python-3
-        # REQUEST AND WAIT FOR IO-TICKET
-        self.comm.send('', self.root, tag=mpi.Tags.IO_REQUEST)
-        self.comm.recv(source=self.root, tag=mpi.Tags.IO_TICKET)
-        try:
-            start = time.time()
-            fsize = 0.0
-            tar = tarfile.open(self.archive, 'a')
-            for obj in to_store:
-                fname, mtim, md5, size = obj
-                tar.add(fname)
-                self.saved_files[MTIME][fname] = mtim
-                self.saved_files[SIZE][fname] = size
-                self.saved_files[MD5][fname] = md5
-                fsize += size
-            tar.close()
-        # RETURN TICKET. DO NOT FORGET 'FINALLY' IS FOR E.G. CASE OF IO-ERROR
-        except ValueError:
-            logger.exception(
-                    'Exception while opening %s for appending', self.archive)
-        finally:
-            self.comm.send('', self.root, tag=mpi.Tags.IO_FINISHED)
-        elapsed = time.time() - start
-        fsize = fsize/1024/1024.
+        to_store = self._check_files_to_store()
 
-        self.lastbackup = time.time()
+        if len(to_store) > 0:
+            fnames = [obj[0] for obj in to_store]
+            digests = dict((obj[0], obj[2]) for obj in to_store
+                           if obj[2] is not None)
+            self.archiver.submit(self.archive, fnames, digests)
+            for obj in to_store:
+                self._saved(*obj)
+            self.lastbackup = time.time()
 
-        log_speed(elapsed, fsize, self.archive)
+        if wait:
+            self.archiver.flush()
 
     def _tempdir(self, tempdir, rank):
         """ Create tempdir/{rank} and cd into it
@@ -409,15 +705,31 @@ class Worker(object):
         """ Compute 1 step """
         try:
             self._md.compute()
+        except Aborted:
+            raise
         except Exception as e:
             logger.error('Computation step has failed. Backing files up ...')
             logger.error(traceback.format_exc())
-            self._store()
+            self._store(wait=True)
             raise
 
         if (time.time() - self.lastbackup) > MIN_BACKUP_INTERVAL:
             self._store()
 
+        # do not hold back log messages while the next step runs
+        tools.flush_logs()
+
+    def _goodbye(self):
+        """ Tell the master (and the sub-master) that this rank stops,
+        and release the idle members of the group """
+        tools.flush_logs(final=True)
+        self.comm.send('GoodBye!', self.root, tag=mpi.Tags.SHUTDOWN)
+        if self.parent != self.root:
+            self.comm.send('GoodBye!', self.parent, tag=mpi.Tags.SHUTDOWN)
+        for member in self.members:
+            self.comm.send('GoodBye!', member, tag=mpi.Tags.SHUTDOWN)
+        self.members = []
+
     def _term_handler(self, signum, frame):
         """ Signal Handler
         @param signum
@@ -427,8 +739,8 @@ class Worker(object):
         """
         logger.warning('Signal received. %s %s', signum, frame)
         logger.info('Creating Backup')
-        self._store()
-        self.comm.send('GoodBye!', self.root, tag=mpi.Tags.SHUTDOWN)
+        self._store(wait=True)
+        self._goodbye()
         logger.warning('Backup done. Raise KeyboardInterrupt...')
 
         raise KeyboardInterrupt
@@ -460,36 +772,136 @@ class Worker(object):
 
         logger.debug('working')
         signal.signal(signal.SIGTERM, self._term_handler)
-        while not self._md.is_finished():
-            try:
-                self._compute()
-            except Exception as err:
-                logger.exception('Caught Exception %s, while processing %s',
-                                 err, self.archive)
+        try:
+            while not self._md.is_finished():
+                try:
+                    self._compute()
+                except Aborted:
+                    raise
+                except Exception as err:
+                    logger.exception('Caught Exception %s, while processing %s',
+                                     err, self.archive)
+                    raise
+        except Aborted:
+            # the archive is discarded or replaced by the master
+            logger.info('Aborted %s, a copy has finished first.',
+                        self.inputarchive)
+            self.inputarchive = ABORTED
+        except Exception as err:
+            if RAISE_EXCEPTIONS:
                 raise
-
-        if (time.time() - self.lastbackup) > 10:  # TODO: Solve this more elegant than "if 10s difference --> bkp"
-            self._store()
+            # the master retries or quarantines it, see failures.py
+            self.failure = failures.describe(err)
+        else:
+            # a copy (see speculation.py) writes to an archive of its own,
+            # which must be complete; so must the logs of the last step
+            self.compressor.flush()
+            if ((time.time() - self.lastbackup) > 10 or  # TODO: Solve this more elegant than "if 10s difference --> bkp"
+                    self.archive != self.inputarchive or self.deferred):
+                self._store()
 
         if self._next():
             logger.debug('Run done, recursive loop!')
             self.run()
 
 
-class Master(object):
+class Listener(object):
+    """Receives MPI messages with non-blocking receives.
+    Subclasses set self.comm and self.listen, a list of (tag, source);
+    the order is the order of precedence.
+    """
+
+    def _post_receives(self):
+        """Post one non-blocking receive per (tag, source) in self.listen.
+
+        Each tag gets its own, reusable receive buffer, so a completed
+        request can be re-posted without allocating a new buffer.
+        """
+        self.buffers = [bytearray(RECV_BUFFER_SIZE) for _ in self.listen]
+        self.requests = [self._irecv(i) for i in range(len(self.listen))]
+
+    def _irecv(self, idx):
+        """(Re-)post the receive for self.listen[idx]."""
+        tag, source = self.listen[idx]
+        return self.comm.irecv(self.buffers[idx], source=source, tag=tag)
+
+    def _repost_completed(self):
+        """Re-post receives, that were completed without being processed."""
+        for idx, req in enumerate(self.requests):
+            if not req:
+                self.requests[idx] = self._irecv(idx)
+
+    def _wait(self, timeout=None):
+        """Wait for the next message.
+
+        @param timeout: None to block until a message arrives, else
+                        give up after timeout seconds
+        @return: (tag, source, data) or None on timeout
+        """
+        status = MPI.Status()
+        if timeout is None:
+            idx, data = MPI.Request.waitany(self.requests, status)
+        else:
+            # back off, so that a message arriving soon is not delayed
+            stop = time.time() + timeout
+            poll = WAIT_POLL_MIN
+            while True:
+                idx, flag, data = MPI.Request.testany(self.requests, status)
+                if flag:
+                    break
+                left = stop - time.time()
+                if left <= 0:
+                    return None
+                time.sleep(min(poll, left))
+                poll = min(2 * poll, WAIT_POLL_MAX)
+        if idx == MPI.UNDEFINED:
+            return None
+        self.requests[idx] = self._irecv(idx)
+        return self.listen[idx][0], status.Get_source(), data
+
+
+class Master(Listener):
     """MPI Rank 0:
     Distributes simpacks to Worker Nodes.
     Receives MPI messages with tags defined in mpi.Tags.Class
     """
-    def __init__(self, tempdir, start, simpackdir, force_map=False):
+    def __init__(self, tempdir, start, simpackdir, force_map=False,
+                 io_min=1, io_max=None, prefetch=True, idle=0, submasters=0,
+                 retries=failures.RETRIES, backoff=failures.BACKOFF,
+                 release_quarantine=False):
+        """
+        @param idle: number of idle ranks (members of multi-core groups),
+                     they do not talk to the master
+        @param submasters: number of sub-masters, they compute no simpacks
+        @param retries: of a failed simpack, before it is quarantined
+        @param backoff: [s] before the first retry, see failures.py
+        @param release_quarantine: retry the quarantined simpacks
+        """
         self.comm = mpi.comm
+        self.listen = [(tag, ANY_SOURCE) for tag in LISTEN_TAGS]
         self.tmp = tempdir + str(0) + str("/")
-        self.inputlist = []
-        self.numworkers = mpi.size-1
-        self.io_tickets = [None]*mpi.size
+        self.stopping = False
+        self.numworkers = mpi.size - 1 - idle
+        self.workers = self.numworkers - submasters  # compute simpacks
+        self.io_tickets = [0]*mpi.size  # granted tickets per rank
         self.io_queue = []
+        if io_max is None:
+            io_max = max(io_min, self.numworkers)
+        self.io_limit = iocontrol.AdaptiveIOLimit(PARALLEL_IO, io_min, io_max)
         self.start = start
         self.simpackdir = simpackdir
+        self.running = {}   # rank: [simpack, time of dispatch, MD steps]
+        self.finished = []  # [remaining MD steps, seconds]
+        self.prefetch = prefetch
+        self.prefetched = {}  # rank: [simpack, MD steps], leased ahead
+        self.heartbeats = speculation.Heartbeats()
+        self.metrics = metrics.Metrics(simpackdir)
+        self.io_requested = {}  # rank: [times of pending IO-requests]
+        self.copies = {}  # simpack: speculation.Copy
+        self.placement = scratch.Placement()
+        self.sizes = {}  # simpack: estimated scratch space [bytes]
+        self.bytes_per_step = scratch.DEFAULT_BYTES_PER_STEP
+        self.held = []  # ranks, whose dispatch waits for scratch space
 
         dbname = os.path.join(simpackdir, 'cadee.db')
 
@@ -503,16 +915,102 @@ class Master(object):
 
 
         self.db = tools.SqlDB(
-            os.path.join(simpackdir, 'cadee.db')
+            os.path.join(simpackdir, 'cadee.db'),
+            tables=[resources.TABLE]
+            )
+        self.resources = resources.Resources(
+            lambda row: self.db.insert(resources.TEMPLATE, row))
+
+        self.queue = jobqueue.JobQueue(
+            os.path.join(simpackdir, jobqueue.QUEUE_DB)
             )
+        if force_map:
+            # mapping is done when a simpack is loaded: run all again
+            self.queue.reset()
+        else:
+            self.queue.reset((jobqueue.FAILED,))
+        quarantined = self.queue.count(jobqueue.QUARANTINED)
+        if quarantined and release_quarantine:
+            self.queue.release_quarantined()
+            logger.info('Released %s simpacks from quarantine.', quarantined)
+        elif quarantined:
+            logger.warning('%s simpacks are quarantined, see '
+                           '--release_quarantine.', quarantined)
+        self.failures = failures.Failures(self.queue, retries, backoff)
 
         # TODO make sure output file does not exist!
         if not os.path.exists(self.tmp):
             os.makedirs(self.tmp)
 
+    def _drain(self):
+        """Process messages that are already delivered, eg. RESULTS that
+        were sent right before a worker's SHUTDOWN message."""
+        while True:
+            msg = self._wait(timeout=0)
+            if msg is None:
+                return
+            self._process_mpi(*msg)
+
+    def enqueue(self, inputs):
+        """ Add simpacks to the queue.
+        Done simpacks are not scanned again. Simpacks, that are queued
+        already, get the cost, that remains of them (eg. after a restart).
+        @param inputs: list of simpacks
+        """
+        done = set(self.queue.simpacks(jobqueue.DONE))
+        new = []
+        for inp in inputs:
+            if inp not in self.queue:
+                new.append(inp)
+            elif inp not in done:
+                self._update_cost(inp)
+        costs = estimate_costs(new)
+        for inp in reversed(priorize(new, costs)):
+            self.queue.add(inp, costs[inp])
+        logger.info('Queued %s new simpacks. Pending: %s, done: %s.',
+                    len(new), self.queue.count(jobqueue.PENDING),
+                    self.queue.count(jobqueue.DONE))
+
+    def _update_cost(self, simpack):
+        """ Set the cost of simpack to the steps, that remain of it """
+        self.queue.set_cost(simpack, estimate_costs([simpack])[simpack])
+
+    def _release(self, simpack):
+        """ Put simpack back to pending, with the cost, that remains """
+        self._update_cost(simpack)
+        self.queue.release(simpack)
+
+    def _log_makespan(self):
+        """ Log estimated makespan """
+        costs = self.queue.costs(jobqueue.PENDING)
+        steps = estimate_makespan(costs, self.workers)
+        msg = 'Estimated makespan: %s MD steps (longest simpack: %s steps)'
+        logger.info(msg, steps, max(costs or [0]))
+
+    def _log_achieved_makespan(self):
+        """ Log achieved makespan and the estimate, calibrated with the
+        measured seconds per MD step """
+        achieved = time.time() - self.start
+        steps = sum([job[0] for job in self.finished])
+        secs = sum([job[1] for job in self.finished])
+        if steps > 0:
+            estimate = estimate_makespan([job[0] for job in self.finished],
+                                         self.workers) * secs / steps
+            logger.info('Achieved makespan: %s s, estimated: %s s.',
+                        round(achieved, 1), round(estimate, 1))
+        else:
+            logger.info('Achieved makespan: %s s.', round(achieved, 1))
+
     def _shutdown(self):
         logger.info('Preparing to end this Simulation! Syncing...')
+        self._drain()
+        for simpack, _ in self.prefetched.values():
+            self.queue.release(simpack)
+        self._log_achieved_makespan()
+        self._write_metrics()
+        self.resources.flush(force=True)
         self.db.close()
+        self.queue.close()
         logger.info('Database connection closed.')
         logger.info('Removing Temporary Files...')
         import shutil
@@ -528,47 +1026,60 @@ class Master(object):
         logger.warning('Signal received. %s %s', signum, frame)
         logger.warning('Press CTRL+C to KILL')
 
-        if len(self.inputlist) > 0:
-            logger.warning('Following Simpacks have been removed unfinished from the Queue: %s, Items: %s',
-                           len(self.inputlist), str(self.inputlist))
-            self.inputlist = []
+        self.stopping = True
+        logger.warning('Stop handing out simpacks. Left on the queue: %s',
+                       self.queue.count(jobqueue.PENDING))
 
         logger.warning('Waiting up to 170s for Workers to shutdown...')
 
         stop = time.time() + 170
         while time.time() < stop:
-            self._iter()
+            self._iter(timeout=stop - time.time())
         logger.warning('... Timeout!')
         if mpi.mpi:
             logger.warning('MPI_ABORT')
             MPI.MPI_Abort(self.comm, int(signum))
         self._shutdown()
 
-    def _iter(self):
-        sleeped = 0  # measure time w/o messaging
-        # Waiting for any input
-        while not self.comm.Iprobe(source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG):
-            if sleeped == 0.5:
-                secs_since_start = round(time.time() - self.start, 1)
-                logger.info('Sleeping @ %s s.', secs_since_start)
-            # TODO: stats!
-            #       observe ram usage
-            #       observe free disk space
-            #       observe ...
-            #       make sure executed every 60? seconds
-            if self.numworkers == 0:
-                self._shutdown()
-            # TODO: think about better use of sleeped
-            sleeped += self._manage_io()
-
-        if sleeped > 0.5:
-            logger.info("Slept for %s seconds.", sleeped - 0.5)
-
-        # TODO: catch mpi.send errors properly
+    def _iter(self, timeout=None):
+        """Block until a message arrives, process it and manage IO.
+
+        The master waits on the posted receives, until a message arrives
+        or timeout (see _timeout) has passed, and renews its leases.
+        """
+        idle = time.time()
         try:
-            self._process_mpi()
-        except IndexError as e:
-            logger.info('IndexError happend: %s', e)
+            msg = self._wait(timeout)
+        except cPickle.UnpicklingError as err:
+            logger.critical('ERROR! Unpickling Error: %s', err)
+            self._repost_completed()
+            return
+        idle = time.time() - idle
+
+        if idle > 0.5:
+            logger.info("Slept for %s seconds.", round(idle, 1))
+
+        if msg is not None:
+            tag, source, data = msg
+            # TODO: catch mpi.send errors properly
+            try:
+                self._process_mpi(tag, source, data)
+            except IndexError as e:
+                logger.info('IndexError happend: %s', e)
+
+        self._manage_io()
+        if self.held and (msg is None or msg[0] in (
+                mpi.Tags.DONE, mpi.Tags.SHUTDOWN, mpi.Tags.HEARTBEAT)):
+            self._release_held()
+        self.queue.renew_if_due()
+        if self.metrics.due():
+            self._write_metrics()
+        # stats: ram, swap, load and free scratch of every node, sampled
+        # by the workers, written once per minute (see resources.py)
+        self.resources.flush()
+
+        if self.numworkers == 0:
+            self._shutdown()
 
     def run(self):
         """
@@ -582,30 +1093,37 @@ class Master(object):
         # signal handler, waiting for nodes to stop
         signal.signal(signal.SIGTERM, self._term_handler)
 
+        self._log_makespan()
+        self._post_receives()
         while True:
-            self._iter()
+            self._iter(self._timeout())
 
-    def _process_mpi(self):
-        """Process MPI Package"""
-        mpistatus = MPI.Status()
-        try:
-            data = self.comm.recv(source=MPI.ANY_SOURCE,
-                                  tag=MPI.ANY_TAG, status=mpistatus)
-        except cPickle.UnpicklingError as err:
-            logger.critical('ERROR! Unpickling Error: %s tag: %s, source: %s',
-                            err, mpistatus.Get_tag(), mpistatus.Get_source())
-            return
-
-        tag = mpistatus.Get_tag()
+    def _process_mpi(self, tag, source, data):
+        """Process MPI Package
+        @param tag: tag of the message
+        @param source: rank that has sent the message
+        @param data: the unpickled message
+        """
         if tag == mpi.Tags.LOG:
-            # print('data:', data)
+            # a list of messages, buffered by the worker
             logger.handlers[0].emit(data)
         elif tag == mpi.Tags.SHUTDOWN:
             self.numworkers -= 1
+            self.heartbeats.forget(source)
+            self.metrics.forget(source)
+            self.placement.forget(source)
+            if source in self.running:
+                simpack, dispatched, cost = self.running.pop(source)
+                if simpack in self.copies:
+                    self._copy_stopped(source, simpack, False, 0, 0)
+                else:
+                    self._release(simpack)
+            if source in self.prefetched:
+                self.queue.release(self.prefetched.pop(source)[0])
             logger.info(
                 'Worker %s was removed from worker-list: '
                 'There are %s (out of %s) left...', 
-                mpistatus.Get_source(),
+                source,
                 self.numworkers,
                 mpi.size-1)
 
@@ -614,71 +1132,436 @@ class Master(object):
 
         elif tag == mpi.Tags.DONE:
             logger.debug('recv mpi.Tags.DONE from %s',
-                         mpistatus.Get_source())
-            if data == 'START':
-                pass
-            else:
-                # self.done.append(data)
-                pass
+                         source)
+            # [simpack, scratch report, resource samples, failure]
+            data, report, samples, failure = data
+            self.heartbeats.forget(source)
+            self.metrics.forget(source)
+            self.placement.update(source, report)
+            self.resources.add(source, report.get('host'), samples)
+            if source in self.running:
+                simpack, dispatched, cost = self.running.pop(source)
+                finished = data == simpack and failure is None
+                if simpack in self.copies:
+                    self._copy_stopped(source, simpack, finished, cost,
+                                       dispatched, failure)
+                elif finished:
+                    self.queue.done(simpack)
+                    self.finished.append([cost, time.time() - dispatched])
+                else:
+                    self._failed(source, simpack, failure)
+            self.placement.finished(source)
 
-            if len(self.inputlist) == 0:
-                logger.info('Sending shutdown message to %s', mpistatus.Get_source())
-                self.comm.send('SHUTDOWN', mpistatus.Get_source(),
-                               tag=mpi.Tags.INPUTS)
-            else:
-                data = self.inputlist.pop()
-                self.comm.send(data, mpistatus.Get_source(),
-                               mpi.Tags.INPUTS)
+            self._dispatch(source)
 
-            logger.info('Number of simpacks left on queue %s.', len(self.inputlist))
-            if len(self.inputlist) < 10:
-                logger.debug('jobs left (list) %s', self.inputlist)
+            pending = self.queue.count(jobqueue.PENDING)
+            logger.info('Number of simpacks left on queue %s.', pending)
+            if pending < 10:
+                logger.debug('jobs left (list) %s', self.queue.simpacks())
         elif tag == mpi.Tags.IO_REQUEST:
-            self.io_queue.append(mpistatus.Get_source())
-            logger.debug('%s into io-queue (%s)', mpistatus.Get_source(),
+            self.io_queue.append(source)
+            self.io_requested.setdefault(source, []).append(time.time())
+            logger.debug('%s into io-queue (%s)', source,
                          len(self.io_queue))
         elif tag == mpi.Tags.IO_FINISHED:
-            self.io_tickets[mpistatus.Get_source()] = None
-            ctr = self.io_tickets.count(mpi.Tags.IO_TICKET)
+            self.io_tickets[source] = max(0, self.io_tickets[source] - 1)
+            nbytes, elapsed = data
+            self.io_limit.record(nbytes, elapsed)
+            ctr = sum(self.io_tickets)
             logger.debug('%s release ticket. concurrency: %s',
-                         mpistatus.Get_source(), ctr)
+                         source, ctr)
+        elif tag == mpi.Tags.HEARTBEAT:
+            simpack, done, rate, sample, report, samples = data
+            self.placement.update(source, report)
+            self.resources.add(source, report.get('host'), samples)
+            if source in self.running and self.running[source][0] == simpack:
+                self.metrics.sample(source, simpack, *sample)
+                if self.heartbeats.beat(source, done, rate):
+                    logger.warning(
+                        'Worker %s is a straggler: %.2f steps/s on %s, '
+                        'median: %s steps/s.', source, rate, simpack,
+                        self.heartbeats.median())
+        elif tag == mpi.Tags.BATCH:
+            # logs and results, collected by a sub-master
+            for batched_tag, batched_source, batched_data in data:
+                self._process_mpi(batched_tag, batched_source, batched_data)
         else:
             logger.critical('got data w/ unknown tag from %s',
-                            mpistatus.Get_source())
+                            source)
             if DEBUG:
                 raise (Exception, 'unknown tag')
 
+    def _dispatch(self, rank, retry=False):
+        """ Send the next simpack, a copy of a straggler's simpack, or
+        SHUTDOWN to rank. A simpack is placed on a scratch tier of the
+        node of rank; if none fits, the dispatch is held back. So it is,
+        if the node is blacklisted, or if only simpacks are left, that
+        wait for a retry (see failures.py).
+
+        @param retry: rank has been held back before
+        """
+        host = self.placement.host(rank)
+        if (not self.stopping and host is not None and
+                self.failures.is_blacklisted(host)):
+            if rank in self.prefetched:
+                self.queue.release(self.prefetched.pop(rank)[0])
+            if self.queue.count(jobqueue.PENDING) == 0:
+                logger.info('Sending shutdown message to %s', rank)
+                self.comm.send('SHUTDOWN', rank, tag=mpi.Tags.INPUTS)
+                return
+            self.held.append(rank)
+            if not retry:
+                logger.info('Hold back %s: %s is blacklisted.', rank, host)
+            return
+
+        job = self._next_job(rank)
+        copy = None
+        if job is None:
+            copy = self._speculate(rank)
+
+        if copy is not None:
+            cost = self.running[copy.original][2]
+            tier = self.placement.place(rank, self._size(copy.simpack),
+                                        hold=False)
+            self.running[rank] = [copy.simpack, time.time(), cost]
+            self.heartbeats.start(rank)
+            self.comm.send([copy.simpack, copy.path, None, tier], rank,
+                           mpi.Tags.INPUTS)
+        elif job is None and not self.stopping and self.queue.next_retry():
+            self.held.append(rank)
+            if not retry:
+                logger.info('Hold back %s: simpacks wait for a retry.', rank)
+        elif job is None:
+            logger.info('Sending shutdown message to %s', rank)
+            self.comm.send('SHUTDOWN', rank,
+                           tag=mpi.Tags.INPUTS)
+        else:
+            simpack, cost = job
+            tier = self.placement.place(rank, self._size(simpack))
+            if tier is None:
+                # it stays the next simpack of rank
+                self.prefetched[rank] = job
+                self.held.append(rank)
+                if not retry:
+                    logger.info('Hold back %s (%.1f MB) for %s: scratch '
+                                'of %s is full.', simpack,
+                                self._size(simpack) / 1024. / 1024., rank,
+                                self.placement.host(rank))
+                return
+            self.sizes.pop(simpack, None)
+            self.running[rank] = [simpack, time.time(), cost]
+            self.heartbeats.start(rank)
+            logger.debug('Dispatch %s (%s steps) to %s', simpack,
+                         cost, rank)
+            following = None
+            if self.prefetch and not self.stopping:
+                self.prefetched[rank] = self.queue.lease()
+                if self.prefetched[rank] is None:
+                    del self.prefetched[rank]
+                else:
+                    following = self.prefetched[rank][0]
+            # TODO: remove simpack, simpack
+            self.comm.send([simpack, simpack, following, tier], rank,
+                           mpi.Tags.INPUTS)
+
+    def _timeout(self):
+        """ Seconds until a held back rank may get work, or the leases
+        are due to be renewed: without messages (eg. few, long simpacks),
+        they would expire, and another allocation would run the simpacks
+        again """
+        timeout = self.queue.renew_in()
+        if self.held:
+            event = self.failures.next_event()
+            if event is not None:
+                timeout = min(timeout, max(0., event - time.time()))
+        return timeout
+
+    def _failed(self, rank, simpack, failure):
+        """ Record the failure of simpack on rank, see failures.py """
+        if failure is None:
+            # the worker restarted, eg. after an error outside of Qdyn
+            failure = failures.describe()
+            failure['host'] = self.placement.host(rank)
+        # a retry resumes from the steps, that were stored
+        self._update_cost(simpack)
+        self.failures.record(simpack, failure, self.placement.hosts())
+
+    def _release_held(self):
+        """ Dispatch to the held back ranks again, eg. when a simpack on
+        their node has finished """
+        held, self.held = self.held, []
+        for rank in held:
+            self._dispatch(rank, retry=True)
+
+    def _size(self, simpack):
+        """ Estimated scratch space of simpack [bytes], see scratch.py """
+        if simpack not in self.sizes:
+            try:
+                self.sizes[simpack], measured = scratch.estimate(
+                    simpack, self.bytes_per_step)
+            except (tarfile.TarError, IOError, OSError, ValueError) as err:
+                logger.warning('Could not estimate the size of %s: %s',
+                               simpack, err)
+                self.sizes[simpack], measured = 0, self.bytes_per_step
+            # simpacks without finished steps are like the ones before
+            self.bytes_per_step = measured
+        return self.sizes[simpack]
+
+    def _write_metrics(self):
+        """ Rewrite the metrics files, see metrics.py """
+        busy = len(self.running)
+        self.metrics.write({
+            'busy': busy,
+            'idle': max(0, self.numworkers - busy),
+            'io_queue': len(self.io_queue),
+            'io_tickets': sum(self.io_tickets),
+            'io_limit': self.io_limit.limit,
+            'pending': self.queue.count(jobqueue.PENDING),
+            'done': self.queue.count(jobqueue.DONE),
+            'failed': self.queue.count(jobqueue.FAILED),
+            'quarantined': self.queue.count(jobqueue.QUARANTINED),
+            'blacklisted': len([host for host in self.placement.hosts()
+                                if self.failures.is_blacklisted(host)]),
+            'nodes': self.resources.latest})
+
+    def _speculate(self, rank):
+        """ Start a copy of the simpack of the straggler, that will take
+        the longest, on the idle rank.
+
+        @return: speculation.Copy or None
+        """
+        if self.stopping:
+            return None
+        now = time.time()
+        candidates = []
+        for other, (simpack, _, cost) in self.running.items():
+            if (simpack in self.copies or
+                    not self.heartbeats.is_straggler(other, now)):
+                continue
+            candidates.append([self.heartbeats.remaining(other, cost),
+                               other, simpack])
+        if not candidates:
+            return None
+        _, original, simpack = max(candidates)
+        copy = speculation.Copy(simpack, original, rank)
+        archive.remove(copy.path)  # left over from an earlier run
+        self.copies[simpack] = copy
+        logger.info('Straggler %s: copy of %s on %s, to %s.',
+                    original, simpack, rank, copy.path)
+        return copy
+
+    def _copy_stopped(self, rank, simpack, finished, cost, dispatched,
+                      failure=None):
+        """ One of the ranks of a speculative copy has stopped.
+        The first to finish wins, the other is aborted. When both have
+        stopped, the archive of the winner is kept.
+
+        @param failure: of rank, see failures.py
+        """
+        copy = self.copies[simpack]
+        if copy.report(rank, finished):
+            logger.info('%s: %s finished first, abort %s.', simpack,
+                        rank, copy.other(rank))
+            self.comm.send(simpack, copy.other(rank), tag=mpi.Tags.ABORT)
+        if finished and copy.winner == rank:
+            self.finished.append([cost, time.time() - dispatched])
+        if not copy.resolved():
+            return
+        del self.copies[simpack]
+        if copy.winner == copy.copy:
+            logger.info('The copy of %s has won.', simpack)
+            archive.replace(copy.path, simpack)
+        else:
+            archive.remove(copy.path)
+        if copy.winner is None:
+            logger.warning('Neither copy has finished %s', simpack)
+            self._failed(rank, simpack, failure)
+        else:
+            self.queue.done(simpack)
+
+    def _next_job(self, rank):
+        """ Return next (simpack, cost) for rank, or None if there is none.
+
+        The simpack prefetched by rank comes first, then a new lease.
+        If the queue is empty, the largest simpack prefetched by another
+        rank is taken away from it; that rank discards its staged copy.
+        """
+        if self.stopping:
+            if rank in self.prefetched:
+                self.queue.release(self.prefetched.pop(rank)[0])
+            return None
+        job = self.prefetched.pop(rank, None)
+        if job is None:
+            job = self.queue.lease()
+        if job is None and len(self.prefetched) > 0:
+            other = max(self.prefetched, key=lambda r: self.prefetched[r][1])
+            job = self.prefetched.pop(other)
+            logger.info('Reassign %s, prefetched by %s, to %s.',
+                        job[0], other, rank)
+        return job
+
     def _manage_io(self):
         """
         Manage I/O - queue.
 
-        @return:   0 if I/O managed
-                   0.1 if slept
+        @return: number of IO-tickets granted
 
         This method is organizing together with self.io_tickets the
         input/output of the slave nodes.
 
         ::notes::
-        If no I/O required or no tickets available, sleep 0.1s
+        Called after every message, so tickets are granted as soon as
+        a request arrives or a ticket is returned.
         """
-        used_tickets = self.io_tickets.count(mpi.Tags.IO_TICKET)
-        if used_tickets < PARALLEL_IO and len(self.io_queue) > 0:
+        granted = 0
+        limit = self.io_limit.limit
+        used_tickets = sum(self.io_tickets)
+        while used_tickets < limit and len(self.io_queue) > 0:
             worker_rank = self.io_queue.pop(0)
-            self.io_tickets[worker_rank] = mpi.Tags.IO_TICKET
-            if used_tickets > (PARALLEL_IO - 2):
+            self.metrics.io_wait(
+                time.time() - self.io_requested[worker_rank].pop(0))
+            self.io_tickets[worker_rank] += 1
+            if used_tickets > (limit - 2):
                 logger.debug("%s recv ticket. concurrencty: %s",
                              worker_rank, used_tickets+1)
             self.comm.send('', worker_rank, mpi.Tags.IO_TICKET)
+            used_tickets += 1
+            granted += 1
+        if len(self.io_queue) > 0:
+            # the number of tickets is the bottleneck
+            self.io_limit.mark_saturated()
+        return granted
+
+
+class SubMaster(Listener):
+    """MPI Rank of a group of workers (see hierarchy.py):
+    Grants IO-tickets to its workers from the tickets it gets from the
+    master, and forwards logs and results to the master in batches.
+    Simpacks are assigned by the master.
+    """
+    def __init__(self, workers):
+        """
+        @param workers: ranks of the workers of this sub-master
+        @type workers: list
+        """
+        self.comm = mpi.comm
+        self.root = mpi.root
+        self.listen = [(mpi.Tags.IO_FINISHED, ANY_SOURCE),
+                       (mpi.Tags.IO_TICKET, self.root),
+                       (mpi.Tags.IO_REQUEST, ANY_SOURCE),
+                       (mpi.Tags.RESULTS, ANY_SOURCE),
+                       (mpi.Tags.LOG, ANY_SOURCE),
+                       (mpi.Tags.SHUTDOWN, ANY_SOURCE)]
+        self.numworkers = len(workers)
+        self.io_queue = []     # workers waiting for a ticket
+        self.requested = 0     # tickets requested from the master
+        self.reused = 0        # tickets passed on, without returning them
+        self.io_record = [0, 0.]  # bytes and seconds, not yet reported
+        self.batch = []
+        self.batch_bytes = 0
+        self.last_flush = time.time()
+
+    def _flush(self):
+        """ Forward collected logs and results to the master """
+        tools.flush_logs()
+        if len(self.batch) > 0:
+            self.comm.send(self.batch, self.root, tag=mpi.Tags.BATCH)
+            self.batch = []
+            self.batch_bytes = 0
+        self.last_flush = time.time()
+
+    def _return_ticket(self):
+        """ Give a ticket back to the master """
+        self.comm.send(self.io_record, self.root, tag=mpi.Tags.IO_FINISHED)
+        self.io_record = [0, 0.]
+        self.reused = 0
+
+    def _grant(self):
+        """ Pass a ticket to the next waiting worker """
+        self.comm.send('', self.io_queue.pop(0), tag=mpi.Tags.IO_TICKET)
+
+    def _process_mpi(self, tag, source, data):
+        """Process MPI Package
+        @param tag: tag of the message
+        @param source: rank that has sent the message
+        @param data: the unpickled message
+        """
+        if tag in (mpi.Tags.LOG, mpi.Tags.RESULTS):
+            self.batch.append([tag, source, data])
+            self.batch_bytes += len(cPickle.dumps(data, -1))
+            if self.batch_bytes > RECV_BUFFER_SIZE / 4:
+                self._flush()
+        elif tag == mpi.Tags.IO_REQUEST:
+            self.io_queue.append(source)
+            # one request to the master per waiting worker
+            while self.requested < len(self.io_queue):
+                self.comm.send('', self.root, tag=mpi.Tags.IO_REQUEST)
+                self.requested += 1
+        elif tag == mpi.Tags.IO_TICKET:
+            self.requested -= 1
+            if len(self.io_queue) > 0:
+                self._grant()
+            else:
+                self._return_ticket()
+        elif tag == mpi.Tags.IO_FINISHED:
+            nbytes, elapsed = data
+            self.io_record[0] += nbytes
+            self.io_record[1] += elapsed
+            # keep the ticket in the group, but not forever
+            if len(self.io_queue) > 0 and self.reused < SUBMASTER_REUSE:
+                self.reused += 1
+                self._grant()
+            else:
+                self._return_ticket()
+        elif tag == mpi.Tags.SHUTDOWN:
+            self.numworkers -= 1
         else:
-            time.sleep(0.1)
-            return 0.1
-        return 0
+            logger.critical('got data w/ unknown tag from %s', source)
 
+    def run(self):
+        """ Serve the workers, until all of them stopped. """
+        # on SIGTERM, keep serving the workers until they stopped
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        self._post_receives()
+        while self.numworkers > 0:
+            # block, unless collected logs and results are due
+            timeout = None
+            if len(self.batch) > 0:
+                timeout = max(0., self.last_flush + SUBMASTER_FLUSH -
+                              time.time())
+            try:
+                msg = self._wait(timeout)
+            except cPickle.UnpicklingError as err:
+                logger.critical('ERROR! Unpickling Error: %s', err)
+                self._repost_completed()
+                continue
+            if msg is not None:
+                self._process_mpi(*msg)
+            if time.time() - self.last_flush >= SUBMASTER_FLUSH:
+                self._flush()
+        tools.flush_logs(final=True)
+        self._flush()
+        logger.info('Sub-master %s: all workers stopped.', mpi.rank)
+        self.comm.send('GoodBye!', self.root, tag=mpi.Tags.SHUTDOWN)
 
-def main(inputs, alpha=None, hij=None, force_map=None, simpackdir=None):
-    """ Ensemble Start, Divides Work on Ranks """
+
+def idle_member(leader):
+    """ Hold the core of a multi-core group, until the leader stops.
+    Polls with sleep, a blocking receive may busy-wait. """
+    logger.debug('Rank %s is idle, member of the group of %s.',
+                 mpi.rank, leader)
+    request = mpi.comm.irecv(bytearray(1024), source=leader,
+                             tag=mpi.Tags.SHUTDOWN)
+    while not request.test()[0]:
+        time.sleep(IDLE_POLL)
+
+
+def scratch_dir():
+    """ Return the temporary directory of this process:
+    $CADEE_TMP (the first of its tiers, see scratch.py), /scratch, /tmp
+    or /dev/shm; with cadee/{pid} """
     try:
-        tmp = os.environ["CADEE_TMP"]
+        tmp = os.environ["CADEE_TMP"].split(os.pathsep)[0]
         if tmp == '':
             raise KeyError
     except KeyError:
@@ -687,18 +1570,77 @@ def main(inputs, alpha=None, hij=None, force_map=None, simpackdir=None):
                 break
 
     tempdir = os.path.join(tmp, 'cadee')
-    tempdir = os.path.join(tempdir, str(os.getpid()))
+    return os.path.join(tempdir, str(os.getpid()))
+
+
+def main(inputs, alpha=None, hij=None, force_map=None, simpackdir=None,
+         io_min=1, io_max=None, prefetch=True, group_size=0, cores=1,
+         verify=False, compress=None, cache_mb=nodecache.DEFAULT_MB,
+         log_compression=compression.DEFAULT_POLICY, compress_threads=1,
+         retries=failures.RETRIES, retry_backoff=failures.BACKOFF,
+         release_quarantine=False):
+    """ Ensemble Start, Divides Work on Ranks """
+    tempdir = scratch_dir()
 
     logger.debug("Working directory of rank %s: %s", mpi.rank, tempdir)
 
+    submasters = {}
+    if group_size or cores != 1:
+        # collective: all ranks must take part
+        hosts = mpi.comm.allgather(hostname())
+    if group_size:
+        submasters = hierarchy.groups(hosts, group_size, mpi.root)
+        mpi.parent = hierarchy.parents(hosts, group_size, mpi.root)[mpi.rank]
+        if mpi.rank == mpi.root:
+            logger.info('%s sub-masters, for groups of %s.',
+                        len(submasters), group_size)
+
+    # multi-core simpacks: {leader: [idle members]}
+    leaders = {}
+    idle = {}
+    cpus = None
+    if cores != 1:
+        excluded = [mpi.root] + list(submasters)
+        if cores == packing.AUTO:
+            if mpi.rank == mpi.root:
+                per_host = {}
+                for rank, host in enumerate(hosts):
+                    if rank not in excluded:
+                        per_host[host] = per_host.get(host, 0) + 1
+                cores = packing.auto_cores(inputs,
+                                           max(per_host.values() or [1]))
+            cores = mpi.comm.bcast(cores, root=mpi.root)
+        allowed = mpi.comm.allgather(packing.allowed_cpus())
+        leaders = packing.pack(hosts, cores, excluded)
+        for leader, members in leaders.items():
+            for member in members:
+                idle[member] = leader
+        if mpi.rank in leaders and all(allowed[rank] is not None for rank
+                                       in [mpi.rank] + leaders[mpi.rank]):
+            cpus = set()
+            for rank in [mpi.rank] + leaders[mpi.rank]:
+                cpus.update(allowed[rank])
+        if mpi.rank == mpi.root:
+            logger.info('%s cores per simpack: %s groups of %s ranks.',
+                        cores, len(leaders),
+                        sorted(set(len(members) + 1
+                                   for members in leaders.values())))
+        for submaster in submasters:
+            submasters[submaster] = [worker for worker
+                                     in submasters[submaster]
+                                     if worker not in idle]
+
     if mpi.rank == 0:
         start = time.time()
         if simpackdir is None:
             raise Exception('Simpackdir is not defined on rank0.')
-        io_rank = Master(tempdir, start, simpackdir, force_map=force_map)
-        for each in inputs:
-            # TODO: remove each, each
-            io_rank.inputlist.append([each, each])
+        io_rank = Master(tempdir, start, simpackdir, force_map=force_map,
+                         io_min=io_min, io_max=io_max, prefetch=prefetch,
+                         idle=len(idle), submasters=len(submasters),
+                         retries=retries,
+                         backoff=retry_backoff,
+                         release_quarantine=release_quarantine)
+        io_rank.enqueue(inputs)
         try:
             io_rank.run()
         except Exception as err:
@@ -708,10 +1650,19 @@ def main(inputs, alpha=None, hij=None, force_map=None, simpackdir=None):
             mpi.comm.Abort(1)
             raise
         logger.info("TOTALTIME: %s s", round(time.time() - start, 1))
+    elif mpi.rank in submasters:
+        SubMaster(submasters[mpi.rank]).run()
+    elif mpi.rank in idle:
+        idle_member(idle[mpi.rank])
     else:
         while True:
             try:
-                Worker(tempdir, alpha, hij, force_map).run()
+                Worker(tempdir, alpha, hij, force_map,
+                       cores=len(leaders.get(mpi.rank, [])) + 1,
+                       members=leaders.get(mpi.rank, []), cpus=cpus,
+                       verify=verify, compress=compress,
+                       cache_mb=cache_mb, log_compression=log_compression,
+                       compress_threads=compress_threads).run()
                 break
             except KeyboardInterrupt:
                 break
@@ -724,7 +1675,47 @@ def main(inputs, alpha=None, hij=None, force_map=None, simpackdir=None):
         logger.warning("COMPUTATION LOOP ENDED: %s", mpi.rank)
 
 
-def priorize(inputs):
+def estimate_costs(inputs):
+    """ Estimate the remaining cost of each simpack in MD steps.
+
+    @param inputs: list of simpacks
+    @return: dict {simpack: remaining steps}
+    """
+    costs = {}
+    for inp in inputs:
+        try:
+            total, finished = scan.tar_progress(inp)
+        except (tarfile.TarError, IOError) as err:
+            logger.warning('Could not estimate cost of %s: %s', inp, err)
+            total, finished = 0, 0
+        costs[inp] = total - finished
+        logger.debug('Cost of %s: %s steps (%s finished)',
+                     inp, costs[inp], finished)
+    return costs
+
+
+def estimate_makespan(costs, workers):
+    """ Estimate the makespan (in MD steps) of longest-job-first scheduling
+
+    @param costs: list of costs (eg. remaining steps)
+    @param workers: number of workers
+    @return: makespan in the unit of costs
+    """
+    if workers < 1:
+        return sum(costs)
+    loads = [0] * workers
+    for cost in sorted(costs, reverse=True):
+        heapq.heapreplace(loads, loads[0] + cost)
+    return max(loads)
+
+
+def priorize(inputs, costs=None):
+    """ Order inputs, the last item is handed out first.
+
+    @param inputs: list of simpacks
+    @param costs: optional dict {simpack: remaining steps}, if set,
+                  the simpacks with the most remaining steps go first
+    """
     prio0 = []
     prio1 = []
     prio2 = []
@@ -747,16 +1738,18 @@ def priorize(inputs):
     inputs.extend(prio2)
     inputs.extend(prio3)
     inputs.extend(prio9)
+    if costs is not None:
+        # longest remaining last, ties are handed out in order _0, _1 ...
+        inputs.reverse()
+        inputs.sort(key=lambda inp: costs.get(inp, 0))
     logger.info('Prioritized.')
     #for each in inputs:
     #    print(each)
     return inputs
 
 
-def parse_args():
-    # TODO: load defaults from somewhere
-    parser = argparse.ArgumentParser('CADEE: simpack computation.')
-
+def add_arguments(parser):
+    """ Add the arguments of MPI and local runs to parser """
     # Minimum input files needed
     parser.add_argument('simpackdir', action='store',
                         help='Path to folder with simpacks.')
@@ -770,8 +1763,75 @@ def parse_args():
     parser.add_argument('--force_map', action='store_true', default=False,
                         help='forced remapping')
 
-    args = parser.parse_args()
-
+    # IO
+    parser.add_argument('--io_max', action='store', type=int, default=None,
+                        help='Max. number of concurrent IO-tickets '
+                             '(default: number of workers).')
+
+    parser.add_argument('--cores_per_simpack', action='store', default=1,
+                        type=packing.parse_cores,
+                        help='Cores per simpack, >1 runs the parallel '
+                             'Qdyn6p on a group of ranks of the same node, '
+                             'or "auto" to derive it from the number of '
+                             'atoms (default: 1).')
+
+    parser.add_argument('--no_prefetch', action='store_true', default=False,
+                        help='Do not stage the next simpack of a worker '
+                             'while it computes the current one.')
+
+    parser.add_argument('--verify', action='store_true', default=False,
+                        help='Check the logs and outputs of finished steps '
+                             'again, instead of trusting the progress '
+                             'manifest of the simpacks.')
+
+    parser.add_argument('--compress', nargs='?', default=None,
+                        const=archive.DEFAULT_COMPRESSION,
+                        metavar='EXT=CODEC:LEVEL,...',
+                        help='Compress the outputs appended to the '
+                             'simpacks, per file type, with gz, bz2 or xz '
+                             '(default without value: %(const)s).')
+
+    parser.add_argument('--cache_mb', action='store', type=int,
+                        default=nodecache.DEFAULT_MB,
+                        help='Size of the node-local cache of the inputs, '
+                             'that replicas share, in MB; 0 disables it '
+                             '(default: %(default)s).')
+
+    parser.add_argument('--log_compression', action='store',
+                        default=compression.DEFAULT_POLICY,
+                        metavar='EXT=gz:LEVEL,...',
+                        help='gzip levels of the logs and energies, that '
+                             'are compressed in the background, while the '
+                             'next step runs (default: %(default)s).')
+
+    parser.add_argument('--compress_threads', action='store', type=int,
+                        default=1,
+                        help='Threads, that compress large logs and '
+                             'energies in blocks (default: %(default)s).')
+
+    parser.add_argument('--retries', action='store', type=int,
+                        default=failures.RETRIES,
+                        help='Retries of a failed simpack, before it is '
+                             'quarantined (default: %(default)s).')
+
+    parser.add_argument('--retry_backoff', action='store', type=float,
+                        default=failures.BACKOFF,
+                        help='Seconds before the first retry of a failed '
+                             'simpack, doubled for every further one '
+                             '(default: %(default)s).')
+
+    parser.add_argument('--release_quarantine', action='store_true',
+                        default=False,
+                        help='Retry the simpacks, that were quarantined '
+                             'by previous runs.')
+
+
+def check_args(args):
+    """ Validate the arguments of add_arguments
+
+    @return: simpackdir (absolute), alpha, hij
+    @raises argparse.ArgumentTypeError
+    """
     simpackdir = args.simpackdir
     simpackdir = os.path.abspath(simpackdir)
 
@@ -790,6 +1850,27 @@ def parse_args():
         raise argparse.ArgumentTypeError(
                 '--force_map alone is invalid, you must also set --hij and --alpha')
 
+    try:
+        archive.parse_compression(args.compress)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(
+                'invalid --compress: {0}'.format(err))
+
+    try:
+        compression.parse(args.log_compression)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(
+                'invalid --log_compression: {0}'.format(err))
+
+    if args.compress_threads < 1:
+        raise argparse.ArgumentTypeError('--compress_threads must be >= 1')
+
+    if args.retries < 0:
+        raise argparse.ArgumentTypeError('--retries must be >= 0')
+
+    if args.retry_backoff < 0:
+        raise argparse.ArgumentTypeError('--retry_backoff must be >= 0')
+
     alpha = None
     hij = None
 
@@ -799,6 +1880,43 @@ def parse_args():
     if args.alpha:
         alpha = check_int_or_float(args.alpha)
 
+    return simpackdir, alpha, hij
+
+
+def find_simpacks(simpackdir):
+    """ Return the simpacks (absolute paths) in simpackdir """
+    inputs = []
+    if os.path.isdir(simpackdir):
+        # we got a folder to scan & we are rank0!
+        wd = os.getcwd()
+        os.chdir(simpackdir)
+        for fil in os.listdir(simpackdir):
+            if fil[-4:] == '.tar':
+                inputs.append(os.path.abspath(fil))
+                logger.info('Add input file %s.', fil)
+        os.chdir(wd)
+    return inputs
+
+
+def parse_args():
+    # TODO: load defaults from somewhere
+    parser = argparse.ArgumentParser('CADEE: simpack computation.')
+
+    add_arguments(parser)
+
+    parser.add_argument('--io_min', action='store', type=int, default=1,
+                        help='Min. number of concurrent IO-tickets.')
+
+    parser.add_argument('--group_size', action='store', default=0,
+                        type=hierarchy.parse_group_size,
+                        help='Ranks per group with a sub-master, that '
+                             'forwards IO, logs and results, or "node" '
+                             'for one group per node (default: 0, off).')
+
+    args = parser.parse_args()
+
+    simpackdir, alpha, hij = check_args(args)
+
     if not mpi.mpi:
         raise Exception('MPI not available')
 
@@ -812,22 +1930,23 @@ def parse_args():
             'Force mapping: %s.',
             simpackdir, alpha, hij, args.force_map)
 
-        inputs = []
-        if os.path.isdir(simpackdir):
-            # we got a folder to scan & we are rank0!
-            wd = os.getcwd()
-            os.chdir(simpackdir)
-            for fil in os.listdir(simpackdir):
-                if fil[-4:] == '.tar':
-                    inputs.append(os.path.abspath(fil))
-                    logger.info('Add input file %s.', fil)
-            os.chdir(wd)
-
-            inputs = priorize(inputs)
-
-        main(inputs, alpha, hij, args.force_map, simpackdir=simpackdir)
+        inputs = find_simpacks(simpackdir)
+
+        main(inputs, alpha, hij, args.force_map, simpackdir=simpackdir,
+             io_min=args.io_min, io_max=args.io_max,
+             prefetch=not args.no_prefetch, group_size=args.group_size,
+             cores=args.cores_per_simpack, verify=args.verify,
+             compress=args.compress, cache_mb=args.cache_mb,
+             log_compression=args.log_compression,
+             compress_threads=args.compress_threads, retries=args.retries,
+             retry_backoff=args.retry_backoff,
+             release_quarantine=args.release_quarantine)
     else:
-        main(None, alpha, hij, args.force_map)
+        main(None, alpha, hij, args.force_map, group_size=args.group_size,
+             cores=args.cores_per_simpack, verify=args.verify,
+             compress=args.compress, cache_mb=args.cache_mb,
+             log_compression=args.log_compression,
+             compress_threads=args.compress_threads)
 
 if __name__ == "__main__":
     parse_args()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+"""
+Selective extraction of simpacks.
+
+A simpack, that is resumed late in a long run, holds the trajectories,
+energies and logs of every step, that has been computed. Only a fraction
+of that is needed to continue. plan() chooses the members of a simpack
+(see archive.py), that are extracted:
+
+ - everything, that is not an output of a Qdyn input: the inputs, the
+   topology, the fep file, the .qana files of the mapping, the progress
+   manifest (see manifest.py), ...
+ - of steps, that the manifest records as finished, and whose outputs
+   are in the archive with the recorded sizes: only restart files, that
+   other steps restart from (or use as restraint)
+ - of all other steps: the log and the restart file; the log is checked
+   and the step is computed again, if it has failed
+ - with mapping: the logs and energies of the .qana files, that are not
+   mapped yet
+
+Trajectories are never extracted. The members, that are left in the
+archive, are still in the simpack when it is written back; the manifest
+is told about them, so the finished steps are trusted without their
+outputs in the working directory.
+
+Author: {0} ({1})
+
+This module is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import os
+
+import manifest
+import scan
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+logger = tools.getLogger('dyn.extraction')
+
+
+def _latest(simpack, fname):
+    """ Return the name of fname or fname.gz in simpack, or None """
+    for name in (fname, fname + '.gz'):
+        if name in simpack:
+            return name
+    return None
+
+
+def qdyn_files(simpack):
+    """ Return {input: dict of its files} of the Qdyn inputs in simpack.
+
+    The keys of the dicts are final, restart, restraint, energy,
+    trajectory and log, values are None, if an input has no such file.
+    """
+    files = {}
+    for name in simpack.names():
+        if not scan.is_qdyn_input(name):
+            continue
+        lines = scan.Scan.clean_lines(simpack.extractfile(name).splitlines())
+        (final, restart, _, restraint, _, energy,
+         trajectory) = scan.Scan.get_all_io_file_names(lines)
+        files[name] = {'final': final, 'restart': restart,
+                       'restraint': restraint, 'energy': energy,
+                       'trajectory': trajectory,
+                       'log': os.path.splitext(name)[0] + '.log'}
+    return files
+
+
+def trusted(simpack):
+    """ Return the inputs, that the manifest in simpack records as
+    finished, and whose outputs are in simpack with the recorded sizes """
+    if manifest.MANIFEST_NAME not in simpack:
+        return set()
+    try:
+        units = manifest.parse(simpack.extractfile(manifest.MANIFEST_NAME))
+    except (ValueError, KeyError, TypeError, AttributeError) as err:
+        logger.warning('Ignoring progress manifest of %s: %s',
+                       simpack.path, err)
+        return set()
+    inputs = set()
+    for inp, unit in units.items():
+        if not manifest.clean(unit):
+            continue
+        for fname, (size, _) in unit['outputs'].items():
+            if fname not in simpack or simpack.members[fname]['size'] != size:
+                break
+        else:
+            inputs.add(inp)
+    return inputs
+
+
+def _mapping(simpack, force_remap):
+    """ Return the logs and energies, that mapping still needs """
+    needed = set()
+    for name in simpack.names():
+        if not name.endswith('.qana'):
+            continue
+        if name + '.mapped' in simpack and not force_remap:
+            continue
+        for stem in simpack.extractfile(name).split():
+            for fname in (stem + '.log', stem + '.en'):
+                member = _latest(simpack, fname)
+                if member is not None:
+                    needed.add(member)
+    return needed
+
+
+def plan(simpack, mapping=False, force_remap=False):
+    """ Return the names of the members of simpack, that are needed to
+    continue it; None, if the inputs can not be read (extract all).
+
+    @param simpack: archive.SimpackArchive
+    @param mapping: the simpack is mapped, see analysis.py
+    @param force_remap: every .qana file is mapped again
+    """
+    try:
+        files = qdyn_files(simpack)
+    except Exception as err:
+        logger.warning('Can not plan the extraction of %s: %s',
+                       simpack.path, err)
+        return None
+    finished = trusted(simpack)
+
+    outputs = set()
+    needed = set()
+    for inp, fnames in files.items():
+        for key in ('final', 'energy', 'trajectory', 'log', 'restraint'):
+            if fnames[key] is not None:
+                outputs.update((fnames[key], fnames[key] + '.gz'))
+        if inp in finished:
+            continue
+        # the log decides, whether the step is computed again
+        for key in ('log', 'final', 'restart', 'restraint'):
+            if fnames[key] is not None:
+                needed.add(_latest(simpack, fnames[key]))
+        # restraint files are copies of restart files, see WorkUnit
+        if fnames['restraint'] is not None:
+            needed.add(_latest(simpack, fnames['restraint'][:-5]))
+    for inp in finished:
+        # _parse_inputfile copies restraints of finished steps, too
+        restraint = files.get(inp, {}).get('restraint')
+        if restraint is not None:
+            needed.add(_latest(simpack, restraint))
+            needed.add(_latest(simpack, restraint[:-5]))
+    if mapping:
+        needed.update(_mapping(simpack, force_remap))
+
+    names = [name for name in simpack.names()
+             if name not in outputs or name in needed]
+    return sorted(names)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+"""
+Failures of simpacks: retry budget, quarantine and node blacklist.
+
+A worker, whose simpack fails, reports the failure to the master with
+its DONE message:
+
+    {'code': 10, 'exitcode': 1, 'host': 'node12',
+     'step': '1100_eq.inp', 'error': '...'}
+
+code is the bitmask of trajectory.ERR_* (0, if Qdyn did not fail, eg. an
+IOError of the worker). The master records every failure in the queue
+(see jobqueue.py) and classifies it:
+
+    SIMULATION: NaN or SHAKE, the simulation itself blows up
+    NODE:       everything else, eg. Qdyn was killed, its log is missing,
+                or the worker failed; this may be the node
+
+A simpack is retried after BACKOFF seconds, doubled with every further
+failure. After `retries` retries, the next failure moves the simpack
+into quarantine: it is not leased again (also not by later runs), until
+it is released with --release_quarantine.
+
+If NODE failures of NODE_FAILURES different simpacks happen on a host
+within NODE_WINDOW seconds, the host is blacklisted for BLACKLIST
+seconds (doubled, every time it is blacklisted again): the master does
+not dispatch to its ranks. These failures do not count against the
+retry budget of the simpacks. A host is not blacklisted, if no other
+host is left.
+
+Author: {0} ({1})
+
+This module is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+from platform import node as hostname
+import time
+
+import tools
+import trajectory
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+logger = tools.getLogger('dyn.failures')
+
+RETRIES = 2          # retries of a simpack, before it is quarantined
+BACKOFF = 60         # [s] before the first retry
+NODE_FAILURES = 3    # failures of different simpacks on a host ...
+NODE_WINDOW = 900    # [s] ... within this, blacklist the host
+BLACKLIST = 1800     # [s] of the first blacklisting of a host
+
+SIMULATION = 'simulation'
+NODE = 'node'
+
+RETRY = 'retry'
+QUARANTINE = 'quarantine'
+
+
+def describe(err=None, step=None):
+    """ Return the failure of err, raised by a worker, see module doc
+
+    @param err: the exception, None if unknown (eg. the worker restarted)
+    @param step: input file of the failed step, if err does not know it
+    """
+    return {'code': getattr(err, 'status', 0),
+            'exitcode': getattr(err, 'exitcode', None),
+            'host': hostname(),
+            'step': getattr(err, 'inputfile', step),
+            'error': 'worker restarted' if err is None else repr(err)}
+
+
+def classify(code):
+    """ SIMULATION or NODE, see module doc """
+    if code & (trajectory.ERR_NAN | trajectory.ERR_SHAKE):
+        return SIMULATION
+    return NODE
+
+
+class Failures(object):
+    """ Retry budget of the simpacks, and blacklist of the hosts """
+
+    def __init__(self, queue, retries=RETRIES, backoff=BACKOFF,
+                 node_failures=NODE_FAILURES, node_window=NODE_WINDOW,
+                 blacklist=BLACKLIST):
+        """
+        @param queue: jobqueue.JobQueue, stores the failures
+        @param retries: of a simpack, before it is quarantined
+        @param backoff: [s] before the first retry, doubled for every
+                        further one
+        @param node_failures: failures of different simpacks on a host
+                              within node_window [s] blacklist it for
+                              blacklist [s]
+        """
+        self.queue = queue
+        self.retries = retries
+        self.backoff = backoff
+        self.node_failures = node_failures
+        self.node_window = node_window
+        self.blacklist = blacklist
+        self.blacklisted = {}  # host: end of the blacklisting
+        self.times = {}        # host: times blacklisted
+
+    def record(self, simpack, failure, others=(), now=None):
+        """ Record a failure of simpack, and put it back to pending or into
+        quarantine. simpack must be leased.
+
+        @param failure: see module doc
+        @param others: the other hosts of the run
+        @return: RETRY or QUARANTINE
+        """
+        if now is None:
+            now = time.time()
+        host = failure.get('host')
+        kind = classify(failure.get('code') or 0)
+        rowid = self.queue.add_failure(
+            simpack, host, failure.get('code') or 0, failure.get('exitcode'),
+            kind, '{0}: {1}'.format(failure.get('step'),
+                                    failure.get('error')), now)
+        logger.warning('%s failed on %s in %s: code %s, exit code %s (%s).',
+                       simpack, host, failure.get('step'),
+                       failure.get('code'), failure.get('exitcode'), kind)
+        if kind == NODE and host is not None:
+            self._check_node(host, others, now)
+        count = self.queue.failures(simpack)
+        if count > self.retries:
+            self.queue.quarantine(simpack)
+            logger.error('Quarantined %s after %s failures.', simpack, count)
+            return QUARANTINE
+        self.queue.release(simpack)
+        if count == 0:
+            logger.info('Retry %s now, the node failed.', simpack)
+            return RETRY
+        delay = self.backoff * 2 ** (count - 1)
+        self.queue.retry_at(rowid, now + delay)
+        logger.info('Retry %s of %s for %s in %s s.', count, self.retries,
+                    simpack, delay)
+        return RETRY
+
+    def _check_node(self, host, others, now):
+        """ Blacklist host, if its failures are correlated """
+        since = now - self.node_window
+        failed = self.queue.failed_simpacks(host, since, NODE)
+        if len(failed) < self.node_failures:
+            return
+        if not [other for other in others
+                if other != host and not self.is_blacklisted(other, now)]:
+            logger.warning('%s failed %s simpacks, but no other host is '
+                           'left.', host, len(failed))
+            return
+        self.times[host] = self.times.get(host, 0) + 1
+        seconds = self.blacklist * 2 ** (self.times[host] - 1)
+        self.blacklisted[host] = now + seconds
+        # the node failed them, not the simpacks
+        self.queue.uncount(host, since, NODE)
+        logger.error('Blacklisted %s for %s s: %s simpacks failed on it '
+                     'within %s s.', host, seconds, len(failed),
+                     self.node_window)
+
+    def is_blacklisted(self, host, now=None):
+        """ True, if the master should not dispatch to host """
+        if host not in self.blacklisted:
+            return False
+        if (time.time() if now is None else now) < self.blacklisted[host]:
+            return True
+        logger.info('%s is not blacklisted anymore.', host)
+        del self.blacklisted[host]
+        return False
+
+    def next_event(self, now=None):
+        """ Return the time of the next retry or the end of a blacklisting,
+        or None """
+        if now is None:
+            now = time.time()
+        events = [end for end in self.blacklisted.values() if end > now]
+        retry = self.queue.next_retry(now)
+        if retry is not None:
+            events.append(retry)
+        return min(events) if events else None
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""
+Groups of ranks with a sub-master, for very large ensembles.
+
+By default, every worker sends all its messages (IO-requests, logs and
+results) to rank 0. With thousands of ranks, rank 0 becomes the
+bottleneck. Optionally, the worker ranks are split into groups (of N
+ranks, or one group per node). The lowest rank of a group is the
+sub-master of the group: it grants IO-tickets from the global IO budget,
+and collects logs and results of its workers and forwards them in
+batches. Simpacks are still assigned by rank 0.
+
+Author: {0} ({1})
+
+This module is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+NODE = 'node'  # one group per node
+
+
+def parse_group_size(value):
+    """ Return group size: 0 (no groups), an int > 1, or NODE """
+    if value is None:
+        return 0
+    if str(value).lower() == NODE:
+        return NODE
+    size = int(value)
+    if size < 0 or size == 1:
+        raise ValueError('group size must be 0, >1 or node', value)
+    return size
+
+
+def groups(hosts, group_size, root=0):
+    """ Split ranks into groups.
+
+    @param hosts: hostname of every rank, index is the rank
+    @param group_size: 0 (no groups), number of ranks per group, or NODE
+    @param root: rank of the master, is not part of any group
+    @return: dict {sub-master: [workers]}, groups with less than 2 ranks
+             are omitted; their ranks are workers of the master
+    """
+    ranks = [rank for rank in range(len(hosts)) if rank != root]
+    if group_size == 0 or group_size is None:
+        return {}
+    members = []
+    if group_size == NODE:
+        by_host = {}
+        for rank in ranks:
+            by_host.setdefault(hosts[rank], []).append(rank)
+        members = by_host.values()
+    else:
+        for start in range(0, len(ranks), group_size):
+            members.append(ranks[start:start + group_size])
+    result = {}
+    for group in members:
+        if len(group) > 1:
+            result[group[0]] = group[1:]
+    return result
+
+
+def parents(hosts, group_size, root=0):
+    """ Return the parent of every rank, index is the rank.
+
+    The parent of a worker is its sub-master, or root.
+    The parent of sub-masters and root is root.
+    """
+    result = [root] * len(hosts)
+    for submaster, workers in groups(hosts, group_size, root).items():
+        for worker in workers:
+            result[worker] = submaster
+    return result
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""
+Adaptive number of concurrent IO-tickets.
+
+The master hands out IO-tickets to workers that extract or append simpacks.
+Too many tickets at the same time thrash a slow shared filesystem, too few
+hold workers back on a fast one. AdaptiveIOLimit measures the aggregate
+throughput of the returned tickets and adjusts the number of tickets with
+an additive-increase/multiplicative-decrease (AIMD) rule.
+
+Author: {0} ({1})
+
+This module is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import time
+
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+logger = tools.getLogger('dyn.io')
+
+WINDOW_TICKETS = 8      # min. number of returned tickets per window
+WINDOW_SECONDS = 30.    # [s] min. duration of a window
+INCREASE = 1            # tickets added, if more tickets paid off
+DECREASE = 0.75         # factor applied, if more tickets did not pay off
+GAIN = 0.01             # min. relative gain in throughput, that pays off
+DROP = 0.8              # throughput below DROP*last, with same limit, is a drop
+MEMORY = 20             # [windows] throughput measurements are kept
+
+
+class AdaptiveIOLimit(object):
+    """ AIMD controller for the number of concurrent IO-tickets """
+
+    def __init__(self, start, minimum=1, maximum=256,
+                 window_tickets=WINDOW_TICKETS, window_seconds=WINDOW_SECONDS,
+                 increase=INCREASE, decrease=DECREASE, gain=GAIN,
+                 drop=DROP, memory=MEMORY):
+        """
+        @param start: initial number of tickets
+        @param minimum: lower bound of tickets
+        @param maximum: upper bound of tickets
+        @param window_tickets: min. returned tickets before adjusting
+        @param window_seconds: min. seconds before adjusting
+        @param increase: additive increase
+        @param decrease: multiplicative decrease
+        @param gain: min. relative gain in throughput to keep increasing
+        @param drop: relative throughput with the same limit, that is a drop
+        @param memory: number of windows a measurement is remembered
+        """
+        if minimum < 1 or maximum < minimum:
+            raise ValueError('Invalid bounds', minimum, maximum)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = min(max(int(start), minimum), maximum)
+        self.window_tickets = window_tickets
+        self.window_seconds = window_seconds
+        self.increase = increase
+        self.decrease = decrease
+        self.gain = gain
+        self.drop = drop
+        self.memory = memory
+        self.windows = 0
+        self.throughput = {}  # limit: [throughput, window]
+        self._reset_window(time.time())
+
+    def _reset_window(self, now):
+        self.window_start = now
+        self.window_bytes = 0
+        self.window_count = 0
+        self.saturated = False
+
+    def mark_saturated(self):
+        """ Tell the controller that requests had to wait for a ticket.
+        The limit is only adjusted in windows where it was the bottleneck.
+        """
+        self.saturated = True
+
+    def record(self, nbytes, elapsed, now=None):
+        """ Record a returned ticket.
+        @param nbytes: bytes moved with this ticket
+        @param elapsed: seconds the ticket was used
+        @param now: current time (for testing)
+        @return: the (new) limit
+        """
+        if now is None:
+            now = time.time()
+        self.window_bytes += nbytes
+        self.window_count += 1
+        if (self.window_count >= self.window_tickets and
+                now - self.window_start >= self.window_seconds):
+            self._adjust(now)
+        return self.limit
+
+    def _best_below(self, limit):
+        """ Return best throughput measured with fewer tickets, or None """
+        best = None
+        for other, (throughput, window) in self.throughput.items():
+            if other < limit and (best is None or throughput > best):
+                best = throughput
+        return best
+
+    def _adjust(self, now):
+        """ Apply AIMD rule at the end of a window
+
+        Increase the limit additively, as long as the throughput is higher
+        than with any smaller limit. Else, or if the throughput dropped
+        with an unchanged limit, decrease it multiplicatively.
+        """
+        throughput = self.window_bytes / (now - self.window_start)
+        old = self.limit
+        if self.saturated:
+            self.windows += 1
+            for limit in self.throughput.keys():
+                if self.throughput[limit][1] < self.windows - self.memory:
+                    del self.throughput[limit]
+            last = self.throughput.get(self.limit)
+            self.throughput[self.limit] = [throughput, self.windows]
+
+            best = self._best_below(self.limit)
+            if ((best is not None and throughput < best * (1. + self.gain)) or
+                    (last is not None and throughput < last[0] * self.drop)):
+                self.limit = int(self.limit * self.decrease)
+            else:
+                self.limit += self.increase
+            self.limit = min(self.maximum, max(self.minimum, self.limit))
+        if old != self.limit:
+            logger.info('IO concurrency: %s -> %s (%6.2f MB/s).',
+                        old, self.limit, throughput / 1024. / 1024.)
+        self._reset_window(now)
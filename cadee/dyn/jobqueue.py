@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+"""
+Persistent queue of simpacks for ensemble simulations.
+
+The queue is a SQLite database in the simpack folder. Every simpack has a
+state (pending, running, done, failed), a lease owner and a timestamp.
+A master leases simpacks from the queue and renews its leases while the
+simpacks are computed. If a master dies, its leases expire and another
+(or the next) allocation picks the simpacks up again. Several concurrent
+allocations can share one queue, since leasing is an atomic transaction.
+
+Every failure of a simpack is recorded in the table failures, with its
+error code and host. A simpack is not leased before the retry time of
+its last failure; simpacks, that failed too often, are quarantined and
+not leased again, until they are released (see failures.py).
+
+Author: {0} ({1})
+
+This module is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+from platform import node as hostname
+import os
+import sqlite3
+import time
+
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+logger = tools.getLogger('dyn.queue')
+
+QUEUE_DB = 'cadee_queue.db'
+
+LEASE_TIMEOUT = 1800  # [s] a lease, that is not renewed, expires after this
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+QUARANTINED = 'quarantined'
+
+
+def default_owner():
+    """ Return a name for the lease owner, unique per allocation """
+    return '{0}:{1}'.format(hostname(), os.getpid())
+
+
+class JobQueue(object):
+    """ SQLite backed queue of simpacks """
+
+    def __init__(self, name, owner=None, lease_timeout=LEASE_TIMEOUT):
+        """Connect to queue and initialize table if not exists
+        :param name: path to database
+        :param owner: name of the lease owner
+        :param lease_timeout: seconds after which a lease expires
+        :type name: str
+        :type owner: str
+        :type lease_timeout: int
+        """
+        if owner is None:
+            owner = default_owner()
+        self.owner = owner
+        self.lease_timeout = lease_timeout
+        # autocommit mode; transactions are started explicitly
+        self.conn = sqlite3.connect(name, timeout=60, isolation_level=None)
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS queue
+        (simpack text PRIMARY KEY, state text, cost int, owner text, leased real, updated real); ''')  # NOPEP8
+        # counted: 0, if the failure is not the one of the simpack
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS failures
+        (simpack text, time real, host text, code int, exitcode int, kind text, error text, retry real, counted int); ''')  # NOPEP8
+        self.last_renew = time.time()
+
+    def __contains__(self, simpack):
+        cur = self.conn.execute('SELECT 1 FROM queue WHERE simpack=?',
+                                (simpack,))
+        return cur.fetchone() is not None
+
+    def add(self, simpack, cost=0):
+        """ Add simpack as pending, unless it is queued already """
+        self.conn.execute(
+            'INSERT OR IGNORE INTO queue VALUES (?,?,?,NULL,NULL,?)',
+            (simpack, PENDING, cost, time.time()))
+
+    def set_cost(self, simpack, cost):
+        """ Update the cost of simpack, eg. the remaining steps after a
+        restart """
+        self.conn.execute('UPDATE queue SET cost=? WHERE simpack=?',
+                          (cost, simpack))
+
+    def lease(self):
+        """ Lease the pending (or expired) simpack with the highest cost.
+        :return: (simpack, cost) or None, if there is nothing left to do
+        """
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.conn.execute(
+                'SELECT simpack, cost FROM queue WHERE (state=? OR '
+                '(state=? AND leased<?)) AND simpack NOT IN '
+                '(SELECT simpack FROM failures WHERE retry>?) '
+                'ORDER BY cost DESC, rowid ASC LIMIT 1',
+                (PENDING, RUNNING, now - self.lease_timeout,
+                 now)).fetchone()
+            if row is None:
+                self.conn.execute('COMMIT')
+                return None
+            self.conn.execute(
+                'UPDATE queue SET state=?, owner=?, leased=?, updated=? '
+                'WHERE simpack=?', (RUNNING, self.owner, now, now, row[0]))
+            self.conn.execute('COMMIT')
+        except sqlite3.Error:
+            self.conn.execute('ROLLBACK')
+            raise
+        return str(row[0]), row[1]
+
+    def renew(self):
+        """ Renew all leases of this owner """
+        now = time.time()
+        self.conn.execute('UPDATE queue SET leased=? WHERE state=? AND owner=?',
+                          (now, RUNNING, self.owner))
+        self.last_renew = now
+
+    def renew_in(self):
+        """ Return seconds until the leases are due to be renewed """
+        return max(0., self.last_renew + self.lease_timeout / 4. -
+                   time.time())
+
+    def renew_if_due(self):
+        """ Renew leases, if a quarter of the lease timeout has passed """
+        if self.renew_in() <= 0:
+            self.renew()
+
+    def _set_state(self, simpack, state, owner=None):
+        """ Set state of simpack, if it is not leased by another owner """
+        self.conn.execute(
+            'UPDATE queue SET state=?, owner=?, leased=NULL, updated=? '
+            'WHERE simpack=? AND (owner=? OR owner IS NULL)',
+            (state, owner, time.time(), simpack, self.owner))
+
+    def done(self, simpack):
+        """ Mark simpack as done """
+        self._set_state(simpack, DONE, self.owner)
+
+    def failed(self, simpack):
+        """ Mark simpack as failed """
+        self._set_state(simpack, FAILED, self.owner)
+
+    def release(self, simpack):
+        """ Put a leased simpack back to pending """
+        self._set_state(simpack, PENDING)
+
+    def quarantine(self, simpack):
+        """ Do not lease simpack again, see release_quarantined """
+        self._set_state(simpack, QUARANTINED)
+
+    def release_quarantined(self):
+        """ Put the quarantined simpacks back to pending, with a new
+        retry budget """
+        self.conn.execute(
+            'UPDATE failures SET counted=0 WHERE simpack IN '
+            '(SELECT simpack FROM queue WHERE state=?)', (QUARANTINED,))
+        self.reset((QUARANTINED,))
+
+    def add_failure(self, simpack, host, code, exitcode, kind, error,
+                    now=None):
+        """ Record a failure of simpack, that counts.
+        :return: id of the failure
+        """
+        cur = self.conn.execute(
+            'INSERT INTO failures VALUES (?,?,?,?,?,?,?,NULL,1)',
+            (simpack, time.time() if now is None else now, host, code,
+             exitcode, kind, error))
+        return cur.lastrowid
+
+    def retry_at(self, failure, when):
+        """ Do not lease the simpack of failure before when """
+        self.conn.execute('UPDATE failures SET retry=? WHERE rowid=?',
+                          (when, failure))
+
+    def uncount(self, host, since, kind=None):
+        """ The failures on host since (of kind) do not count """
+        self.conn.execute(
+            'UPDATE failures SET counted=0 WHERE host=? AND time>=? AND '
+            '(kind=? OR ? IS NULL)', (host, since, kind, kind))
+
+    def failures(self, simpack):
+        """ Return the number of failures of simpack, that count """
+        return self.conn.execute(
+            'SELECT count(*) FROM failures WHERE simpack=? AND counted=1',
+            (simpack,)).fetchone()[0]
+
+    def failed_simpacks(self, host, since, kind=None):
+        """ Return the simpacks, that failed on host since (of kind) """
+        cur = self.conn.execute(
+            'SELECT DISTINCT simpack FROM failures WHERE host=? AND '
+            'time>=? AND (kind=? OR ? IS NULL)', (host, since, kind, kind))
+        return [str(row[0]) for row in cur]
+
+    def next_retry(self, now=None):
+        """ Return the earliest retry time of a pending simpack, that is
+        in the future, or None """
+        return self.conn.execute(
+            'SELECT min(retry) FROM failures JOIN queue USING (simpack) '
+            'WHERE state=? AND retry>?',
+            (PENDING, time.time() if now is None else now)).fetchone()[0]
+
+    def reset(self, states=(DONE, FAILED)):
+        """ Put all simpacks in states back to pending """
+        for state in states:
+            self.conn.execute(
+                'UPDATE queue SET state=?, owner=NULL, leased=NULL, updated=? '
+                'WHERE state=?', (PENDING, time.time(), state))
+
+    def count(self, state=None):
+        """ Return number of simpacks (in state) """
+        if state is None:
+            cur = self.conn.execute('SELECT count(*) FROM queue')
+        else:
+            cur = self.conn.execute(
+                'SELECT count(*) FROM queue WHERE state=?', (state,))
+        return cur.fetchone()[0]
+
+    def costs(self, state=PENDING):
+        """ Return list of costs of simpacks in state """
+        cur = self.conn.execute('SELECT cost FROM queue WHERE state=?',
+                                (state,))
+        return [row[0] for row in cur]
+
+    def simpacks(self, state=PENDING):
+        """ Return list of simpacks in state """
+        cur = self.conn.execute(
+            'SELECT simpack FROM queue WHERE state=? '
+            'ORDER BY cost DESC, rowid ASC', (state,))
+        return [str(row[0]) for row in cur]
+
+    def close(self):
+        self.conn.close()
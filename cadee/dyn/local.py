@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+
+"""Ensemble Simulation without MPI, on one machine.
+
+The parent process runs the Master, and forks one process per core that
+runs a Worker, exactly like the ranks of an MPI run: simpacks are
+extracted, computed with trajectory.MolDynSim, backed up, and the results
+are written to the same cadee.db by the master.
+
+MPI messages are replaced by multiprocessing queues (LocalComm), and the
+IO-tickets of the master by a semaphore, that is shared by the workers
+(LocalTicket).
+
+    cadee dyn /path/to/simpacks --processes 64
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+from __future__ import print_function
+import argparse
+import multiprocessing
+import Queue
+import signal
+import time
+
+import compression
+import ensemble
+import failures
+import mpi
+import nodecache
+import packing
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+logger = tools.getLogger('dyn.local')
+
+JOIN_TIMEOUT = 200  # [s] to wait for a worker process at the end
+
+
+class LocalComm(object):
+    """ The part of an mpi4py communicator, that Master and Worker use;
+    one multiprocessing.Queue per rank. """
+
+    def __init__(self, rank, inboxes):
+        """
+        @param rank: rank of this process
+        @param inboxes: one multiprocessing.Queue per rank
+        """
+        self.rank = rank
+        self.inboxes = inboxes
+        self.pending = []  # received, but not asked for yet
+
+    def send(self, obj, dest, tag=0):
+        """ Send obj to rank dest """
+        self.inboxes[dest].put((tag, self.rank, obj))
+
+    def _match(self, source, tag):
+        """ Pop and return the first pending message from source with tag """
+        for idx, (mtag, msource, _) in enumerate(self.pending):
+            if ((tag is None or mtag == tag) and
+                    (source in (None, ensemble.ANY_SOURCE) or
+                     msource == source)):
+                return self.pending.pop(idx)
+        return None
+
+    def _fetch(self, timeout=None):
+        """ Move one message of the inbox to pending.
+        @raises Queue.Empty after timeout seconds """
+        if timeout == 0:
+            msg = self.inboxes[self.rank].get(False)
+        else:
+            msg = self.inboxes[self.rank].get(True, timeout)
+        self.pending.append(msg)
+
+    def receive(self, source=None, tag=None, timeout=None):
+        """ Return the next message (tag, source, data) from source with tag
+
+        @raises Queue.Empty after timeout seconds
+        """
+        msg = self._match(source, tag)
+        while msg is None:
+            self._fetch(timeout)
+            msg = self._match(source, tag)
+        return msg
+
+    def recv(self, source=None, tag=None):
+        """ Receive and return the data of a message """
+        return self.receive(source, tag)[2]
+
+    def iprobe(self, source=None, tag=None):
+        """ True, if a message from source with tag is waiting """
+        try:
+            while True:
+                self._fetch(0)
+        except Queue.Empty:
+            pass
+        return any((tag is None or mtag == tag) and
+                   (source in (None, ensemble.ANY_SOURCE) or msource == source)
+                   for mtag, msource, _ in self.pending)
+
+
+class LocalTicket(object):
+    """ IO-ticket of the local backend: a slot of a semaphore.
+    Same interface as ensemble.IOTicket. """
+
+    def __init__(self, semaphore):
+        self.semaphore = semaphore
+        self.nbytes = 0
+        self.start = None
+        self.elapsed = None
+
+    def __enter__(self):
+        self.semaphore.acquire()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        self.elapsed = time.time() - self.start
+        self.semaphore.release()
+
+
+class LocalMaster(ensemble.Master):
+    """ The Master, receiving from its queue instead of MPI """
+
+    def __init__(self, comm, processes, *args, **kwargs):
+        """
+        @param comm: LocalComm of rank 0
+        @param processes: list of the worker processes
+        """
+        ensemble.Master.__init__(self, *args, **kwargs)
+        self.comm = comm
+        self.processes = processes
+
+    def _post_receives(self):
+        pass
+
+    def _repost_completed(self):
+        pass
+
+    def _wait(self, timeout=None):
+        try:
+            return self.comm.receive(timeout=timeout)
+        except Queue.Empty:
+            return None
+
+    def _term_handler(self, signum, frame):
+        """ The workers do not get the signal of the master: forward it """
+        for proc in self.processes:
+            if proc.is_alive():
+                proc.terminate()
+        ensemble.Master._term_handler(self, signum, frame)
+
+
+def _worker(rank, size, inboxes, semaphore, tempdir, alpha, hij, force_map,
+            cores, verify, compress, cache_mb, log_compression,
+            compress_threads):
+    """ Run Workers in a forked process, see ensemble.main """
+    mpi.comm = LocalComm(rank, inboxes)
+    mpi.rank = rank
+    mpi.size = size
+    mpi.mpi = True  # logs and results are sent to the master
+    mpi.thread_multiple = True  # tickets do not need messages
+    # ctrl+c stops the master, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            ensemble.Worker(tempdir, alpha, hij, force_map, cores=cores,
+                            ticket=lambda: LocalTicket(semaphore),
+                            verify=verify, compress=compress,
+                            cache_mb=cache_mb,
+                            log_compression=log_compression,
+                            compress_threads=compress_threads).run()
+            break
+        except KeyboardInterrupt:
+            break
+        except Exception as err:
+            logger.exception('Process %s raised exception %s', rank, err)
+            if ensemble.RAISE_EXCEPTIONS:
+                raise
+    logger.warning("COMPUTATION LOOP ENDED: %s", rank)
+
+
+def main(inputs, simpackdir, alpha=None, hij=None, force_map=False,
+         processes=None, io_max=None, prefetch=True, cores=1, verify=False,
+         compress=None, cache_mb=nodecache.DEFAULT_MB,
+         log_compression=compression.DEFAULT_POLICY, compress_threads=1,
+         retries=failures.RETRIES, retry_backoff=failures.BACKOFF,
+         release_quarantine=False):
+    """ Compute inputs with processes Workers on this machine
+
+    @param processes: number of workers, default: cores / cores per simpack
+    @param io_max: concurrent extractions and backups, default:
+                   ensemble.PARALLEL_IO
+    @param cores: cores per simpack, or packing.AUTO
+    @param verify: do not trust the progress manifests, see ensemble.Worker
+    @param compress: compression of appended members, see ensemble.Worker
+    @param cache_mb: size of the cache of inputs, see ensemble.Worker
+    @param log_compression: gzip levels of logs and energies, and
+    @param compress_threads: threads, that compress them, see
+                             ensemble.Worker
+    @param retries: of failed simpacks, and
+    @param retry_backoff: [s] before the first retry, and
+    @param release_quarantine: see ensemble.Master
+    """
+    start = time.time()
+    ncpu = multiprocessing.cpu_count()
+    if cores == packing.AUTO:
+        cores = packing.auto_cores(inputs, ncpu)
+    if processes is None:
+        processes = max(1, ncpu // cores)
+    if io_max is None:
+        io_max = ensemble.PARALLEL_IO
+    logger.info('%s processes, %s cores per simpack, %s IO-tickets.',
+                processes, cores, io_max)
+
+    tempdir = ensemble.scratch_dir()
+    mpi.size = processes + 1
+    mpi.rank = mpi.root = mpi.parent = 0
+
+    inboxes = [multiprocessing.Queue() for _ in range(mpi.size)]
+    semaphore = multiprocessing.BoundedSemaphore(io_max)
+
+    # fork before the master opens its databases
+    workers = []
+    for rank in range(1, mpi.size):
+        proc = multiprocessing.Process(
+            target=_worker, name='cadee-worker-{0}'.format(rank),
+            args=(rank, mpi.size, inboxes, semaphore, tempdir, alpha, hij,
+                  force_map, cores, verify, compress, cache_mb,
+                  log_compression, compress_threads))
+        proc.start()
+        workers.append(proc)
+
+    try:
+        master = LocalMaster(LocalComm(mpi.root, inboxes), workers, tempdir,
+                             start, simpackdir, force_map=force_map,
+                             prefetch=prefetch, retries=retries,
+                             backoff=retry_backoff,
+                             release_quarantine=release_quarantine)
+        master.enqueue(inputs)
+        master.run()
+    except SystemExit:
+        # Master._shutdown
+        pass
+    except KeyboardInterrupt:
+        logger.warning('Interrupted. Stopping the workers ...')
+        for proc in workers:
+            proc.terminate()
+    finally:
+        for proc in workers:
+            proc.join(JOIN_TIMEOUT)
+            if proc.is_alive():
+                logger.warning('Terminating %s.', proc.name)
+                proc.terminate()
+    logger.info("TOTALTIME: %s s", round(time.time() - start, 1))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        'CADEE: simpack computation, without MPI.')
+
+    ensemble.add_arguments(parser)
+
+    parser.add_argument('--processes', action='store', type=int,
+                        default=None,
+                        help='Number of worker processes (default: number '
+                             'of cores / cores per simpack).')
+
+    args = parser.parse_args()
+
+    simpackdir, alpha, hij = ensemble.check_args(args)
+
+    logger.info(
+        'Settings: '
+        'Path: %s, '
+        'Alpha: %s, '
+        'Hij: %s, '
+        'Force mapping: %s.',
+        simpackdir, alpha, hij, args.force_map)
+
+    main(ensemble.find_simpacks(simpackdir), simpackdir, alpha, hij,
+         args.force_map, processes=args.processes, io_max=args.io_max,
+         prefetch=not args.no_prefetch, cores=args.cores_per_simpack,
+         verify=args.verify, compress=args.compress,
+         cache_mb=args.cache_mb, log_compression=args.log_compression,
+         compress_threads=args.compress_threads, retries=args.retries,
+         retry_backoff=args.retry_backoff,
+         release_quarantine=args.release_quarantine)
+
+
+if __name__ == "__main__":
+    parse_args()
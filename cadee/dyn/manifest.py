@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+"""
+Progress manifest of a simpack.
+
+A small JSON file in the simpack, that records every WorkUnit, that has
+been computed: its status (see trajectory.ERR_*), the exit code of Qdyn,
+and the size and md5 digest of its outputs (log, restart, trajectory,
+energies):
+
+    {"version": 1,
+     "units": {"md_eq1.inp": {"status": 0, "exitcode": 0, "time": 812.3,
+                              "log": "md_eq1.log.gz",
+                              "outputs": {"md_eq1.log.gz": [1234, "..."],
+                                          "md_eq1.re": [5678, "..."]}}}}
+
+When a simpack is loaded, WorkUnits that finished cleanly are trusted, if
+their outputs still have the recorded sizes: their logs are not read,
+re-validated or re-compressed. With verify, the digests are compared
+and the logs are checked as before.
+
+The manifest is appended to the archive after the outputs it describes;
+a manifest without its outputs is not trusted. Outputs, that were not
+extracted from the simpack (see extraction.py), are compared with the
+sizes of their members in the archive.
+
+Author: {0} ({1})
+
+This module is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import json
+import os
+import threading
+
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+logger = tools.getLogger('dyn.manifest')
+
+MANIFEST_NAME = 'cadee_progress.json'
+VERSION = 1
+
+
+def outputs(workunit):
+    """ Names of the outputs of workunit, that exist """
+    names = []
+    for obj in (workunit.logfile, workunit.velocityfile, workunit.dcdfile,
+                workunit.energyfile):
+        if obj is None:
+            continue
+        fname = obj[0]
+        # energy files are compressed after the run
+        for name in (fname, fname + '.gz'):
+            if os.path.isfile(name) and name not in names:
+                names.append(name)
+                break
+    return names
+
+
+def parse(text):
+    """ Return the units of the manifest text.
+    @raise ValueError: if text is not a manifest of this version
+    """
+    data = json.loads(text)
+    if data.get('version') != VERSION:
+        raise ValueError('version {0}'.format(data.get('version')))
+    return dict(data['units'])
+
+
+def clean(unit):
+    """ True, if the recorded unit finished cleanly, and has a log """
+    return (unit.get('status') == 0 and
+            unit.get('exitcode') in (0, None) and
+            unit.get('log') in unit.get('outputs', {}))
+
+
+class Manifest(object):
+    """ The progress manifest in a simpack folder """
+
+    def __init__(self, folder, verify=False):
+        """
+        @param folder: the folder, the simpack is extracted to
+        @param verify: compare digests, instead of sizes only
+        """
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.verify = verify
+        self.units = {}
+        self.archived = {}  # fname: size, of outputs left in the archive
+        # units are recorded by the compressor, too (see compression.py)
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """ Read the manifest, a missing or broken one is empty """
+        self.units = {}
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path) as fil:
+                self.units = parse(fil.read())
+        except (IOError, ValueError, KeyError, TypeError,
+                AttributeError) as err:
+            logger.warning('Ignoring progress manifest %s: %s',
+                           self.path, err)
+
+    def save(self):
+        """ Rewrite the manifest, readers never see a partial file """
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as fil:
+            json.dump({'version': VERSION, 'units': self.units}, fil,
+                      indent=1, sort_keys=True)
+        os.rename(tmp, self.path)
+
+    def record(self, workunit):
+        """ Record the outcome of workunit, and save """
+        with self.lock:
+            files = {}
+            for fname in outputs(workunit):
+                files[fname] = [os.path.getsize(fname), tools.md5sum(fname)]
+            self.units[workunit.inputfile[0]] = {
+                'status': workunit.status,
+                'exitcode': workunit.q_exitcode,
+                'time': workunit.time,
+                'log': workunit.logfile[0],
+                'outputs': files}
+            self.save()
+
+    def forget(self, inputfile):
+        """ inputfile has to be computed again """
+        with self.lock:
+            if self.units.pop(inputfile, None) is not None:
+                self.save()
+
+    def finished(self, workunit):
+        """ True, if workunit finished cleanly, and its outputs are intact.
+
+        Sizes are compared, digests only with verify. Outputs in
+        self.archived count, unless verify is set.
+        """
+        unit = self.units.get(workunit.inputfile[0])
+        if unit is None or not clean(unit):
+            return False
+        for fname, (size, md5) in unit['outputs'].items():
+            if not os.path.isfile(fname):
+                if self.archived.get(fname) == size and not self.verify:
+                    continue
+                logger.info('Output %s of %s is missing.', fname,
+                            workunit.inputfile[0])
+                return False
+            if os.path.getsize(fname) != size:
+                logger.info('Output %s of %s changed.', fname,
+                            workunit.inputfile[0])
+                return False
+            if self.verify and tools.md5sum(fname) != md5:
+                logger.warning('Digest of %s does not match the manifest.',
+                               fname)
+                return False
+        return True
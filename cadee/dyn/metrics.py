@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+"""
+Live metrics of an ensemble simulation.
+
+The workers tail the log of the running Qdyn and send step-rate samples
+with their heartbeats (see speculation.py). The master aggregates them,
+together with the state of its ranks, of the IO-queue and of the nodes
+(see resources.py), and rewrites two files in the simpack folder every
+METRICS_INTERVAL seconds:
+
+    cadee_metrics.prom: Prometheus text format, eg. for the textfile
+                        collector of the node exporter
+    cadee_metrics.json: the same as JSON, including every worker
+
+Author: {0} ({1})
+
+This module is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import json
+import os
+import time
+
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+logger = tools.getLogger('dyn.metrics')
+
+METRICS_INTERVAL = 30  # [s] between rewrites of the metrics files
+SAMPLE_MAX_AGE = 300   # [s] older samples are not aggregated
+PROM_NAME = 'cadee_metrics.prom'
+JSON_NAME = 'cadee_metrics.json'
+
+SECONDS_PER_DAY = 86400.
+
+
+def ns_per_day(steps_per_second, stepsize):
+    """ Simulated ns per day, stepsize in fs """
+    return steps_per_second * stepsize * SECONDS_PER_DAY / 1e6
+
+
+def _atomic_write(path, text):
+    """ Write text to path, readers never see a partial file """
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as fil:
+        fil.write(text)
+    os.rename(tmp, path)
+
+
+class Metrics(object):
+    """ Aggregates samples of the workers, and writes the metrics files """
+
+    def __init__(self, folder, interval=METRICS_INTERVAL,
+                 max_age=SAMPLE_MAX_AGE):
+        """
+        @param folder: where the metrics files are written
+        @param interval: [s] min. time between writes
+        @param max_age: [s] samples older are not aggregated
+        """
+        self.prom_path = os.path.join(folder, PROM_NAME)
+        self.json_path = os.path.join(folder, JSON_NAME)
+        self.interval = interval
+        self.max_age = max_age
+        self.samples = {}  # rank: dict
+        self.waits = [0, 0., 0.]  # IO-ticket waits: count, sum, max
+        self.last_write = 0
+
+    def sample(self, rank, simpack, steps_per_second, stepsize,
+               seconds_per_step=None, now=None):
+        """ Record a step-rate sample of rank
+
+        @param stepsize: [fs] of the running step
+        @param seconds_per_step: as printed by Qdyn, if known
+        """
+        self.samples[rank] = {
+            'time': time.time() if now is None else now,
+            'simpack': os.path.basename(simpack),
+            'steps_per_second': steps_per_second,
+            'ns_per_day': ns_per_day(steps_per_second, stepsize),
+            'seconds_per_step': seconds_per_step}
+
+    def forget(self, rank):
+        """ rank is not computing anymore """
+        self.samples.pop(rank, None)
+
+    def io_wait(self, seconds):
+        """ Record the wait of a worker for an IO-ticket """
+        self.waits[0] += 1
+        self.waits[1] += seconds
+        self.waits[2] = max(self.waits[2], seconds)
+
+    def summary(self, gauges, now=None):
+        """ Return the metrics as dict
+
+        @param gauges: dict with the state of the master, eg. busy ranks
+        """
+        if now is None:
+            now = time.time()
+        recent = dict((rank, sample) for rank, sample in self.samples.items()
+                      if now - sample['time'] <= self.max_age)
+        result = dict(gauges)
+        result.update({
+            'time': now,
+            'ns_per_day': sum(sample['ns_per_day']
+                              for sample in recent.values()),
+            'steps_per_second': sum(sample['steps_per_second']
+                                    for sample in recent.values()),
+            'reporting_ranks': len(recent),
+            'io_ticket_waits': self.waits[0],
+            'io_ticket_wait_seconds': self.waits[1],
+            'io_ticket_wait_max_seconds': self.waits[2],
+            'workers': dict((str(rank), sample)
+                            for rank, sample in recent.items())})
+        return result
+
+    @staticmethod
+    def prometheus(summary):
+        """ Return summary in the Prometheus text format """
+        lines = []
+
+        def metric(name, mtype, helptext, values):
+            lines.append('# HELP cadee_{0} {1}'.format(name, helptext))
+            lines.append('# TYPE cadee_{0} {1}'.format(name, mtype))
+            for labels, value in values:
+                if value is None:
+                    continue
+                label = ','.join('{0}="{1}"'.format(key, val)
+                                 for key, val in labels)
+                if label:
+                    label = '{' + label + '}'
+                lines.append('cadee_{0}{1} {2}'.format(name, label,
+                                                       repr(float(value))))
+
+        metric('ns_per_day', 'gauge',
+               'Simulated ns per day of all workers.',
+               [((), summary['ns_per_day'])])
+        metric('steps_per_second', 'gauge', 'MD steps per second.',
+               [((), summary['steps_per_second'])])
+        metric('ranks', 'gauge', 'Worker ranks by state.',
+               [((('state', state),), summary.get(state))
+                for state in ('busy', 'idle')])
+        metric('io_queue_depth', 'gauge', 'Workers waiting for IO-tickets.',
+               [((), summary.get('io_queue'))])
+        metric('io_tickets', 'gauge', 'IO-tickets in use, and the limit.',
+               [((('state', 'used'),), summary.get('io_tickets')),
+                ((('state', 'limit'),), summary.get('io_limit'))])
+        metric('io_ticket_wait_seconds', 'summary',
+               'Wait of workers for IO-tickets.',
+               [((('quantile', '1'),), summary['io_ticket_wait_max_seconds'])])
+        lines.append('cadee_io_ticket_wait_seconds_sum {0}'.format(
+            repr(float(summary['io_ticket_wait_seconds']))))
+        lines.append('cadee_io_ticket_wait_seconds_count {0}'.format(
+            summary['io_ticket_waits']))
+        metric('simpacks', 'gauge', 'Simpacks by state.',
+               [((('state', state),), summary.get(state))
+                for state in ('pending', 'done', 'failed', 'quarantined')])
+        metric('blacklisted_hosts', 'gauge',
+               'Hosts, that get no simpacks, see failures.py.',
+               [((), summary.get('blacklisted'))])
+        workers = sorted(summary['workers'].items(), key=lambda kv: int(kv[0]))
+        metric('worker_ns_per_day', 'gauge', 'Simulated ns per day.',
+               [((('rank', rank), ('simpack', sample['simpack'])),
+                 sample['ns_per_day']) for rank, sample in workers])
+        metric('worker_seconds_per_step', 'gauge',
+               'Wall-clock seconds per MD step.',
+               [((('rank', rank), ('simpack', sample['simpack'])),
+                 1. / sample['steps_per_second']
+                 if sample['steps_per_second'] else None)
+                for rank, sample in workers])
+        # resources of the nodes, see resources.py
+        nodes = sorted(summary.get('nodes', {}).items())
+        for name, column, helptext in (
+                ('node_load1', 'load1', 'Load average of the node.'),
+                ('node_iowait', 'iowait', 'Fraction of cpu time in iowait.'),
+                ('node_swap_in', 'swap_in', 'Pages swapped in per second.'),
+                ('node_rss_megabytes', 'rss_max', 'Max. RSS of a Qdyn.'),
+                ('node_scratch_fill', 'scratch_fill_max',
+                 'Used fraction of the scratch filesystem.'),
+                ('node_fs_latency_milliseconds', 'fs_latency',
+                 'Latency to open a simpack.')):
+            metric(name, 'gauge', helptext,
+                   [((('host', host),), row.get(column))
+                    for host, row in nodes])
+        return '\n'.join(lines) + '\n'
+
+    def due(self, now=None):
+        """ True, if the files should be rewritten """
+        if now is None:
+            now = time.time()
+        return now - self.last_write >= self.interval
+
+    def write(self, gauges, now=None):
+        """ Rewrite the metrics files """
+        summary = self.summary(gauges, now)
+        self.last_write = summary['time']
+        try:
+            _atomic_write(self.prom_path, self.prometheus(summary))
+            _atomic_write(self.json_path,
+                          json.dumps(summary, indent=1, sort_keys=True))
+        except (IOError, OSError) as err:
+            logger.warning('Could not write metrics: %s', err)
+        return summary
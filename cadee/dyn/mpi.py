@@ -13,23 +13,57 @@ Computer-Aided Directed Evolution of Enzymes.
 __author__ = "Beat Amrein"
 __email__ = "beat.amrein@gmail.com"
 
+import os
+
+# set by the launchers (mpiexec, mpirun, srun) of Open MPI, MPICH,
+# Intel MPI, MVAPICH and PMIx
+LAUNCHER_VARS = ('OMPI_COMM_WORLD_SIZE', 'PMI_SIZE', 'PMIX_RANK',
+                 'MPI_LOCALNRANKS', 'MV2_COMM_WORLD_SIZE')
+
+
+def launched(environ=None):
+    """ True, if started by an MPI launcher. CADEE_MPI=1 (or 0) says so
+    for other launchers. """
+    if environ is None:
+        environ = os.environ
+    if environ.get('CADEE_MPI'):
+        return environ['CADEE_MPI'] != '0'
+    return any(var in environ for var in LAUNCHER_VARS)
+
+
 try:
+    import mpi4py
+    if not launched():
+        # no MPI_Init: the local backend forks its workers (see local.py),
+        # which MPI implementations do not support after MPI_Init
+        mpi4py.rc.initialize = False
+        mpi4py.rc.finalize = False
     from mpi4py import MPI
 except ImportError:
     print('mpi4py not found')
 
 try:
+    initialized = MPI.Is_initialized()
+except NameError:
+    initialized = False
+
+if initialized:
     comm = MPI.COMM_WORLD
     rank = comm.Get_rank()
     root = 0
+    parent = root  # rank, that receives IO-requests, logs and results
     size = comm.Get_size()
     mpi = True
-except NameError:
+    # threads may only call MPI concurrently with THREAD_MULTIPLE
+    thread_multiple = MPI.Query_thread() == MPI.THREAD_MULTIPLE
+else:
     comm = 0
     rank = 0
     root = 0
+    parent = root
     size = 0
     mpi = False
+    thread_multiple = False
     print('MPI disabled')
 
 
@@ -43,6 +77,17 @@ class Tags(object):
     IO_FINISHED = 6
     RESULTS = 7
     SHUTDOWN = 8
+    BATCH = 9  # list of [tag, source, data], forwarded by a sub-master
+    HEARTBEAT = 10  # see ensemble.Worker._monitor, worker to master
+    ABORT = 11  # simpack, master to worker: a copy has finished first
+
+
+def is_finalized():
+    """ True, if MPI is finalized, eg. at exit. Never without mpi4py. """
+    try:
+        return MPI.Is_finalized()
+    except NameError:
+        return False
 
 
 def get_info():
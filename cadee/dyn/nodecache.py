@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+"""
+Node-local cache of the read-only inputs of simpacks.
+
+The replicas of a mutant share their topology, pdb, fep file and most of
+their inputs. The workers of a node share a cache directory in node-local
+scratch (by default next to their working directories), with one file per
+content, named by its md5 digest:
+
+    cache/objects/<md5>
+
+A member of a simpack, that is in the cache, is hardlinked into the
+working directory instead of being extracted from the shared filesystem.
+A member, that is not, is extracted as before, and then linked into the
+cache for the next worker. The digests are those of the index of the
+simpack (see archive.py); members without a digest are not cached.
+
+The number of links of an object counts the workers using it: objects
+with a single link are unused. When the cache grows beyond its size,
+the unused objects, that were used least recently, are removed. If the
+cache is on another filesystem than the working directories, files are
+copied instead of linked.
+
+Cached files are shared: they must never be written in place (see
+trajectory.WorkUnit._deploy).
+
+Author: {0} ({1})
+
+This module is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import errno
+import fcntl
+import os
+import shutil
+import tempfile
+import time
+
+import archive
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+logger = tools.getLogger('dyn.nodecache')
+
+# read-only inputs, that replicas share
+CACHED = ('.top', '.pdb', '.fep', '.inp')
+
+DEFAULT_MB = 1024  # [MB] size of the cache
+
+
+def cacheable(name):
+    """ True, if member name is a read-only input """
+    return os.path.splitext(name)[1].lower() in CACHED
+
+
+class NodeCache(object):
+    """ Content-addressed cache, shared by the workers of a node """
+
+    def __init__(self, root, max_mb=DEFAULT_MB):
+        """
+        @param root: cache directory, in node-local scratch
+        @param max_mb: size of the cache [MB]
+        """
+        self.root = root
+        self.objects = os.path.join(root, 'objects')
+        self.tmp = os.path.join(root, 'tmp')
+        self.max_bytes = max_mb * 1024 * 1024
+        for folder in (self.objects, self.tmp):
+            try:
+                os.makedirs(folder)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+        self.hits = 0    # members linked from the cache
+        self.saved = 0   # [bytes] not read from the shared filesystem
+
+    def _lock(self):
+        """ Return the open lock file of the cache, locked """
+        fil = open(os.path.join(self.root, 'lock'), 'a')
+        fcntl.flock(fil, fcntl.LOCK_EX)
+        return fil
+
+    def _object(self, md5):
+        return os.path.join(self.objects, md5)
+
+    def link(self, simpack, names=None, path='.'):
+        """ Link the cached members of simpack to path.
+
+        @param names: members to extract, default: all
+        @return: names, that are not cached and have to be extracted
+        """
+        if names is None:
+            names = simpack.names()
+        missing = []
+        linked = 0
+        now = time.time()
+        lock = self._lock()
+        try:
+            for name in names:
+                md5 = simpack.digest(name)
+                obj = self._object(md5) if md5 is not None else None
+                if (obj is None or not cacheable(name) or
+                        not os.path.isfile(obj)):
+                    missing.append(name)
+                    continue
+                target = os.path.join(path, name)
+                if os.path.lexists(target):
+                    os.remove(target)
+                archive.hardlink(obj, target)
+                # atime: last use, the mtime is the one of the member
+                os.utime(obj, (now, os.path.getmtime(obj)))
+                linked += simpack.members[name]['size']
+                self.hits += 1
+        finally:
+            lock.close()
+        if linked > 0:
+            logger.info('Linked %s members (%6.2f MB) of %s from the cache.',
+                        len(names) - len(missing), linked / 1024. / 1024.,
+                        simpack.path)
+        self.saved += linked
+        return missing
+
+    def add(self, simpack, names, path='.'):
+        """ Put the extracted members of simpack in path into the cache.
+        Only files, that match the digest in the index, are added. """
+        added = 0
+        for name in names:
+            md5 = simpack.digest(name)
+            fname = os.path.join(path, name)
+            if (md5 is None or not cacheable(name) or
+                    not os.path.isfile(fname) or
+                    os.path.isfile(self._object(md5))):
+                continue
+            if tools.md5sum(fname) != md5:
+                logger.warning('%s does not match its digest in %s.',
+                               name, simpack.path)
+                continue
+            # a directory of its own: other workers of the node add, too
+            tmpdir = tempfile.mkdtemp(dir=self.tmp)
+            try:
+                tmp = os.path.join(tmpdir, md5)
+                archive.hardlink(fname, tmp)
+                # rename is atomic, an object is complete or missing
+                os.rename(tmp, self._object(md5))
+            finally:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+            added += os.path.getsize(fname)
+        if added > 0:
+            self.evict()
+
+    def evict(self):
+        """ Remove unused objects, least recently used first, until the
+        cache fits into its size """
+        lock = self._lock()
+        try:
+            objects = []
+            total = 0
+            for md5 in os.listdir(self.objects):
+                obj = self._object(md5)
+                try:
+                    stat = os.stat(obj)
+                except OSError:
+                    continue
+                total += stat.st_size
+                if stat.st_nlink == 1:
+                    objects.append((stat.st_atime, stat.st_size, obj))
+            for _, size, obj in sorted(objects):
+                if total <= self.max_bytes:
+                    break
+                os.remove(obj)
+                total -= size
+                logger.debug('Evicted %s from the cache.', obj)
+        finally:
+            lock.close()
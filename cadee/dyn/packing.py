@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+"""
+Multi-core simpacks: groups of ranks that run the parallel Qdyn6p.
+
+With --cores_per_simpack N, the worker ranks of every node are packed
+into groups of N ranks. The lowest rank of a group (the leader) runs the
+Worker, and launches Qdyn6p with N processes (see LAUNCHER); the other
+ranks of the group only hold their cores and sleep, until the leader
+stops. What remains on a node (less than N ranks) forms a smaller group,
+so no core of the allocation is stranded. With 'auto', N is derived from
+the number of atoms in the topologies of the simpacks.
+
+The ensemble should be started without binding the ranks to single cores
+(eg. mpirun --bind-to none), otherwise the cores of a group are handed to
+Qdyn6p with taskset.
+
+Environment:
+    CADEE_LAUNCHER: template of the command that starts Qdyn6p,
+                    default: 'mpiexec -n {cores} {exe}'
+    CADEE_QDYN_PARALLEL: parallel executable, default: Qdyn6p; eg. a
+                    stand-in (standin_qdyn.py) to test the placement.
+
+Author: {0} ({1})
+
+This module is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import os
+
+import archive
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+logger = tools.getLogger('dyn.packing')
+
+AUTO = 'auto'  # derive cores per simpack from the system size
+
+ATOMS_PER_CORE = 4000  # 'auto': atoms per core of Qdyn6p
+
+LAUNCHER = 'mpiexec -n {cores} {exe}'
+
+# set by the MPI library that runs the ensemble, confuse a nested mpiexec
+MPI_ENV_PREFIXES = ('OMPI_', 'ORTE_', 'PMI_', 'PMIX_', 'HYDI_', 'MPI_LOCAL')
+
+
+def parse_cores(value):
+    """ Return cores per simpack: an int > 0, or AUTO """
+    if value is None:
+        return 1
+    if str(value).lower() == AUTO:
+        return AUTO
+    cores = int(value)
+    if cores < 1:
+        raise ValueError('cores per simpack must be >0 or auto', value)
+    return cores
+
+
+def topology_atoms(simpack):
+    """ Return the number of atoms in the topology of simpack, or None """
+    try:
+        tar = archive.SimpackArchive(simpack)
+        for name in tar.names():
+            if not name.endswith('.top'):
+                continue
+            for line in tar.extractfile(name).splitlines():
+                if 'no. of atoms' in line.lower():
+                    return int(line.split()[0])
+    except (IOError, OSError, ValueError, KeyError) as err:
+        logger.warning('Could not read topology of %s: %s', simpack, err)
+    return None
+
+
+def auto_cores(simpacks, max_cores):
+    """ Cores per simpack for the median system size of simpacks
+
+    @param simpacks: list of simpacks
+    @param max_cores: upper limit, eg. the ranks per node
+    @return: int, 1 <= cores <= max_cores
+    """
+    atoms = sorted(num for num in (topology_atoms(simpack)
+                                   for simpack in simpacks)
+                   if num is not None)
+    if not atoms:
+        return 1
+    median = atoms[len(atoms) // 2]
+    return max(1, min(max_cores, median // ATOMS_PER_CORE))
+
+
+def pack(hosts, cores, exclude=()):
+    """ Pack the ranks of every host into groups of cores ranks.
+
+    @param hosts: hostname of every rank, index is the rank
+    @param cores: ranks per group
+    @param exclude: ranks not part of any group (master, sub-masters)
+    @return: dict {leader: [members]}, the ranks of a host that do not
+             fill a group form a smaller one
+    """
+    by_host = {}
+    for rank, host in enumerate(hosts):
+        if rank not in exclude:
+            by_host.setdefault(host, []).append(rank)
+    result = {}
+    for ranks in by_host.values():
+        for start in range(0, len(ranks), cores):
+            group = ranks[start:start + cores]
+            result[group[0]] = group[1:]
+    return result
+
+
+def parse_cpus(cpulist):
+    """ Return the set of cpus in a list like '0-3,8' """
+    cpus = set()
+    for item in cpulist.strip().split(','):
+        if not item:
+            continue
+        if '-' in item:
+            first, last = item.split('-')
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(item))
+    return cpus
+
+
+def format_cpus(cpus):
+    """ Inverse of parse_cpus """
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(str(first) if first == last else
+                    '{0}-{1}'.format(first, last) for first, last in ranges)
+
+
+def allowed_cpus():
+    """ Return the set of cpus this process may run on, or None """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('Cpus_allowed_list:'):
+                    return parse_cpus(line.split(':', 1)[1])
+    except IOError:
+        pass
+    return None
+
+
+def command(exe, cores, cpus=None, launcher=None):
+    """ Return the command (list) that runs exe with cores processes
+
+    @param exe: path to the parallel executable
+    @param cores: number of processes
+    @param cpus: cpus of the group; if the leader is bound to less cpus,
+                 the command is run with taskset on cpus
+    @param launcher: template, default: CADEE_LAUNCHER or LAUNCHER
+    """
+    if launcher is None:
+        launcher = os.environ.get('CADEE_LAUNCHER') or LAUNCHER
+    cmd = launcher.format(cores=cores, exe=exe).split()
+    own = allowed_cpus()
+    if cpus and own is not None and not set(cpus) <= own:
+        cmd = ['taskset', '-c', format_cpus(cpus)] + cmd
+    return cmd
+
+
+def launch_env(environ=None):
+    """ Return a copy of environ without the variables of the MPI runtime
+    of the ensemble, so the launcher starts a new MPI job. """
+    if environ is None:
+        environ = os.environ
+    return dict((key, value) for key, value in environ.items()
+                if not key.startswith(MPI_ENV_PREFIXES))
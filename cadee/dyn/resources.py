@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+
+"""
+Resource usage of the nodes during an ensemble simulation.
+
+When a campaign slows down, the step rates of metrics.py do not tell, if
+the nodes swap, wait for IO or share their cores. Every SAMPLE_INTERVAL
+seconds, a worker samples cheap statistics of /proc (Linux):
+
+    rss, swap:      [MB] of the running Qdyn and its children
+    mem_available:  [MB] of the node
+    swap_in/_out:   [pages/s] of the node since the previous sample
+    load1:          load average of the node
+    cpu_busy, iowait, steal: fractions of the cpu time of the node since
+                    the previous sample
+    scratch_fill:   used fraction of the scratch filesystem
+    fs_latency:     [ms] to open the simpack on the shared filesystem
+
+Fields, that can not be read, are None. The samples, [time, values...]
+in the order of FIELDS, are sent with the heartbeats and the DONE
+message, that the worker sends anyway.
+
+The master aggregates the samples per host over WINDOW seconds, and
+inserts a row per host and window into the table resources of cadee.db:
+
+    SELECT host, max(rss_max), max(iowait) FROM resources GROUP BY host;
+
+Author: {0} ({1})
+
+This module is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import os
+import time
+
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+logger = tools.getLogger('dyn.resources')
+
+SAMPLE_INTERVAL = 10  # [s] between samples of a worker
+MAX_SAMPLES = 100     # kept by a worker, older ones are dropped
+WINDOW = 60           # [s] aggregated into a row
+
+FIELDS = ('rss', 'swap', 'mem_available', 'swap_in', 'swap_out', 'load1',
+          'cpu_busy', 'iowait', 'steal', 'scratch_fill', 'fs_latency')
+
+COLUMNS = ('time', 'host', 'ranks', 'samples', 'rss_mean', 'rss_max',
+           'swap_max', 'mem_available_min', 'swap_in', 'swap_out', 'load1',
+           'cpu_busy', 'iowait', 'steal', 'scratch_fill_max', 'fs_latency',
+           'fs_latency_max')
+
+TABLE = '''CREATE TABLE IF NOT EXISTS resources
+        (time int, host text, ranks int, samples int, rss_mean real, rss_max real, swap_max real, mem_available_min real, swap_in real, swap_out real, load1 real, cpu_busy real, iowait real, steal real, scratch_fill_max real, fs_latency real, fs_latency_max real); '''  # NOPEP8
+TEMPLATE = 'INSERT INTO resources VALUES ({0})'.format(
+    ','.join('?' * len(COLUMNS)))
+
+PROC = '/proc'
+
+
+def _read(path):
+    """ Content of path, or None """
+    try:
+        with open(path) as fil:
+            return fil.read()
+    except (IOError, OSError):
+        return None
+
+
+def _children(pid):
+    """ pid and its descendants (needs /proc/<pid>/task/<pid>/children) """
+    result = []
+    todo = [pid]
+    while todo:
+        pid = todo.pop()
+        result.append(pid)
+        text = _read(os.path.join(PROC, str(pid), 'task', str(pid),
+                                  'children'))
+        if text:
+            todo.extend(int(child) for child in text.split())
+    return result
+
+
+def memory(pid):
+    """ [rss, swap] in MB of pid and its descendants, or [None, None] """
+    total = [None, None]
+    for child in _children(pid):
+        text = _read(os.path.join(PROC, str(child), 'status'))
+        if text is None:
+            continue
+        for line in text.splitlines():
+            for idx, key in enumerate(('VmRSS:', 'VmSwap:')):
+                if line.startswith(key):
+                    total[idx] = (total[idx] or 0) + int(line.split()[1])
+    return [None if kib is None else kib / 1024. for kib in total]
+
+
+def mem_available():
+    """ [MB] available memory of the node, or None """
+    text = _read(os.path.join(PROC, 'meminfo'))
+    for line in (text or '').splitlines():
+        if line.startswith('MemAvailable:'):
+            return int(line.split()[1]) / 1024.
+    return None
+
+
+def load1():
+    """ Load average of the last minute, or None """
+    text = _read(os.path.join(PROC, 'loadavg'))
+    return float(text.split()[0]) if text else None
+
+
+def cpu_times():
+    """ [total, idle, iowait, steal] jiffies of the node, or None """
+    text = _read(os.path.join(PROC, 'stat'))
+    if not text or not text.startswith('cpu '):
+        return None
+    # user nice system idle iowait irq softirq steal (guest is in user)
+    values = [int(val) for val in text.splitlines()[0].split()[1:9]]
+    values += [0] * (8 - len(values))
+    return [sum(values), values[3], values[4], values[7]]
+
+
+def swap_pages():
+    """ [pages swapped in, out] since boot, or None """
+    text = _read(os.path.join(PROC, 'vmstat'))
+    if not text:
+        return None
+    counts = dict(line.split()[:2] for line in text.splitlines()
+                  if line.startswith(('pswpin ', 'pswpout ')))
+    if len(counts) != 2:
+        return None
+    return [int(counts['pswpin']), int(counts['pswpout'])]
+
+
+def fill(path):
+    """ Used fraction of the filesystem of path, or None """
+    try:
+        stat = os.statvfs(path)
+    except OSError:
+        return None
+    if stat.f_blocks == 0:
+        return None
+    return 1. - stat.f_bavail / float(stat.f_blocks)
+
+
+def latency(path):
+    """ [ms] to open and close path, or None.
+    On NFS, open revalidates the attributes of path with the server. """
+    start = time.time()
+    try:
+        os.close(os.open(path, os.O_RDONLY))
+    except OSError:
+        return None
+    return (time.time() - start) * 1000.
+
+
+class Sampler(object):
+    """ Samples the resources of a worker, see module doc """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, keep=MAX_SAMPLES):
+        """
+        @param interval: [s] min. time between samples
+        @param keep: max. number of samples, that are not taken
+        """
+        self.interval = interval
+        self.keep = keep
+        self.samples = []
+        self.last = 0
+        self._cpu = cpu_times()
+        self._swap = [time.time(), swap_pages()]
+
+    def due(self, now=None):
+        """ True, if the next sample should be taken """
+        if now is None:
+            now = time.time()
+        return now - self.last >= self.interval
+
+    def _cpu_fractions(self):
+        """ [busy, iowait, steal] since the previous call """
+        cpu, self._cpu = self._cpu, cpu_times()
+        if cpu is None or self._cpu is None:
+            return [None] * 3
+        total, idle, iowait, steal = [new - old for new, old in
+                                      zip(self._cpu, cpu)]
+        if total <= 0:
+            return [None] * 3
+        return [(total - idle - iowait) / float(total),
+                iowait / float(total), steal / float(total)]
+
+    def _swap_rates(self, now):
+        """ [pages/s swapped in, out] since the previous call """
+        (when, pages), self._swap = self._swap, [now, swap_pages()]
+        if pages is None or self._swap[1] is None or now <= when:
+            return [None] * 2
+        return [(new - old) / (now - when)
+                for new, old in zip(self._swap[1], pages)]
+
+    def sample(self, pid=None, scratch=None, shared=None, now=None):
+        """ Take a sample
+
+        @param pid: of the running Qdyn
+        @param scratch: a path in the scratch filesystem
+        @param shared: a file on the shared filesystem, eg. the simpack
+        @return: the sample, [time, values...]
+        """
+        if now is None:
+            now = time.time()
+        self.last = now
+        rss, swap = memory(pid) if pid is not None else [None, None]
+        swap_in, swap_out = self._swap_rates(now)
+        busy, iowait, steal = self._cpu_fractions()
+        sample = [now, rss, swap, mem_available(), swap_in, swap_out,
+                  load1(), busy, iowait, steal,
+                  fill(scratch) if scratch else None,
+                  latency(shared) if shared else None]
+        self.samples.append(sample)
+        del self.samples[:-self.keep]
+        return sample
+
+    def take(self):
+        """ Return and forget the samples """
+        samples, self.samples = self.samples, []
+        return samples
+
+
+def _mean(values):
+    values = [val for val in values if val is not None]
+    return sum(values) / len(values) if values else None
+
+
+def _max(values):
+    values = [val for val in values if val is not None]
+    return max(values) if values else None
+
+
+def _min(values):
+    values = [val for val in values if val is not None]
+    return min(values) if values else None
+
+
+class Resources(object):
+    """ Aggregates the samples of the workers per host, see module doc """
+
+    def __init__(self, write, window=WINDOW):
+        """
+        @param write: called with every row, in the order of COLUMNS
+        @param window: [s] aggregated into a row
+        """
+        self.write = write
+        self.window = window
+        self.pending = {}  # host: [[rank, sample], ...]
+        self.latest = {}   # host: dict of the last row
+        self.last_flush = time.time()
+
+    def add(self, rank, host, samples):
+        """ Record the samples of rank on host """
+        if not samples or not host:
+            return
+        self.pending.setdefault(host, []).extend(
+            [rank, sample] for sample in samples)
+
+    @staticmethod
+    def aggregate(now, host, samples):
+        """ Row of samples ([rank, sample], ...) of host """
+        column = dict((field, [sample[idx + 1] for _, sample in samples])
+                      for idx, field in enumerate(FIELDS))
+        return [int(now), host, len(set(rank for rank, _ in samples)),
+                len(samples), _mean(column['rss']), _max(column['rss']),
+                _max(column['swap']), _min(column['mem_available']),
+                _mean(column['swap_in']), _mean(column['swap_out']),
+                _mean(column['load1']), _mean(column['cpu_busy']),
+                _mean(column['iowait']), _mean(column['steal']),
+                _max(column['scratch_fill']), _mean(column['fs_latency']),
+                _max(column['fs_latency'])]
+
+    def flush(self, now=None, force=False):
+        """ Write a row per host, once per window, or if force """
+        if now is None:
+            now = time.time()
+        if not force and now - self.last_flush < self.window:
+            return
+        self.last_flush = now
+        for host, samples in sorted(self.pending.items()):
+            row = self.aggregate(now, host, samples)
+            self.latest[host] = dict(zip(COLUMNS, row))
+            try:
+                self.write(row)
+            except Exception:
+                logger.exception('Could not write the resources of %s', host)
+        self.pending = {}
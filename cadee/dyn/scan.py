@@ -13,6 +13,8 @@ Computer-Aided Directed Evolution of Enzymes.
 from __future__ import print_function
 import os
 
+import archive
+
 __author__ = "Beat Amrein"
 __email__ = "beat.amrein@gmail.com"
 
@@ -35,8 +37,15 @@ class Scan():
         open fn and read lines.
         return non-empty lines w/o comment, NLC.
         """
+        return Scan.clean_lines(open(fn, 'r'))
+
+    @staticmethod
+    def clean_lines(fil):
+        """
+        return non-empty lines w/o comment, NLC of iterable fil.
+        """
         lines = []
-        for line in open(fn, 'r'):
+        for line in fil:
             if line.strip() == "":
                 continue
             line = line.replace('!', '#')
@@ -374,6 +383,50 @@ class Scan():
         self.result = (topology, fepfile, inputfiles, steps, fs)
         return self.result
 
+def is_qdyn_input(fn):
+    """ Return True if fn is named like a Qdyn input (eg. 0012_fep.inp) """
+    fn = os.path.basename(fn)
+    if fn[-4:] != '.inp':
+        return False
+    try:
+        int(fn.split("_")[0])
+    except ValueError:
+        return False
+    return True
+
+
+def tar_progress(tarchive):
+    """ Return total and finished MD steps of a simpack.
+
+    Reads the input files from the tarchive without extracting it,
+    using the index of the simpack (see archive.py).
+    A step counts as finished, if its compressed log file is in the
+    tarchive (logs are only gzipped after a successful check).
+
+    @param tarchive: path to simpack
+    @type tarchive: str
+    @return: (total_steps, finished_steps)
+    """
+    simpack = archive.SimpackArchive(tarchive)
+    inputs = {}
+    logs = set()
+    for member in simpack.names():
+        name = os.path.basename(member)
+        if is_qdyn_input(name):
+            inputs[name] = member
+        elif name[-7:] == '.log.gz':
+            logs.add(name[:-7])
+    total = 0
+    finished = 0
+    for name, member in inputs.items():
+        steps, _ = Scan.get_simtime(
+            Scan.clean_lines(simpack.extractfile(member).splitlines()))
+        total += steps
+        if name[:-4] in logs:
+            finished += steps
+    return total, finished
+
+
 if __name__ == "__main__":
         import time
         import sys
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+"""
+Scratch space of the workers, in tiers.
+
+A worker computes a simpack in node-local scratch, and there may be
+several candidates: /dev/shm (memory), /scratch and /tmp, fastest first;
+or the folders in $CADEE_TMP, separated by ':', in that order. With
+every DONE message and heartbeat, a worker reports the free space of
+each tier, and how much of it its simpack uses:
+
+    {'host': 'node12',
+     'tiers': [['/dev/shm', free, total, own], ['/tmp', ...], ...]}
+
+The master estimates the scratch space of a simpack from its archive
+(see estimate): the members, that are extracted, and the outputs of the
+steps, that are still computed. Placement chooses the fastest tier of
+the node, that fits the simpack besides a reserve and besides what the
+other simpacks running on the node will still write. If none fits, the
+dispatch is held back until a simpack on the node has finished; if no
+other simpack runs on the node, the tier with the most space is used.
+
+Author: {0} ({1})
+
+This module is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+from platform import node as hostname
+import os
+import time
+
+import archive
+import extraction
+import scan
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+logger = tools.getLogger('dyn.scratch')
+
+TIERS = ('/dev/shm', '/scratch', '/tmp')  # fastest first
+RESERVE = 0.05  # fraction of a tier, that is left free
+MIN_RESERVE_MB = 256  # [MB] left free on every tier
+DEFAULT_BYTES_PER_STEP = 1024  # [bytes] of outputs per MD step
+
+
+def tiers():
+    """ The scratch folders, that exist, fastest first """
+    candidates = [path for path in
+                  os.environ.get('CADEE_TMP', '').split(os.pathsep) if path]
+    if not candidates:
+        candidates = TIERS
+    return [os.path.normpath(path) for path in candidates
+            if os.path.isdir(path)]
+
+
+def workdir(tier, tempdir, rank):
+    """ The working directory of rank on tier
+
+    @param tempdir: the temporary directory of the process, see
+                    ensemble.scratch_dir
+    """
+    return os.path.join(tier, 'cadee',
+                        os.path.basename(os.path.normpath(tempdir)),
+                        str(rank)) + '/'
+
+
+def usage(path):
+    """ Bytes of the files under path, linked files count once """
+    seen = set()
+    total = 0
+    for dirpath, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.lstat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            if (stat.st_dev, stat.st_ino) in seen:
+                continue
+            seen.add((stat.st_dev, stat.st_ino))
+            total += stat.st_size
+    return total
+
+
+def _tier_of(path, candidates):
+    """ The tier of candidates, that path is in, or None """
+    path = os.path.normpath(path)
+    inside = [tier for tier in candidates
+              if path == tier or path.startswith(tier.rstrip('/') + '/')]
+    return max(inside, key=len) if inside else None
+
+
+def report(candidates, paths):
+    """ The report of a worker, see module doc
+
+    @param candidates: tiers, fastest first
+    @param paths: folders of the worker, their usage is its own
+    """
+    own = {}
+    for path in paths:
+        tier = _tier_of(path, candidates)
+        if tier is not None:
+            own[tier] = own.get(tier, 0) + usage(path)
+    result = []
+    for tier in candidates:
+        try:
+            stat = os.statvfs(tier)
+        except OSError:
+            continue
+        result.append([tier, stat.f_bavail * stat.f_frsize,
+                       stat.f_blocks * stat.f_frsize, own.get(tier, 0)])
+    return {'host': hostname(), 'tiers': result}
+
+
+def _size(simpack, fname):
+    """ Size of fname or fname.gz in simpack, or 0 """
+    for name in (fname, fname + '.gz'):
+        if name in simpack:
+            return simpack.members[name]['size']
+    return 0
+
+
+def estimate(tarchive, bytes_per_step=DEFAULT_BYTES_PER_STEP):
+    """ Estimate the scratch space [bytes], that tarchive needs.
+
+    The outputs per MD step are the ones of the finished steps in
+    tarchive; bytes_per_step, if no step has finished.
+
+    @return: (bytes, bytes per MD step)
+    """
+    simpack = archive.SimpackArchive(tarchive)
+    names = extraction.plan(simpack)
+    if names is None:
+        names = simpack.names()
+    extracted = sum(simpack.members[name]['size'] for name in names)
+    written = 0
+    finished = 0
+    remaining = 0
+    for inp, fnames in extraction.qdyn_files(simpack).items():
+        steps, _ = scan.Scan.get_simtime(scan.Scan.clean_lines(
+            simpack.extractfile(inp).splitlines()))
+        if fnames['log'] + '.gz' not in simpack:
+            remaining += steps
+            continue
+        finished += steps
+        for key in ('final', 'energy', 'trajectory', 'log'):
+            if fnames[key] is not None:
+                written += _size(simpack, fnames[key])
+    if finished > 0 and written > 0:
+        bytes_per_step = written / float(finished)
+    return extracted + int(remaining * bytes_per_step), bytes_per_step
+
+
+class Placement(object):
+    """ Scratch reports of the workers, and the simpacks on the tiers """
+
+    def __init__(self, reserve=RESERVE, min_reserve_mb=MIN_RESERVE_MB):
+        self.reserve = reserve
+        self.min_reserve = min_reserve_mb * 1024 * 1024
+        self.reports = {}  # rank: [time, report]
+        self.placed = {}   # rank: [host, tier, bytes, time of placement]
+
+    def update(self, rank, data, now=None):
+        """ Record the report of rank """
+        if data:
+            self.reports[rank] = [time.time() if now is None else now, data]
+
+    def finished(self, rank):
+        """ The simpack of rank has stopped """
+        self.placed.pop(rank, None)
+
+    def forget(self, rank):
+        """ rank has stopped """
+        self.finished(rank)
+        self.reports.pop(rank, None)
+
+    def host(self, rank):
+        """ The host of rank, or None """
+        if rank not in self.reports:
+            return None
+        return self.reports[rank][1]['host']
+
+    def _latest(self, host, tier):
+        """ [tier, free, total, own] of the latest report of host """
+        latest = None
+        for when, data in self.reports.values():
+            if data['host'] != host or (latest and latest[0] > when):
+                continue
+            for entry in data['tiers']:
+                if entry[0] == tier:
+                    latest = (when, entry)
+        return latest[1] if latest else [tier, 0, 0, 0]
+
+    def _own(self, rank, tier, since=0):
+        """ Reported usage of tier by rank, not older than since """
+        when, data = self.reports.get(rank, [0, None])
+        if data is None or when < since:
+            return 0
+        for entry in data['tiers']:
+            if entry[0] == tier:
+                return entry[3]
+        return 0
+
+    def hosts(self):
+        """ The hosts, that have reported """
+        return set(data['host'] for _, data in self.reports.values())
+
+    def available(self, rank, tier):
+        """ Bytes on tier, that a simpack of rank may use """
+        host = self.host(rank)
+        _, free, total, _ = self._latest(host, tier)
+        # the simpack of rank, that is done, is removed
+        free += self._own(rank, tier)
+        for other, (ohost, otier, need, since) in self.placed.items():
+            if other != rank and ohost == host and otier == tier:
+                free -= max(0, need - self._own(other, tier, since))
+        return free - max(self.min_reserve, self.reserve * total)
+
+    def place(self, rank, need, hold=True, now=None):
+        """ Choose the tier for a simpack of need bytes on rank.
+
+        @param hold: return None, if no tier fits, and other simpacks run
+                     on the node
+        @return: the tier; '' if rank has not reported any tier (it stays
+                 where it is); None, to hold back the dispatch
+        """
+        if rank not in self.reports or not self.reports[rank][1]['tiers']:
+            return ''
+        host = self.host(rank)
+        best = None
+        for entry in self.reports[rank][1]['tiers']:
+            available = self.available(rank, entry[0])
+            if available >= need:
+                best = (available, entry[0])
+                break
+            if best is None or available > best[0]:
+                best = (available, entry[0])
+        else:
+            others = [other for other, placed in self.placed.items()
+                      if other != rank and placed[0] == host]
+            if hold and others:
+                return None
+            logger.warning('No scratch tier of %s fits %.1f MB, using %s.',
+                           host, need / 1024. / 1024., best[1])
+        self.placed[rank] = [host, best[1], need,
+                             time.time() if now is None else now]
+        return best[1]
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+"""
+Heartbeats, stragglers and speculative copies of simpacks.
+
+While Qdyn runs, every worker sends a heartbeat with its MD step rate to
+the master, every HEARTBEAT_INTERVAL seconds. A worker is a straggler,
+if its rate is below STRAGGLER_FRACTION of the median rate of all
+workers, or if its last heartbeat is older than HEARTBEAT_TIMEOUT.
+
+When the queue is empty and a worker asks for work, the master starts a
+copy of the simpack of a straggler on it. The copy starts from what is
+archived in the simpack, and writes to its own archive (simpack.spec).
+The first of both to finish wins, the other one is aborted. If the copy
+wins, its archive replaces the simpack.
+
+Author: {0} ({1})
+
+This module is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import time
+
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+logger = tools.getLogger('dyn.speculation')
+
+HEARTBEAT_INTERVAL = 60  # [s] between heartbeats of a worker
+HEARTBEAT_TIMEOUT = 900  # [s] without heartbeat, a worker is a straggler
+STRAGGLER_FRACTION = 0.5  # of the median step rate
+STRAGGLER_MIN_RANKS = 4  # rates needed for a meaningful median
+
+SPEC_SUFFIX = '.spec'  # archive of a copy, must not end with .tar
+
+
+class Heartbeats(object):
+    """ Step rates of the running workers """
+
+    def __init__(self, fraction=STRAGGLER_FRACTION,
+                 timeout=HEARTBEAT_TIMEOUT, min_ranks=STRAGGLER_MIN_RANKS):
+        self.fraction = fraction
+        self.timeout = timeout
+        self.min_ranks = min_ranks
+        self.beats = {}  # rank: [time of last heartbeat, steps done, rate]
+        self.flagged = set()
+
+    def start(self, rank, now=None):
+        """ rank has started a simpack """
+        self.beats[rank] = [time.time() if now is None else now, 0, None]
+        self.flagged.discard(rank)
+
+    def forget(self, rank):
+        """ rank has stopped its simpack """
+        self.beats.pop(rank, None)
+        self.flagged.discard(rank)
+
+    def beat(self, rank, done, rate, now=None):
+        """ Record a heartbeat.
+
+        @param done: MD steps done since the start
+        @param rate: MD steps per second
+        @return: True, if rank became a straggler with this heartbeat
+        """
+        self.beats[rank] = [time.time() if now is None else now, done, rate]
+        if self.is_straggler(rank, now) and rank not in self.flagged:
+            self.flagged.add(rank)
+            return True
+        if not self.is_straggler(rank, now):
+            self.flagged.discard(rank)
+        return False
+
+    def median(self):
+        """ Median step rate, or None if less than min_ranks are known """
+        rates = sorted(beat[2] for beat in self.beats.values()
+                       if beat[2] is not None)
+        if len(rates) < max(1, self.min_ranks):
+            return None
+        return rates[len(rates) // 2]
+
+    def is_straggler(self, rank, now=None):
+        """ Return True, if rank is far below the median, or silent """
+        if rank not in self.beats:
+            return False
+        last, _, rate = self.beats[rank]
+        if (time.time() if now is None else now) - last > self.timeout:
+            return True
+        median = self.median()
+        if median is None or rate is None:
+            return False
+        return rate < self.fraction * median
+
+    def remaining(self, rank, cost):
+        """ Estimated seconds until rank has finished cost MD steps """
+        _, done, rate = self.beats.get(rank, [0, 0, None])
+        if not rate:
+            return float('inf')
+        return max(0, cost - done) / float(rate)
+
+
+class Copy(object):
+    """ A simpack, that is computed by two ranks """
+
+    def __init__(self, simpack, original, copy):
+        self.simpack = simpack
+        self.original = original
+        self.copy = copy
+        self.path = simpack + SPEC_SUFFIX
+        self.reports = {}  # rank: finished
+        self.winner = None
+
+    def other(self, rank):
+        """ The other rank """
+        if rank == self.original:
+            return self.copy
+        return self.original
+
+    def report(self, rank, finished):
+        """ rank has stopped working on the simpack
+
+        @param finished: True, if rank has finished the simpack
+        @return: True, if the other rank has to be aborted
+        """
+        self.reports[rank] = finished
+        if finished and self.winner is None:
+            self.winner = rank
+            return self.other(rank) not in self.reports
+        return False
+
+    def resolved(self):
+        """ True, when both ranks have reported """
+        return len(self.reports) == 2
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+"""
+Prefetch the next simpack of a worker to node-local scratch.
+
+While a worker computes a simpack, the master already tells it which
+simpack comes next. The Prefetcher extracts the latest version of its
+files (see archive.py) into a staging directory under CADEE_TMP, in a
+background thread and with its own IO-ticket. When the worker switches
+to the next simpack, the staged files are moved into the working
+directory instead of being extracted from the shared filesystem.
+
+A staged simpack is only used, if the simpack was not modified since it
+was staged; otherwise it is discarded and extracted again. With a plan,
+only the members it chooses are staged (see extraction.py).
+
+Author: {0} ({1})
+
+This module is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import os
+import shutil
+import threading
+
+import archive
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+logger = tools.getLogger('dyn.staging')
+
+
+def _stat(path):
+    """ Return [size, mtime] of path """
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime]
+
+
+class Prefetcher(object):
+    """ Extract one simpack ahead, into a staging directory """
+
+    def __init__(self, ticket, stage, threaded=True, plan=None, cache=None):
+        """
+        @param ticket: callable, returns IO-ticket context manager
+        @param stage: staging directory, on node-local scratch
+        @param threaded: prefetch in a background thread; if False,
+                         prefetch() does nothing
+        @param plan: callable, returns the names of the members of a
+                     SimpackArchive to stage, or None for all
+        @param cache: nodecache.NodeCache, cached members are linked
+        """
+        self.ticket = ticket
+        self.stage = stage
+        self.threaded = threaded
+        self.plan = plan
+        self.cache = cache
+        self.tarchive = None  # simpack, that is (being) staged
+        self.stat = None      # [size, mtime] of tarchive, when staged
+        self.ready = False
+        self.thread = None
+        if os.path.exists(stage):
+            shutil.rmtree(stage)
+
+    def prefetch(self, tarchive):
+        """ Start staging tarchive in the background.
+        @param tarchive: path to simpack, or None to discard staged files
+        """
+        if tarchive == self.tarchive:
+            return
+        self.discard()
+        if tarchive is None or not self.threaded:
+            return
+        self.tarchive = tarchive
+        self.thread = threading.Thread(target=self._extract, args=(tarchive,),
+                                       name='prefetch')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _extract(self, tarchive):
+        tmp = self.stage + '.tmp'
+        try:
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp)
+            os.makedirs(tmp)
+            stat = _stat(tarchive)
+            simpack = archive.SimpackArchive(tarchive)
+            names = None
+            if self.plan is not None:
+                names = self.plan(simpack)
+            if self.cache is not None:
+                names = self.cache.link(simpack, names, tmp)
+            with self.ticket() as ticket:
+                ticket.nbytes = simpack.extract(names, path=tmp)
+            if self.cache is not None:
+                self.cache.add(simpack, names, tmp)
+            os.rename(tmp, self.stage)
+            self.stat = stat
+            self.ready = True
+            logger.info('Prefetched %s (%6.2f MB) in %5.3fs.', tarchive,
+                        ticket.nbytes / 1024. / 1024., ticket.elapsed)
+        except Exception:
+            logger.exception('Could not prefetch %s', tarchive)
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _join(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def discard(self):
+        """ Remove staged files """
+        self._join()
+        self.tarchive = None
+        self.stat = None
+        self.ready = False
+        if os.path.exists(self.stage):
+            shutil.rmtree(self.stage)
+
+    def take(self, tarchive, path='.'):
+        """ Move staged files of tarchive to path.
+
+        Waits, if tarchive is still being staged.
+        @param tarchive: path to simpack
+        @param path: directory to move the files to
+        @return: True, if staged files were used, else False
+        """
+        if tarchive != self.tarchive:
+            self.discard()
+            return False
+        self._join()
+        if not self.ready or _stat(tarchive) != self.stat:
+            logger.info('Staged copy of %s is not usable.', tarchive)
+            self.discard()
+            return False
+        for fname in os.listdir(self.stage):
+            # path may be on another scratch tier, see scratch.py
+            shutil.move(os.path.join(self.stage, fname),
+                        os.path.join(path, fname))
+        self.discard()
+        return True
@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+
+"""
+Stand-ins for Qdyn6 and Qfep6, to benchmark the ensemble machinery
+without Q and without hours of MD.
+
+The mode depends on the name the script is called with: a link named
+Qfep6 (or anything containing 'qfep') behaves like Qfep, everything else
+like Qdyn. bench_ensemble.py creates the links, or:
+
+    ln -s /path/to/standin_q.py bin/Qdyn6
+    ln -s /path/to/standin_q.py bin/Qfep6
+    export CADEE_QDYN=bin/Qdyn6
+
+Qdyn reads the input file, and writes, while it 'runs' for steps *
+CADEE_STANDIN_STEP_SECONDS seconds:
+    - a log with temperatures and energy summaries every output interval,
+      that trajectory.WorkUnit and qscripts accept
+    - the final restart, the trajectory and the energy file, with the
+      sizes of a system with CADEE_STANDIN_ATOMS atoms (default: from
+      the topology)
+A missing restart terminates abnormally, like Qdyn. With
+CADEE_STANDIN_FAIL (a probability), a step fails with a shake failure.
+
+Qfep reads its input from stdin (see qscripts/q_mapper.py), reads the
+energy files, and prints the four parts, that q_analysemaps parses, for
+a reaction with CADEE_STANDIN_DGA and CADEE_STANDIN_DG0 (kcal/mol).
+
+Only the first rank of a parallel (mpiexec) run writes.
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+from __future__ import print_function
+import math
+import os
+import random
+import struct
+import sys
+import time
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+RANK_VARS = ('OMPI_COMM_WORLD_RANK', 'PMI_RANK', 'PMIX_RANK', 'SLURM_PROCID')
+
+STEP_SECONDS = 0.0005   # [s] per MD step
+DEFAULT_ATOMS = 3000    # if the topology does not tell
+ENERGY_FRAME_BYTES = 208  # per energy interval, 2 states
+NOISE_BYTES = 1024 * 1024  # written repeatedly, not compressible in a window
+CHUNK = 1024 * 1024
+OFFDIAG_ATOMS = (1234, 1235)  # of the Hij function
+
+PART0_HEADER = ("# file             state   pts   lambda    EQtot   EQbond  "
+                "EQang   EQtor   EQimp    EQel   EQvdW  Eel_qq  EvdW_qq "
+                "Eel_qp  EvdW_qp Eel_qw EvdW_qw Eqrstr")
+PART1_HEADER = "# lambda(1)      dGf sum(dGf)      dGr sum(dGr)     <dG>"
+PART2_HEADER = ("# Lambda(1)  bin Energy gap      dGa     dGb     dGg    "
+                "# pts    c1**2    c2**2")
+PART3_HEADER = ("# bin  energy gap  <dGg> <dGg norm> pts  <c1**2> <c2**2> "
+                "<r_xy>")
+
+_NOISE = []
+
+
+def _env(name, default, convert=float):
+    value = os.environ.get(name, '')
+    if value == '':
+        return default
+    return convert(value)
+
+
+def _noise():
+    """ NOISE_BYTES of packed floats, like coordinates """
+    if not _NOISE:
+        rnd = random.Random(42)
+        values = [round(rnd.gauss(0, 20), 3) for _ in range(NOISE_BYTES // 4)]
+        _NOISE.append(struct.pack('<{0}f'.format(len(values)), *values))
+    return _NOISE[0]
+
+
+def write_bytes(fil, nbytes):
+    """ Write nbytes of noise to fil """
+    noise = _noise()
+    while nbytes > 0:
+        chunk = noise[:min(nbytes, CHUNK)]
+        fil.write(chunk)
+        nbytes -= len(chunk)
+
+
+def parse_input(lines):
+    """ Return {section: {key: value}} of a Q input file, the lambdas are
+    in ['lambdas']['values'] """
+    sections = {}
+    section = None
+    for line in lines:
+        line = line.replace('!', '#').split('#')[0].strip()
+        if line == '':
+            continue
+        if line.startswith('['):
+            section = line.strip('[]').lower()
+            sections.setdefault(section, {})
+            continue
+        parts = line.split()
+        if section == 'lambdas':
+            sections[section]['values'] = [float(val) for val in parts]
+        elif section is not None and len(parts) >= 2:
+            sections[section][parts[0].lower()] = parts[1]
+    return sections
+
+
+def topology_atoms(topology):
+    """ Number of atoms in a Q topology, or None """
+    try:
+        with open(topology) as fil:
+            for num, line in enumerate(fil):
+                if 'no. of atoms' in line.lower():
+                    return int(line.split()[0])
+                if num > 100:
+                    break
+    except (IOError, ValueError):
+        pass
+    return None
+
+
+class Qdyn(object):
+    """ The stand-in for Qdyn """
+
+    def __init__(self, inputfile, out=sys.stdout):
+        with open(inputfile) as fil:
+            self.inp = parse_input(fil)
+        self.inputfile = inputfile
+        self.out = out
+        md = self.inp.get('md', {})
+        intervals = self.inp.get('intervals', {})
+        self.files = self.inp.get('files', {})
+        self.steps = int(md.get('steps', 0))
+        self.stepsize = float(md.get('stepsize', 1))
+        self.temperature = float(md.get('temperature', 300))
+        self.output = max(1, int(intervals.get('output', 5)))
+        self.energy = int(intervals.get('energy', 0))
+        self.trajectory = int(intervals.get('trajectory', 0))
+        self.lambdas = self.inp.get('lambdas', {}).get('values', [1., 0.])
+        self.atoms = int(_env('CADEE_STANDIN_ATOMS', 0, int) or
+                         topology_atoms(self.files.get('topology', '')) or
+                         DEFAULT_ATOMS)
+        self.step_seconds = _env('CADEE_STANDIN_STEP_SECONDS', STEP_SECONDS)
+        self.rnd = random.Random(_env('CADEE_STANDIN_SEED', None, int))
+        self.fail = _env('CADEE_STANDIN_FAIL', 0.)
+
+    def write(self, text=''):
+        self.out.write(text + '\n')
+
+    def header(self):
+        """ The header, as far as qscripts parses it """
+        self.write('QDyn version 5.06')
+        self.write('Stand-in for Qdyn (standin_q.py), nothing is computed.')
+        self.write()
+        self.write('Build number 6.0.1')
+        self.write()
+        self.write('Topology file      = {0}'.format(
+            self.files.get('topology')))
+        self.write('Number of MD steps = {0:8d}  Stepsize (fs)    = '
+                   '{1:8.3f}'.format(self.steps, self.stepsize))
+        if 'fep' in self.files:
+            self.write('FEP input file     = {0}'.format(self.files['fep']))
+            self.write('No. of fep/evb states    = {0:5d}'.format(
+                len(self.lambdas)))
+        self.write('No. of offdiagonal (Hij) functions =     1')
+        self.write('    state i, j  atom i, j       A_ij     mu_ij')
+        self.write('          1  2     {0:5d} {1:5d}   10.00      0.00'.format(
+            *OFFDIAG_ATOMS))
+        self.write()
+        for key in sorted(self.files):
+            self.write('  {0:20s} {1}'.format(key, self.files[key]))
+        # a Q log has a long header: the topology, restraints, pair lists
+        for num in range(100):
+            self.write('  atom {0:6d} in the stand-in system'.format(num))
+        self.write()
+        self.write('Initialising dynamics')
+
+    def summary(self, step, seconds):
+        """ The output of Qdyn at step """
+        rnd = self.rnd
+        temp = self.temperature + rnd.gauss(0, 2)
+        self.write('Temperature at step{0:8d}: T_tot={1:10.1f} T_free='
+                   '{2:10.1f}'.format(step, temp, temp))
+        self.write('                       T_free_solute={0:10.1f} '
+                   'T_free_solvent={1:10.1f}'.format(temp, temp))
+        self.write('======================= Energy summary at step {0:8d} '
+                   '========================'.format(step))
+        self.write('type                   el       vdW      bond     angle  '
+                   ' torsion  improper')
+        for key, num in (('solute', 6), ('solvent', 6),
+                         ('solute-solvent', 2), ('LRF', 1), ('Q-atom', 6)):
+            self.write('{0:14s}'.format(key) + ''.join(
+                '{0:10.2f}'.format(rnd.gauss(-100, 10)) for _ in range(num)))
+        pot = rnd.gauss(-5000, 20)
+        kin = rnd.gauss(1000, 10)
+        self.write('{0:14s}{1:10.2f}{2:10.2f}{3:10.2f}'.format(
+            'SUM', pot + kin, pot, kin))
+        self.write('=' * 74)
+        if 'fep' in self.files:
+            self.write('=========================== Q-atom energies at step '
+                       '{0:8d} ==========================='.format(step))
+            self.write('type      st lambda        el       vdW      bond     '
+                       'angle   torsion  improper')
+            for key, num in (('Q-Q', 2), ('Q-prot', 2), ('Q-wat', 2),
+                             ('Q-surr.', 2), ('Q-any', 6), ('Q-SUM', 2)):
+                for state, lamb in enumerate(self.lambdas):
+                    self.write('{0:10s}{1:2d}{2:7.4f}'.format(
+                        key, state + 1, lamb) + ''.join(
+                            '{0:10.2f}'.format(rnd.gauss(-50, 5))
+                            for _ in range(num)))
+            self.write('H( 1, 2) = 10.00 dist. between Q-atoms {0} {1} = '
+                       '{2:.2f}'.format(OFFDIAG_ATOMS[0], OFFDIAG_ATOMS[1],
+                                        rnd.gauss(3, 0.2)))
+            self.write('=' * 74)
+        self.write('Seconds per step (wall-clock): {0:.6f}'.format(seconds))
+        self.out.flush()
+
+    def abnormal(self, msg):
+        self.write(msg)
+        self.write('>>> ABNORMAL TERMINATION of Qdyn5')
+        self.out.flush()
+        return 1
+
+    def run(self):
+        """ 'Compute', return the exit code """
+        self.header()
+        for key in ('restart', 'restraint'):
+            if key in self.files and not os.path.isfile(self.files[key]):
+                return self.abnormal('>>>>> ERROR: Failed to open {0} file '
+                                     '{1}'.format(key, self.files[key]))
+        fail_at = None
+        if self.rnd.random() < self.fail:
+            fail_at = self.rnd.randint(0, self.steps)
+
+        energy = dcd = None
+        if self.energy and 'energy' in self.files:
+            energy = open(self.files['energy'], 'wb')
+        if self.trajectory and 'trajectory' in self.files:
+            dcd = open(self.files['trajectory'], 'wb')
+            write_bytes(dcd, 276)  # the header of a dcd
+        try:
+            step = 0
+            self.summary(0, 0.)
+            while step < self.steps:
+                chunk = min(self.output, self.steps - step)
+                start = time.time()
+                time.sleep(chunk * self.step_seconds)
+                if energy is not None:
+                    frames = ((step + chunk) // self.energy -
+                              step // self.energy)
+                    write_bytes(energy, frames * ENERGY_FRAME_BYTES)
+                if dcd is not None:
+                    frames = ((step + chunk) // self.trajectory -
+                              step // self.trajectory)
+                    write_bytes(dcd, frames * (self.atoms * 12 + 8))
+                step += chunk
+                if fail_at is not None and step >= fail_at:
+                    self.write('>>> WARNING: Shake failure at step '
+                               '{0}'.format(step))
+                    self.write('Terminating due to shake failure')
+                    self.out.flush()
+                    return 1
+                self.summary(step, (time.time() - start) / chunk)
+        finally:
+            for fil in (energy, dcd):
+                if fil is not None:
+                    fil.close()
+        if 'final' in self.files:
+            with open(self.files['final'], 'wb') as fil:
+                # coordinates and velocities in double precision
+                write_bytes(fil, 2 * self.atoms * 24 + 64)
+        self.write()
+        self.write('Qdyn5 terminated normally.')
+        self.out.flush()
+        return 0
+
+
+def well(pos, dga, dg0):
+    """ Free energy along the reaction coordinate pos in [0, 1]:
+    reactants at 0.25 (0), transition state at 0.5 (dga), products at 0.75
+    (dg0) """
+    if pos <= 0.5:
+        return dga * (1 - math.cos(4 * math.pi * (pos - 0.25))) / 2.
+    return dg0 + (dga - dg0) * (1 - math.cos(4 * math.pi * (pos - 0.75))) / 2.
+
+
+def qfep(lines, out=sys.stdout):
+    """ The stand-in for Qfep, lines are its input; return the exit code """
+    lines = [line.split('#')[0].strip() for line in lines]
+    lines = [line for line in lines if line != '']
+    out.write('# Qfep stand-in (standin_q.py), nothing is computed.\n')
+    if len(lines) < 9:
+        out.write('>>> ABNORMAL TERMINATION: incomplete input\n')
+        return 1
+    frames = int(lines[0].split()[0])
+    bins = int(lines[3].split()[0])
+    enfiles = lines[9:9 + frames]
+    dga = _env('CADEE_STANDIN_DGA', 15.)
+    dg0 = _env('CADEE_STANDIN_DG0', -5.)
+
+    sizes = []
+    for enfile in enfiles:
+        nbytes = 0
+        with open(enfile, 'rb') as fil:
+            while True:
+                chunk = fil.read(CHUNK)
+                if not chunk:
+                    break
+                nbytes += len(chunk)
+        sizes.append(nbytes)
+    time.sleep(_env('CADEE_STANDIN_QFEP_SECONDS', 0.))
+
+    out.write('# Part 0: Average energies for all states in all files\n')
+    out.write(PART0_HEADER + '\n')
+    for num, (enfile, nbytes) in enumerate(zip(enfiles, sizes)):
+        lamb = 1. - num / float(max(1, frames - 1))
+        pts = max(1, nbytes // ENERGY_FRAME_BYTES)
+        out.write('--> Name of file number {0:4d}: {1}\n'.format(num + 1,
+                                                              enfile))
+        for state in (1, 2):
+            out.write('{0:17s} {1:6d}{2:6d}{3:9.4f}'.format(
+                enfile, state, pts, lamb if state == 1 else 1 - lamb) +
+                ''.join('{0:8.2f}'.format(-10. * state) for _ in range(14)) +
+                '\n')
+
+    out.write('# Part 1: Free energy perturbation summary:\n')
+    out.write(PART1_HEADER + '\n')
+    total = 0.
+    for num in range(frames):
+        lamb = 1. - num / float(max(1, frames - 1))
+        step = dg0 / max(1, frames - 1) if num else 0.
+        total += step
+        out.write('{0:9.6f}{1:9.3f}{2:9.3f}{3:9.3f}{4:9.3f}{5:9.3f}\n'.format(
+            lamb, step, total, -step, dg0 - total, total))
+
+    out.write('# Part 2: Reaction free energy summary:\n')
+    out.write(PART2_HEADER + '\n')
+    for num in range(bins):
+        pos = (num + 0.5) / bins
+        out.write('{0:9.6f}{1:5d}{2:9.2f}{3:9.2f}{4:9.2f}{5:9.2f}{6:5d}'
+                  '{7:9.3f}{8:9.3f}\n'.format(
+                      1 - pos, num + 1, 200 * (pos - 0.5), 0., 0.,
+                      well(pos, dga, dg0), 100, 1 - pos, pos))
+
+    out.write('# Part 3: Bin-averaged summary:\n')
+    out.write(PART3_HEADER + '\n')
+    for num in range(bins):
+        pos = (num + 0.5) / bins
+        dgg = well(pos, dga, dg0)
+        out.write('{0:5d}{1:9.2f}{2:9.2f}{3:9.2f}{4:5d}{5:9.3f}{6:9.3f}'
+                  '{7:9.3f}\n'.format(num + 1, 200 * (pos - 0.5), dgg, dgg,
+                                      100, 1 - pos, pos, 0.))
+    out.flush()
+    return 0
+
+
+def main(argv):
+    if 'qfep' in os.path.basename(argv[0]).lower():
+        return qfep(sys.stdin.readlines())
+
+    rank = 0
+    for name in RANK_VARS:
+        if name in os.environ:
+            rank = int(os.environ[name])
+            break
+    if len(argv) < 2 or not os.path.isfile(argv[1]):
+        print('>>> ABNORMAL TERMINATION of Qdyn5: no input file')
+        return 1
+    if rank != 0:
+        # the other ranks of a parallel run do not write
+        return 0
+    return Qdyn(argv[1]).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
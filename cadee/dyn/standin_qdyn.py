@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""
+Stand-in for Qdyn6p, to test the placement of multi-core simpacks.
+
+Every process prints where it runs: host, pid, rank and size of its MPI
+job (from the environment of the launcher), and the cpus it may use.
+Then it sleeps for CADEE_STANDIN_SLEEP seconds (default: 1). Use it with:
+
+    export CADEE_QDYN_PARALLEL=/path/to/standin_qdyn.py
+
+It does not compute anything, and does not write a valid Q logfile.
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+from __future__ import print_function
+from platform import node as hostname
+import os
+import sys
+import time
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+RANK_VARS = ('OMPI_COMM_WORLD_RANK', 'PMI_RANK', 'PMIX_RANK', 'SLURM_PROCID')
+SIZE_VARS = ('OMPI_COMM_WORLD_SIZE', 'PMI_SIZE', 'SLURM_NTASKS')
+
+
+def _first(names, default):
+    for name in names:
+        if name in os.environ:
+            return os.environ[name]
+    return default
+
+
+def _cpus():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('Cpus_allowed_list:'):
+                    return line.split(':', 1)[1].strip()
+    except IOError:
+        pass
+    return '?'
+
+
+def main():
+    print('PLACEMENT host={0} pid={1} rank={2} size={3} cpus={4} input={5}'
+          .format(hostname(), os.getpid(), _first(RANK_VARS, 0),
+                  _first(SIZE_VARS, 1), _cpus(), ' '.join(sys.argv[1:])))
+    sys.stdout.flush()
+    time.sleep(float(os.environ.get('CADEE_STANDIN_SLEEP', 1)))
+
+
+if __name__ == "__main__":
+    main()
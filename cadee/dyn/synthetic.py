@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""
+Synthetic simpacks, for benchmarks with the stand-ins of standin_q.py.
+
+The inputs are those of a simpack template (see simpack_templates/ and
+cadee/prep/create_template_based_simpack.py), the topology and the fep
+file are synthetic: they have the size of a system with the given number
+of atoms, but no content Q could use. With steps_scale, the number of MD
+steps of every input is scaled, eg. 0.01 for short benchmarks.
+
+    python synthetic.py /tmp/bench --mutants 16 --replicas 4 --atoms 20000
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import tarfile
+import tempfile
+
+import archive
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+logger = tools.getLogger('dyn.synthetic')
+
+TEMPLATE = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    '../lib/simpack_template_12ns_100ps_8000ps_4160ps.tar.bz2')
+
+ATOMS = 3000
+SOLUTE_FRACTION = 0.3  # of the atoms
+FEP_ATOMS = 20
+
+
+def topology(atoms):
+    """ A synthetic Q topology of atoms atoms: the header, that
+    packing.topology_atoms reads, and one line per atom """
+    lines = ['Synthetic Q topology (synthetic.py), not usable by Q.',
+             '{0:8d}{1:8d}    No. of atoms, no. of solute atoms'.format(
+                 atoms, int(atoms * SOLUTE_FRACTION))]
+    for num in range(atoms):
+        lines.append('{0:10.3f}{1:10.3f}{2:10.3f}{3:6d}{4:8.4f}'.format(
+            num % 97 * 0.5, num % 89 * 0.5, num % 83 * 0.5, num % 24 + 1,
+            (num % 7 - 3) * 0.1))
+    return '\n'.join(lines) + '\n'
+
+
+def fep(atoms=FEP_ATOMS):
+    """ A synthetic fep file with 2 states and atoms Q-atoms """
+    lines = ['[FEP]', 'states 2', '', '[atoms]']
+    for num in range(atoms):
+        lines.append('{0:4d} {1:6d}'.format(num + 1, 1000 + num))
+    return '\n'.join(lines) + '\n'
+
+
+def scale_steps(text, scale):
+    """ Return the Q input text, with the MD steps scaled by scale """
+    lines = []
+    section = None
+    for line in text.splitlines(True):
+        stripped = line.strip()
+        if stripped.startswith('['):
+            section = stripped.lower()
+        parts = stripped.split()
+        if (section == '[md]' and len(parts) >= 2 and
+                parts[0].lower() == 'steps'):
+            steps = max(1, int(round(int(parts[1]) * scale)))
+            line = line.replace(parts[1], str(steps), 1)
+        lines.append(line)
+    return ''.join(lines)
+
+
+def simpack(path, template=TEMPLATE, atoms=ATOMS, steps_scale=1.):
+    """ Create the simpack path, from the inputs in template """
+    path = os.path.abspath(path)
+    wd = os.getcwd()
+    tmp = tempfile.mkdtemp()
+    try:
+        os.chdir(tmp)
+        with tarfile.open(template) as tar:
+            for member in tar.getmembers():
+                if not member.name.endswith('.inp') or not member.isfile():
+                    continue
+                text = tar.extractfile(member).read()
+                name = os.path.basename(member.name)
+                with open(name, 'w') as fil:
+                    fil.write(scale_steps(text, steps_scale))
+        with open('mutant.top', 'w') as fil:
+            fil.write(topology(atoms))
+        with open('mutant.fep', 'w') as fil:
+            fil.write(fep())
+        archive.SimpackArchive(path).append(sorted(os.listdir('.')))
+    finally:
+        os.chdir(wd)
+        shutil.rmtree(tmp)
+    return path
+
+
+def generate(folder, mutants, replicas=1, template=TEMPLATE, atoms=ATOMS,
+             steps_scale=1.):
+    """ Create mutants * replicas simpacks in folder
+
+    The simpacks are named like simpacks of cadee prep: {mutant}_{replik}.tar
+
+    @param atoms: an int, or a list with the atoms of every mutant
+    @return: list of the simpacks
+    """
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    if isinstance(atoms, int):
+        atoms = [atoms] * mutants
+    simpacks = []
+    for num in range(mutants):
+        for replik in range(replicas):
+            name = 'S{0:04d}_{1}.tar'.format(num, replik)
+            simpacks.append(simpack(os.path.join(folder, name), template,
+                                    atoms[num], steps_scale))
+    logger.info('Created %s synthetic simpacks in %s.', len(simpacks), folder)
+    return simpacks
+
+
+def main():
+    parser = argparse.ArgumentParser('CADEE: synthetic simpacks.')
+    parser.add_argument('folder', help='where the simpacks are created')
+    parser.add_argument('--mutants', type=int, default=8)
+    parser.add_argument('--replicas', type=int, default=1)
+    parser.add_argument('--atoms', type=int, default=ATOMS)
+    parser.add_argument('--steps_scale', type=float, default=1.,
+                        help='scale the MD steps of all inputs')
+    parser.add_argument('--template', default=TEMPLATE,
+                        help='simpack template (default: %(default)s)')
+    args = parser.parse_args()
+    generate(args.folder, args.mutants, args.replicas, args.template,
+             args.atoms, args.steps_scale)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+"""
+This are unittests for archive.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import hashlib
+import os
+import shutil
+import tarfile
+import tempfile
+import archive
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+
+class DummyTicket(object):
+    def __init__(self):
+        self.nbytes = 0
+        self.elapsed = 0.
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        pass
+
+
+class MyArchiveTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp)
+        self.tar = os.path.join(self.tmp, 'wt_0.tar')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
+
+    @staticmethod
+    def _write(fname, content):
+        with open(fname, 'w') as fil:
+            fil.write(content)
+
+    def test_append_and_extract_latest(self):
+        self._write('eq1.inp', 'steps 10\n')
+        self._write('eq1.log', 'first')
+        simpack = archive.SimpackArchive(self.tar)
+        simpack.append(['eq1.inp', 'eq1.log'], {'eq1.log': 'abc'})
+        self._write('eq1.log', 'second version')
+        simpack.append(['eq1.log'])
+
+        # the tar is a plain tar, with both versions
+        tar = tarfile.open(self.tar)
+        self.assertEqual(tar.getnames(), ['eq1.inp', 'eq1.log', 'eq1.log'])
+        tar.close()
+
+        simpack = archive.SimpackArchive(self.tar)
+        self.assertEqual(simpack.extractfile('eq1.log'), 'second version')
+        # digests, that are not given, are computed while appending
+        self.assertEqual(simpack.digest('eq1.log'),
+                         hashlib.md5('second version').hexdigest())
+        self.assertEqual(simpack.digest('eq1.inp'), tools.md5sum('eq1.inp'))
+
+        os.mkdir('out')
+        simpack.extract(path='out')
+        self.assertEqual(sorted(os.listdir('out')), ['eq1.inp', 'eq1.log'])
+        self.assertEqual(open('out/eq1.log').read(), 'second version')
+
+    def test_rebuild_legacy_tar(self):
+        self._write('eq1.inp', 'steps 10\n')
+        tar = tarfile.open(self.tar, 'w')
+        tar.add('eq1.inp')
+        tar.close()
+        simpack = archive.SimpackArchive(self.tar)
+        self.assertEqual(simpack.names(), ['eq1.inp'])
+        self.assertTrue(os.path.exists(self.tar + archive.INDEX_SUFFIX))
+        # the node cache needs the digests of the inputs
+        self.assertEqual(simpack.digest('eq1.inp'),
+                         hashlib.md5('steps 10\n').hexdigest())
+
+        # modified with tarfile: the index is stale and rebuilt
+        self._write('eq2.inp', 'steps 20\n')
+        tar = tarfile.open(self.tar, 'a')
+        tar.add('eq2.inp')
+        tar.close()
+        simpack = archive.SimpackArchive(self.tar)
+        self.assertEqual(simpack.extractfile('eq2.inp'), 'steps 20\n')
+        simpack.append(['eq1.inp'])
+        tar = tarfile.open(self.tar)
+        self.assertEqual(tar.getnames(), ['eq1.inp', 'eq2.inp', 'eq1.inp'])
+        tar.close()
+
+    def test_truncated_append(self):
+        self._write('eq1.inp', 'steps 10\n')
+        self._write('eq1.re', 'x' * 5000)
+        simpack = archive.SimpackArchive(self.tar)
+        simpack.append(['eq1.inp'])
+        end = simpack.end
+        simpack.append(['eq1.re'])
+        # simulate a crash while appending eq1.re
+        with open(self.tar, 'r+b') as fil:
+            fil.truncate(end + 2048)
+        simpack = archive.SimpackArchive(self.tar)
+        self.assertEqual(simpack.names(), ['eq1.inp'])
+        self.assertEqual(simpack.end, end)
+        simpack.append(['eq1.re'])
+        tar = tarfile.open(self.tar)
+        self.assertEqual(tar.getnames(), ['eq1.inp', 'eq1.re'])
+        self.assertEqual(tar.extractfile('eq1.re').read(), 'x' * 5000)
+        tar.close()
+
+    def test_replace(self):
+        self._write('eq1.log', 'original')
+        archive.SimpackArchive(self.tar).append(['eq1.log'])
+        self._write('eq1.log', 'copy')
+        archive.SimpackArchive(self.tar + '.spec').append(['eq1.log'])
+        archive.replace(self.tar + '.spec', self.tar)
+        self.assertEqual(archive.SimpackArchive(self.tar).extractfile(
+            'eq1.log'), 'copy')
+        self.assertFalse(os.path.exists(self.tar + '.spec.idx'))
+        archive.remove(self.tar)
+        archive.remove(self.tar)
+        self.assertEqual(os.listdir(self.tmp), ['eq1.log'])
+
+    def test_archiver_snapshot(self):
+        self._write('eq1.log.gz', 'log')
+        self._write('eq1.re', 'restart')
+        done = []
+        stage = os.path.join(self.tmp, 'stage')
+        archiver = archive.Archiver(
+            DummyTicket, stage, done=lambda path, ticket: done.append(path))
+        archiver.submit(self.tar, ['eq1.re', 'eq1.log.gz'])
+        # changes after the snapshot do not end up in this append
+        os.remove('eq1.re')
+        self._write('eq1.re', 'changed')
+        archiver.submit(self.tar, ['eq1.re'])
+        archiver.close()
+        self.assertEqual(done, [self.tar, self.tar])
+        self.assertEqual(os.listdir('stage'), [])
+        tar = tarfile.open(self.tar)
+        self.assertEqual(tar.getnames(), ['eq1.re', 'eq1.log.gz', 'eq1.re'])
+        self.assertEqual(tar.extractfile(tar.getmembers()[0]).read(),
+                         'restart')
+        tar.close()
+
+    def test_compressed_members(self):
+        self._write('eq1.inp', 'steps 10\n')
+        self._write('eq1.dcd', 'frame' * 1000)
+        os.utime('eq1.dcd', (1000, 1000))
+        os.mkdir('snap')
+        archive.snapshot(['eq1.inp', 'eq1.dcd'], 'snap')
+        codecs = archive.compress(['eq1.inp', 'eq1.dcd'],
+                                  archive.parse_compression('dcd=gz:1'),
+                                  'snap')
+        self.assertEqual(codecs, {'eq1.dcd': ['gz', 5000]})
+        # the hardlinked original is unchanged
+        self.assertEqual(open('eq1.dcd').read(), 'frame' * 1000)
+        simpack = archive.SimpackArchive(self.tar)
+        appended = simpack.append(['eq1.inp', 'eq1.dcd'], root='snap',
+                                  codecs=codecs)
+        self.assertTrue(appended < 5000)
+
+        # tar sees the compressed file
+        tar = tarfile.open(self.tar)
+        self.assertEqual(tar.getnames(), ['eq1.inp', 'eq1.dcd.gz'])
+        tar.close()
+
+        # the index refers to the original, also after a rebuild
+        os.remove(self.tar + archive.INDEX_SUFFIX)
+        simpack = archive.SimpackArchive(self.tar)
+        self.assertEqual(sorted(simpack.names()), ['eq1.dcd', 'eq1.inp'])
+        self.assertEqual(simpack.members['eq1.dcd']['size'], 5000)
+        self.assertEqual(simpack.extractfile('eq1.dcd'), 'frame' * 1000)
+        os.mkdir('out')
+        nbytes = simpack.extract(['eq1.dcd'], path='out')
+        self.assertTrue(nbytes < 5000)
+        self.assertEqual(open('out/eq1.dcd').read(), 'frame' * 1000)
+        self.assertEqual(os.path.getmtime('out/eq1.dcd'), 1000)
+
+    def test_parse_compression(self):
+        self.assertEqual(archive.parse_compression(None), {})
+        self.assertEqual(archive.parse_compression('dcd=gz:1,.RE=bz2:9'),
+                         {'.dcd': ('gz', 1), '.re': ('bz2', 9)})
+        self.assertEqual(
+            sorted(archive.parse_compression(archive.DEFAULT_COMPRESSION)),
+            ['.dcd', '.en', '.re'])
+        self.assertRaises(ValueError, archive.parse_compression, 'dcd=gz')
+        self.assertRaises(ValueError, archive.parse_compression, 'dcd=zip:1')
+
+    def test_archiver_compression(self):
+        self._write('eq1.re', 'restart' * 100)
+        stage = os.path.join(self.tmp, 'stage')
+        archiver = archive.Archiver(
+            DummyTicket, stage, threaded=False,
+            compression=archive.parse_compression('re=bz2:9'))
+        archiver.submit(self.tar, ['eq1.re'])
+        self.assertEqual(open('eq1.re').read(), 'restart' * 100)
+        simpack = archive.SimpackArchive(self.tar)
+        self.assertEqual(simpack.members['eq1.re']['codec'], 'bz2')
+        self.assertEqual(simpack.extractfile('eq1.re'), 'restart' * 100)
+
+    def test_archiver_failed(self):
+        self._write('eq1.re', 'restart')
+        stage = os.path.join(self.tmp, 'stage')
+        archiver = archive.Archiver(DummyTicket, stage, threaded=False)
+        archiver.submit(os.path.join(self.tmp, 'missing', 'wt_0.tar'),
+                        ['eq1.re'])
+        self.assertEqual(archiver.pop_failed(), ['eq1.re'])
+        self.assertEqual(archiver.pop_failed(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+This are unittests for compression.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import gzip
+import os
+import shutil
+import tempfile
+
+import compression
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+SKIP = 'skip me'
+COUNT = 'hot atom'
+
+
+def write_log(fname, lines):
+    with open(fname, 'w') as fil:
+        for num in range(lines):
+            fil.write('step {0} energy {1}\n'.format(num, num * 0.5))
+            if num % 1000 == 0:
+                fil.write(COUNT + ' {0}\n'.format(num))
+        fil.write(SKIP)
+
+
+class MyCompressionTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+
+    def tearDown(self):
+        os.chdir('/')
+        shutil.rmtree(self.tmp)
+
+    def test_parse(self):
+        self.assertEqual(compression.parse('log=gz:9,en=gz:1'),
+                         {'.log': ('gz', 9), '.en': ('gz', 1)})
+        self.assertRaises(ValueError, compression.parse, 'log=bz2:9')
+        self.assertEqual(compression.level({'.en': ('gz', 1)}, 'a.en'), 1)
+        self.assertEqual(compression.level({}, 'a.log'),
+                         compression.DEFAULT_LEVEL)
+
+    def test_gzip_file(self):
+        write_log('md.log', 5000)
+        found = compression.gzip_file('md.log', 6, [SKIP], COUNT)
+        self.assertEqual(found, 5)
+        self.assertFalse(os.path.exists('md.log'))
+        self.assertFalse(os.path.exists('md.log' + compression.TMP))
+        lines = gzip.open('md.log.gz').readlines()
+        self.assertEqual(len(lines), 5005)
+        self.assertNotIn(SKIP, lines)
+
+    def test_blocks(self):
+        # many small blocks, compressed by threads, are one gzip file
+        old = compression.BLOCK_SIZE, compression.BLOCK_MIN
+        compression.BLOCK_SIZE, compression.BLOCK_MIN = 4096, 0
+        try:
+            write_log('md.log', 20000)
+            with open('md.log') as fil:
+                data = fil.read()
+            compressor = compression.Compressor(threads=3)
+            found = []
+            compressor.submit('md.log', [SKIP], COUNT,
+                              lambda fname, num: found.append(num))
+            compressor.flush()
+        finally:
+            compression.BLOCK_SIZE, compression.BLOCK_MIN = old
+        self.assertEqual(found, [20])
+        self.assertEqual(gzip.open('md.log.gz').read(),
+                         data[:-len(SKIP)])
+        self.assertFalse(compressor.is_pending('md.log'))
+        self.assertEqual(compressor.files, 1)
+        self.assertTrue(compressor.saved() >= 0.)
+
+    def test_failure(self):
+        compressor = compression.Compressor(background=False)
+        compressor.submit('missing.en', done=self.fail)
+        self.assertEqual(compressor.errors, 1)
+        self.assertFalse(compressor.is_pending('missing.en'))
+        self.assertFalse(os.path.exists('missing.en' + compression.TMP))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+"""
+This are unittests for ensemble.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import os
+import shutil
+import signal
+import tempfile
+import time
+import archive
+import ensemble
+import jobqueue
+import mpi
+import scan
+import synthetic
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+
+class _Compressor(object):
+    """ Finishes compressing fname, right after cwd was listed """
+    def __init__(self, fname):
+        self.fname = fname
+
+    def is_pending(self, fname):
+        if fname == self.fname and os.path.exists(fname):
+            os.remove(fname)
+        return False
+
+
+class _Pending(object):
+    """ Compresses nothing """
+    def is_pending(self, fname):
+        return False
+
+
+class _Request(object):
+    """ Receive of _Comm, false once completed, like MPI_REQUEST_NULL """
+    def __init__(self, source, tag):
+        self.source = source
+        self.tag = tag
+        self.message = None
+        self.active = True
+
+    def __nonzero__(self):
+        return self.active
+
+
+class _Comm(object):
+    """ Queues the posted receives, records the sends """
+    def __init__(self):
+        self.posted = []
+        self.sent = []
+
+    def irecv(self, buf, source, tag):
+        request = _Request(source, tag)
+        self.posted.append(request)
+        return request
+
+    def send(self, data, dest, tag):
+        self.sent.append((tag, dest, data))
+
+    def deliver(self, tag, source, data):
+        """ Complete the first active receive, that matches """
+        for request in self.posted:
+            if (request and request.message is None and request.tag == tag
+                    and request.source in (source, ensemble.ANY_SOURCE)):
+                request.message = (source, data)
+                return
+        raise ValueError('no receive posted', tag, source)
+
+
+class _Status(object):
+    def Get_source(self):
+        return self.source
+
+
+class _Requests(object):
+    """ MPI.Request.waitany and testany of _Request """
+    @staticmethod
+    def testany(requests, status):
+        for idx, request in enumerate(requests):
+            if request and request.message is not None:
+                request.active = False
+                status.source, data = request.message
+                return idx, True, data
+        return _MPI.UNDEFINED, False, None
+
+    @staticmethod
+    def waitany(requests, status):
+        if not any(requests):
+            return _MPI.UNDEFINED, None
+        idx, flag, data = _Requests.testany(requests, status)
+        if not flag:
+            raise AssertionError('waitany would block forever')
+        return idx, data
+
+
+class _MPI(object):
+    """ The parts of mpi4py.MPI, that Listener uses """
+    UNDEFINED = -32766
+    Status = _Status
+    Request = _Requests
+
+
+class MyEnsembleTests(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
+
+    def test_files_to_store_vanished(self):
+        for fname in ('eq1.re', 'eq1.log'):
+            with open(fname, 'w') as fil:
+                fil.write('data')
+        worker = ensemble.Worker.__new__(ensemble.Worker)
+        worker.exe = 'Qdyn6'
+        worker.saved_files = {}
+        worker.compressor = _Compressor('eq1.log')
+        names = [fil[0] for fil in worker._check_files_to_store()]
+        self.assertEqual(names, ['eq1.re'])
+
+    def test_files_to_store_rehash(self):
+        for fname in ('eq1.re', 'eq2.re', 'eq3.re'):
+            with open(fname, 'w') as fil:
+                fil.write('data')
+        worker = ensemble.Worker.__new__(ensemble.Worker)
+        worker.exe = 'Qdyn6'
+        worker.saved_files = {}
+        worker.compressor = _Pending()
+        # stored with digests, like the files extracted from a simpack
+        for fname, mtim, _, size, inode in worker._check_files_to_store():
+            worker._saved(fname, mtim, tools.md5sum(fname), size, inode)
+
+        hashed = []
+        md5sum = tools.md5sum
+
+        def counting_md5sum(fname):
+            hashed.append(fname)
+            return md5sum(fname)
+
+        tools.md5sum = counting_md5sum
+        try:
+            # unchanged: neither stored nor read
+            self.assertEqual(worker._check_files_to_store(), [])
+            self.assertEqual(hashed, [])
+
+            # same size, but touched: rehashed
+            stat = os.stat('eq1.re')
+            os.utime('eq1.re', (stat.st_atime, stat.st_mtime + 10))
+            with open('eq2.re', 'w') as fil:
+                fil.write('DATA')
+            os.utime('eq2.re', (stat.st_atime, stat.st_mtime + 10))
+            to_store = worker._check_files_to_store()
+            self.assertEqual(sorted(hashed), ['eq1.re', 'eq2.re'])
+            self.assertEqual([fil[0] for fil in to_store], ['eq2.re'])
+            self.assertEqual(to_store[0][2], md5sum('eq2.re'))
+
+            # touched, but the same content: not hashed again
+            del hashed[:]
+            self.assertEqual(worker._check_files_to_store(), to_store)
+            self.assertEqual(hashed, ['eq2.re'])
+        finally:
+            tools.md5sum = md5sum
+
+    def test_enqueue_restart(self):
+        simpacks = synthetic.generate(self.tmp, 2, steps_scale=0.001)
+        name = os.path.join(self.tmp, jobqueue.QUEUE_DB)
+        master = ensemble.Master.__new__(ensemble.Master)
+        master.queue = jobqueue.JobQueue(name, 'a')
+        master.enqueue(simpacks)
+        total = master.queue.costs()[0]
+        self.assertEqual(master.queue.costs(), [total, total])
+        master.queue.close()
+
+        # the first step of S0001 was computed before the restart
+        pack = archive.SimpackArchive(simpacks[1])
+        first = sorted(fname for fname in pack.names()
+                       if fname.endswith('.inp'))[0]
+        log = os.path.basename(first)[:-4] + '.log.gz'
+        with open(log, 'w') as fil:
+            fil.write('log')
+        pack.append([log])
+
+        master.queue = jobqueue.JobQueue(name, 'b')
+        master.enqueue(simpacks)
+        self.assertEqual(master.queue.lease(), (simpacks[0], total))
+        simpack, cost = master.queue.lease()
+        self.assertEqual(simpack, simpacks[1])
+        self.assertTrue(0 < cost < total)
+        master.queue.close()
+
+    def test_timeout_renews_leases(self):
+        master = ensemble.Master.__new__(ensemble.Master)
+        master.queue = jobqueue.JobQueue(
+            os.path.join(self.tmp, jobqueue.QUEUE_DB), 'a', lease_timeout=40)
+        master.held = []
+        # no message for a long time: wake up to renew the leases
+        self.assertTrue(0 < master._timeout() <= 10)
+        master.queue.close()
+
+    def _listener(self):
+        listener = ensemble.Listener()
+        listener.comm = _Comm()
+        listener.listen = [(mpi.Tags.DONE, ensemble.ANY_SOURCE),
+                           (mpi.Tags.LOG, ensemble.ANY_SOURCE),
+                           (mpi.Tags.IO_TICKET, 0)]
+        listener._post_receives()
+        return listener
+
+    def _use_fake_mpi(self):
+        missing = object()
+        real = getattr(ensemble, 'MPI', missing)
+        ensemble.MPI = _MPI
+
+        def restore():
+            if real is missing:
+                del ensemble.MPI
+            else:
+                ensemble.MPI = real
+        self.addCleanup(restore)
+
+    def test_wait_blocking(self):
+        self._use_fake_mpi()
+        listener = self._listener()
+        self.assertEqual(len(listener.comm.posted), 3)
+        self.assertEqual(len(listener.buffers), 3)
+        first = list(listener.requests)
+
+        listener.comm.deliver(mpi.Tags.LOG, 3, 'log')
+        listener.comm.deliver(mpi.Tags.DONE, 2, 'done')
+        # in the order of precedence of listen
+        self.assertEqual(listener._wait(), (mpi.Tags.DONE, 2, 'done'))
+        self.assertEqual(listener._wait(), (mpi.Tags.LOG, 3, 'log'))
+
+        # the completed receives are re-posted, in their buffers
+        self.assertEqual(len(listener.comm.posted), 5)
+        self.assertTrue(all(listener.requests))
+        self.assertIsNot(listener.requests[0], first[0])
+        self.assertIsNot(listener.requests[1], first[1])
+        self.assertIs(listener.requests[2], first[2])
+        listener.comm.deliver(mpi.Tags.IO_TICKET, 0, 'ticket')
+        self.assertEqual(listener._wait(),
+                         (mpi.Tags.IO_TICKET, 0, 'ticket'))
+
+    def test_wait_timeout(self):
+        self._use_fake_mpi()
+        listener = self._listener()
+        start = time.time()
+        self.assertIsNone(listener._wait(0.05))
+        self.assertTrue(time.time() - start >= 0.05)
+        self.assertEqual(len(listener.comm.posted), 3)
+
+        listener.comm.deliver(mpi.Tags.LOG, 1, 'log')
+        self.assertEqual(listener._wait(10), (mpi.Tags.LOG, 1, 'log'))
+        self.assertEqual(len(listener.comm.posted), 4)
+
+    def test_repost_completed(self):
+        self._use_fake_mpi()
+        listener = self._listener()
+        first = list(listener.requests)
+        # completed, but not processed, eg. on an unpickling error
+        listener.requests[1].active = False
+        listener._repost_completed()
+        self.assertTrue(all(listener.requests))
+        self.assertIs(listener.requests[0], first[0])
+        self.assertIsNot(listener.requests[1], first[1])
+        self.assertIs(listener.requests[2], first[2])
+        self.assertEqual(len(listener.comm.posted), 4)
+
+    def test_priorize(self):
+        inputs = ['A_0.tar', 'B_1.tar', 'C_0.tar', 'D_2.tar']
+        self.assertEqual(ensemble.priorize(inputs),
+                         ['A_0.tar', 'C_0.tar', 'B_1.tar', 'D_2.tar'])
+        # the last is handed out first: longest remaining first,
+        # ties in the order _0, _1, ...
+        costs = {'A_0.tar': 5, 'B_1.tar': 50, 'C_0.tar': 50, 'D_2.tar': 10}
+        self.assertEqual(ensemble.priorize(inputs, costs),
+                         ['A_0.tar', 'D_2.tar', 'B_1.tar', 'C_0.tar'])
+
+    def test_estimate_costs_restarted(self):
+        simpacks = synthetic.generate(self.tmp, 2, steps_scale=0.001)
+        total, finished = scan.tar_progress(simpacks[1])
+        self.assertTrue(total > 0)
+        self.assertEqual(finished, 0)
+
+        # the first step was computed, before the simpack was restarted
+        pack = archive.SimpackArchive(simpacks[1])
+        inputs = sorted(fname for fname in pack.names()
+                        if fname.endswith('.inp'))
+        log = os.path.basename(inputs[0])[:-4] + '.log.gz'
+        with open(log, 'w') as fil:
+            fil.write('log')
+        pack.append([log])
+        self.assertEqual(scan.tar_progress(simpacks[1])[0], total)
+        finished = scan.tar_progress(simpacks[1])[1]
+        self.assertTrue(0 < finished < total)
+
+        missing = os.path.join(self.tmp, 'missing_0.tar')
+        costs = ensemble.estimate_costs(simpacks + [missing])
+        self.assertEqual(costs, {simpacks[0]: total,
+                                 simpacks[1]: total - finished,
+                                 missing: 0})
+        self.assertEqual(ensemble.priorize(simpacks, costs),
+                         [simpacks[1], simpacks[0]])
+
+    def test_estimate_makespan(self):
+        costs = [2, 4, 3, 3, 2]
+        self.assertEqual(ensemble.estimate_makespan(costs, 0), 14)
+        self.assertEqual(ensemble.estimate_makespan(costs, 1), 14)
+        # longest first: 4+2+2 and 3+3, not the optimum 4+3 and 3+2+2
+        self.assertEqual(ensemble.estimate_makespan(costs, 2), 8)
+        self.assertEqual(ensemble.estimate_makespan(costs, 5), 4)
+        self.assertEqual(ensemble.estimate_makespan([], 3), 0)
+
+    def test_makespan_computing_ranks(self):
+        size = mpi.size
+        mpi.size = 8
+        try:
+            # 7 ranks: 1 holds a core, 2 sub-masters, 4 compute simpacks
+            master = ensemble.Master(self.tmp + '/', time.time(), self.tmp,
+                                     idle=1, submasters=2)
+        finally:
+            mpi.size = size
+        try:
+            self.assertEqual(master.numworkers, 6)
+            self.assertEqual(master.workers, 4)
+            estimate = ensemble.estimate_makespan
+            used = []
+
+            def recording_estimate(costs, workers):
+                used.append(workers)
+                return estimate(costs, workers)
+
+            ensemble.estimate_makespan = recording_estimate
+            try:
+                master._log_makespan()
+            finally:
+                ensemble.estimate_makespan = estimate
+            self.assertEqual(used, [4])
+        finally:
+            master.queue.close()
+            master.db.close()
+
+    def test_submaster_blocks(self):
+        submaster = ensemble.SubMaster([3, 4])
+        submaster.comm = _Comm()
+        submaster._post_receives = lambda: None
+        timeouts = []
+        messages = [(mpi.Tags.LOG, 3, 'log'), None,
+                    (mpi.Tags.SHUTDOWN, 3, ''), (mpi.Tags.SHUTDOWN, 4, '')]
+
+        def wait(timeout=None):
+            timeouts.append(timeout)
+            msg = messages.pop(0)
+            if msg is None:
+                # the flush of the log is due
+                submaster.last_flush -= ensemble.SUBMASTER_FLUSH
+            return msg
+
+        submaster._wait = wait
+        self.addCleanup(signal.signal, signal.SIGTERM,
+                        signal.getsignal(signal.SIGTERM))
+        submaster.run()
+        # blocks without anything to forward, else until the flush is due
+        self.assertIsNone(timeouts[0])
+        self.assertTrue(0 < timeouts[1] <= ensemble.SUBMASTER_FLUSH)
+        self.assertEqual(timeouts[2:], [None, None])
+        self.assertEqual(submaster.comm.sent, [
+            (mpi.Tags.BATCH, mpi.root, [[mpi.Tags.LOG, 3, 'log']]),
+            (mpi.Tags.SHUTDOWN, mpi.root, 'GoodBye!')])
+
+
+if __name__ == "__main__":
+    unittest.main()
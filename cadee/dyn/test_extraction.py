@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""
+This are unittests for extraction.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import json
+import os
+import shutil
+import tempfile
+
+import archive
+import extraction
+import manifest
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+INPUT = """[MD]
+steps 100
+stepsize 1.0
+
+[files]
+topology  mutant.top
+{0}
+final     {1}.re
+trajectory {1}.dcd
+energy    {1}.en
+fep       mutant.fep
+"""
+
+
+def write(fname, data):
+    with open(fname, 'w') as fil:
+        fil.write(data)
+
+
+class MyExtractionTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+        os.mkdir('pack')
+        os.chdir('pack')
+        write('mutant.top', 'topology')
+        write('mutant.fep', 'fep')
+        write('0000_dyn.inp', INPUT.format('', '0000_dyn'))
+        write('0010_eq.inp', INPUT.format('restart 0000_dyn.re', '0010_eq'))
+        write('0020_eq.inp', INPUT.format('restart 0010_eq.re', '0020_eq'))
+        write('0020_map.qana', '0010_eq 0020_eq\n')
+        self.units = {}
+        for stem in ('0000_dyn', '0010_eq'):
+            outputs = {}
+            for fname, size in ((stem + '.log.gz', 10), (stem + '.re', 20),
+                                (stem + '.dcd', 5000),
+                                (stem + '.en.gz', 50)):
+                write(fname, 'x' * size)
+                outputs[fname] = [size, None]
+            self.units[stem + '.inp'] = {
+                'status': 0, 'exitcode': 0, 'time': 1.,
+                'log': stem + '.log.gz', 'outputs': outputs}
+        self.path = os.path.join(self.tmp, 'simpack.tar')
+
+    def tearDown(self):
+        os.chdir('/')
+        shutil.rmtree(self.tmp)
+
+    def simpack(self):
+        """ Archive the files of the simpack folder """
+        if self.units:
+            write(manifest.MANIFEST_NAME,
+                  json.dumps({'version': manifest.VERSION,
+                              'units': self.units}))
+        simpack = archive.SimpackArchive(self.path)
+        simpack.append(sorted(os.listdir('.')))
+        return simpack
+
+    def test_resume(self):
+        simpack = self.simpack()
+        self.assertEqual(extraction.trusted(simpack),
+                         set(['0000_dyn.inp', '0010_eq.inp']))
+        self.assertEqual(extraction.plan(simpack), [
+            '0000_dyn.inp', '0010_eq.inp', '0010_eq.re', '0020_eq.inp',
+            '0020_map.qana', manifest.MANIFEST_NAME, 'mutant.fep',
+            'mutant.top'])
+
+    def test_mapping(self):
+        simpack = self.simpack()
+        names = extraction.plan(simpack, mapping=True)
+        self.assertIn('0010_eq.log.gz', names)
+        self.assertIn('0010_eq.en.gz', names)
+        self.assertNotIn('0000_dyn.log.gz', names)
+        self.assertNotIn('0010_eq.dcd', names)
+        write('0020_map.qana.mapped', '[]')
+        names = extraction.plan(self.simpack(), mapping=True)
+        self.assertNotIn('0010_eq.en.gz', names)
+        self.assertIn('0020_map.qana.mapped', names)
+
+    def test_without_manifest(self):
+        self.units = {}
+        names = extraction.plan(self.simpack())
+        for stem in ('0000_dyn', '0010_eq'):
+            self.assertIn(stem + '.log.gz', names)
+            self.assertIn(stem + '.re', names)
+            self.assertNotIn(stem + '.dcd', names)
+            self.assertNotIn(stem + '.en.gz', names)
+
+    def test_changed_output(self):
+        # the trajectory in the archive is not the recorded one
+        self.units['0010_eq.inp']['outputs']['0010_eq.dcd'][0] = 4000
+        simpack = self.simpack()
+        self.assertEqual(extraction.trusted(simpack), set(['0000_dyn.inp']))
+        names = extraction.plan(simpack)
+        self.assertIn('0010_eq.log.gz', names)
+        self.assertIn('0000_dyn.re', names)
+        self.assertNotIn('0010_eq.dcd', names)
+
+    def test_extract(self):
+        simpack = self.simpack()
+        names = extraction.plan(simpack)
+        os.mkdir('../out')
+        nbytes = simpack.extract(names, '../out')
+        self.assertEqual(sorted(os.listdir('../out')), names)
+        total = sum(entry['size'] for entry in simpack.members.values())
+        self.assertTrue(nbytes * 5 < total)
+
+
+if __name__ == "__main__":
+    unittest.main()
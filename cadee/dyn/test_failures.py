@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+This are unittests for failures.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import os
+import shutil
+import tempfile
+import time
+
+import failures
+import jobqueue
+import trajectory
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+
+def failure(host, code=0, exitcode=137):
+    return {'code': code, 'exitcode': exitcode, 'host': host,
+            'step': '1100_eq.inp', 'error': 'killed'}
+
+
+class MyFailuresTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.queue = jobqueue.JobQueue(os.path.join(self.tmp,
+                                                    jobqueue.QUEUE_DB))
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.tmp)
+
+    def _lease(self, simpack):
+        # before the simpacks, that are retried
+        self.queue.add(simpack, self.queue.count() + 1)
+        self.assertEqual(self.queue.lease()[0], simpack)
+
+    def test_describe(self):
+        err = trajectory.ComputeError('1100_eq.inp', trajectory.ERR_NAN, 0)
+        desc = failures.describe(err)
+        self.assertEqual((desc['code'], desc['exitcode'], desc['step']),
+                         (trajectory.ERR_NAN, 0, '1100_eq.inp'))
+        self.assertEqual(failures.classify(desc['code']),
+                         failures.SIMULATION)
+        desc = failures.describe(IOError('disk full'))
+        self.assertEqual((desc['code'], desc['exitcode']), (0, None))
+        self.assertEqual(failures.classify(trajectory.ERR_ABNORMAL_TERM),
+                         failures.NODE)
+
+    def test_retry_budget(self):
+        fail = failures.Failures(self.queue, retries=2, backoff=10)
+        self._lease('wt_0.tar')
+        nan = failure('node1', trajectory.ERR_NAN, 0)
+        self.assertEqual(fail.record('wt_0.tar', nan, now=1000),
+                         failures.RETRY)
+        self.assertEqual(self.queue.next_retry(now=1000), 1010)
+        self.assertEqual(fail.next_event(now=1000), 1010)
+        # the backoff doubles
+        for now, retry in ((2000, 2020), (3000, None)):
+            self.assertEqual(self.queue.lease()[0], 'wt_0.tar')
+            fail.record('wt_0.tar', nan, now=now)
+            self.assertEqual(self.queue.next_retry(now=now), retry)
+        self.assertEqual(self.queue.count(jobqueue.QUARANTINED), 1)
+        self.assertEqual(self.queue.lease(), None)
+
+    def test_blacklist(self):
+        fail = failures.Failures(self.queue, node_failures=2,
+                                 node_window=100, blacklist=50)
+        start = time.time()  # the retries wait
+        for num, simpack in enumerate(('wt_0.tar', 'wt_1.tar')):
+            self._lease(simpack)
+            fail.record(simpack, failure('node1'), ['node1', 'node2'],
+                        now=start + num)
+        self.assertTrue(fail.is_blacklisted('node1', now=start + 10))
+        self.assertFalse(fail.is_blacklisted('node2', now=start + 10))
+        self.assertEqual(fail.next_event(now=start + 10), start + 51)
+        # the node failed, not the simpacks
+        self.assertEqual(self.queue.failures('wt_0.tar'), 0)
+        self.assertEqual(self.queue.failures('wt_1.tar'), 0)
+        self.assertFalse(fail.is_blacklisted('node1', now=start + 51))
+        # twice as long, the next time
+        self._lease('wt_2.tar')
+        fail.record('wt_2.tar', failure('node1'), ['node2'], now=start + 60)
+        self.assertTrue(fail.is_blacklisted('node1', now=start + 150))
+        # the last host is not blacklisted
+        self._lease('wt_3.tar')
+        fail.record('wt_3.tar', failure('node2'), ['node1'], now=start + 100)
+        self._lease('wt_4.tar')
+        fail.record('wt_4.tar', failure('node2'), ['node1'], now=start + 101)
+        self.assertFalse(fail.is_blacklisted('node2', now=start + 102))
+
+
+if __name__ == "__main__":
+    unittest.main()
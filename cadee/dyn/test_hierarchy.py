@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+This are unittests for hierarchy.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import hierarchy
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+
+class MyHierarchyTests(unittest.TestCase):
+    def test_no_groups(self):
+        hosts = ['a'] * 5
+        self.assertEqual(hierarchy.groups(hosts, 0), {})
+        self.assertEqual(hierarchy.parents(hosts, 0), [0] * 5)
+
+    def test_group_size(self):
+        hosts = ['a'] * 8
+        self.assertEqual(hierarchy.groups(hosts, 3),
+                         {1: [2, 3], 4: [5, 6]})
+        # rank 7 is alone, and a worker of the master
+        self.assertEqual(hierarchy.parents(hosts, 3),
+                         [0, 0, 1, 1, 0, 4, 4, 0])
+
+    def test_node(self):
+        hosts = ['a', 'a', 'b', 'a', 'b', 'c']
+        self.assertEqual(hierarchy.groups(hosts, hierarchy.NODE),
+                         {1: [3], 2: [4]})
+        self.assertEqual(hierarchy.parents(hosts, hierarchy.NODE),
+                         [0, 0, 0, 1, 2, 0])
+
+    def test_parse(self):
+        self.assertEqual(hierarchy.parse_group_size('node'), hierarchy.NODE)
+        self.assertEqual(hierarchy.parse_group_size('16'), 16)
+        self.assertEqual(hierarchy.parse_group_size(None), 0)
+        self.assertRaises(ValueError, hierarchy.parse_group_size, '1')
+
+
+if __name__ == "__main__":
+    unittest.main()
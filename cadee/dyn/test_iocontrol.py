@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+This are unittests for iocontrol.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import math
+import unittest
+import iocontrol
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+MB = 1024 * 1024
+
+
+def synthetic_filesystem(peak):
+    """ Aggregate throughput [B/s] of a filesystem that scales linearly
+    up to peak concurrent streams and thrashes above. """
+    def throughput(streams):
+        if streams <= peak:
+            return streams * 10. * MB
+        return max(1. * MB, (peak - 0.8 * (streams - peak)) * 10. * MB)
+    return throughput
+
+
+def run_workload(ctrl, throughput, windows=300, ticket_bytes=50 * MB):
+    """ Saturate ctrl with tickets of ticket_bytes, return limits """
+    limits = []
+    for _ in range(windows):
+        ctrl.mark_saturated()
+        agg = throughput(ctrl.limit)
+        step = ticket_bytes / agg
+        count = max(ctrl.window_tickets,
+                    int(math.ceil(ctrl.window_seconds / step)))
+        start = ctrl.window_start
+        for i in range(count - 1):
+            ctrl.record(ticket_bytes, step * ctrl.limit,
+                        now=start + (i + 1) * step)
+        # last ticket closes the window
+        ctrl.record(ticket_bytes, step * ctrl.limit,
+                    now=start + max(count * step, ctrl.window_seconds + 1e-6))
+        limits.append(ctrl.limit)
+    return limits
+
+
+class MyIOControlTests(unittest.TestCase):
+    def test_converges_to_peak_from_above(self):
+        ctrl = iocontrol.AdaptiveIOLimit(64, window_seconds=30)
+        ctrl.window_start = 0.
+        limits = run_workload(ctrl, synthetic_filesystem(12))
+        tail = limits[-100:]
+        self.assertTrue(8 <= min(tail))
+        self.assertTrue(max(tail) <= 14)
+
+    def test_converges_to_peak_from_below(self):
+        ctrl = iocontrol.AdaptiveIOLimit(1, window_seconds=30)
+        ctrl.window_start = 0.
+        limits = run_workload(ctrl, synthetic_filesystem(40))
+        tail = limits[-100:]
+        self.assertTrue(28 <= min(tail))
+        self.assertTrue(max(tail) <= 42)
+
+    def test_bounds(self):
+        ctrl = iocontrol.AdaptiveIOLimit(4, minimum=2, maximum=6,
+                                         window_seconds=30)
+        ctrl.window_start = 0.
+        limits = run_workload(ctrl, synthetic_filesystem(100), windows=50)
+        self.assertEqual(max(limits), 6)
+        limits = run_workload(ctrl, synthetic_filesystem(1), windows=50)
+        self.assertTrue(min(limits) >= 2)
+        self.assertTrue(max(limits[-10:]) < 6)
+
+    def test_not_saturated(self):
+        ctrl = iocontrol.AdaptiveIOLimit(8, window_tickets=1,
+                                         window_seconds=0)
+        for i in range(10):
+            ctrl.record(MB, 1., now=ctrl.window_start + 1)
+        self.assertEqual(ctrl.limit, 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+This are unittests for jobqueue.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import os
+import shutil
+import tempfile
+import time
+import jobqueue
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+
+class MyJobQueueTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.name = os.path.join(self.tmp, jobqueue.QUEUE_DB)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_lease_longest_first(self):
+        queue = jobqueue.JobQueue(self.name, 'a')
+        queue.add('short.tar', 10)
+        queue.add('long.tar', 1000)
+        queue.add('long.tar', 1)
+        self.assertEqual(queue.lease(), ('long.tar', 1000))
+        self.assertEqual(queue.lease(), ('short.tar', 10))
+        self.assertEqual(queue.lease(), None)
+
+    def test_concurrent_owners(self):
+        queue_a = jobqueue.JobQueue(self.name, 'a')
+        queue_b = jobqueue.JobQueue(self.name, 'b')
+        queue_a.add('wt_0.tar')
+        queue_b.add('wt_0.tar')
+        queue_b.add('wt_1.tar')
+        leased = [queue_a.lease(), queue_b.lease()]
+        self.assertEqual(sorted([job[0] for job in leased]),
+                         ['wt_0.tar', 'wt_1.tar'])
+        self.assertEqual(queue_a.lease(), None)
+        self.assertEqual(queue_b.lease(), None)
+
+    def test_resume(self):
+        queue = jobqueue.JobQueue(self.name, 'a')
+        queue.add('wt_0.tar')
+        queue.add('wt_1.tar')
+        simpack = queue.lease()[0]
+        queue.done(simpack)
+        queue.close()
+        queue = jobqueue.JobQueue(self.name, 'b')
+        queue.add('wt_0.tar')
+        queue.add('wt_1.tar')
+        self.assertEqual(queue.count(jobqueue.DONE), 1)
+        self.assertEqual(queue.count(jobqueue.PENDING), 1)
+        self.assertNotEqual(queue.lease()[0], simpack)
+
+    def test_set_cost(self):
+        queue = jobqueue.JobQueue(self.name, 'a')
+        queue.add('wt_0.tar', 100)
+        queue.add('wt_1.tar', 60)
+        simpack = queue.lease()[0]
+        # half of it was computed, when it was released
+        queue.set_cost(simpack, 50)
+        queue.release(simpack)
+        queue.close()
+        queue = jobqueue.JobQueue(self.name, 'b')
+        self.assertEqual(queue.lease(), ('wt_1.tar', 60))
+        self.assertEqual(queue.lease(), ('wt_0.tar', 50))
+
+    def test_renew_in(self):
+        queue = jobqueue.JobQueue(self.name, 'a', lease_timeout=400)
+        self.assertTrue(99 < queue.renew_in() <= 100)
+        queue.last_renew -= 150
+        self.assertEqual(queue.renew_in(), 0)
+        queue.renew_if_due()
+        self.assertTrue(queue.renew_in() > 99)
+
+    def test_expired_lease(self):
+        queue_a = jobqueue.JobQueue(self.name, 'a', lease_timeout=0.1)
+        queue_b = jobqueue.JobQueue(self.name, 'b', lease_timeout=0.1)
+        queue_a.add('wt_0.tar')
+        self.assertEqual(queue_a.lease()[0], 'wt_0.tar')
+        self.assertEqual(queue_b.lease(), None)
+        time.sleep(0.2)
+        self.assertEqual(queue_b.lease()[0], 'wt_0.tar')
+        # a lost the lease, it can not mark the simpack anymore
+        queue_a.done('wt_0.tar')
+        self.assertEqual(queue_a.count(jobqueue.RUNNING), 1)
+
+    def test_release_and_reset(self):
+        queue = jobqueue.JobQueue(self.name, 'a')
+        queue.add('wt_0.tar')
+        queue.add('wt_1.tar')
+        queue.failed(queue.lease()[0])
+        queue.release(queue.lease()[0])
+        self.assertEqual(queue.count(jobqueue.FAILED), 1)
+        self.assertEqual(queue.count(jobqueue.PENDING), 1)
+        queue.reset()
+        self.assertEqual(queue.count(jobqueue.PENDING), 2)
+
+    def test_failures(self):
+        queue = jobqueue.JobQueue(self.name, 'a')
+        queue.add('wt_0.tar', 10)
+        queue.add('wt_1.tar', 1)
+        simpack = queue.lease()[0]
+        now = time.time()
+        failure = queue.add_failure(simpack, 'node1', 8, 1, 'simulation',
+                                    'SHAKE', now)
+        queue.retry_at(failure, now + 3600)
+        queue.release(simpack)
+        # waits for its retry
+        self.assertEqual(queue.next_retry(), now + 3600)
+        self.assertEqual(queue.lease()[0], 'wt_1.tar')
+        self.assertEqual(queue.lease(), None)
+        queue.retry_at(failure, now)
+        self.assertEqual(queue.next_retry(), None)
+        self.assertEqual(queue.lease()[0], simpack)
+        queue.add_failure(simpack, 'node1', 0, 137, 'node', 'killed', now)
+        self.assertEqual(queue.failures(simpack), 2)
+        self.assertEqual(queue.failed_simpacks('node1', now, 'node'),
+                         [simpack])
+        queue.uncount('node1', now, 'node')
+        self.assertEqual(queue.failures(simpack), 1)
+        queue.quarantine(simpack)
+        queue.reset()
+        self.assertEqual(queue.count(jobqueue.QUARANTINED), 1)
+        queue.release_quarantined()
+        self.assertEqual(queue.count(jobqueue.PENDING), 1)
+        self.assertEqual(queue.failures(simpack), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+This are unittests for local.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import multiprocessing
+import os
+import Queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import local
+import mpi
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+HERE = os.path.dirname(os.path.abspath(local.__file__))
+
+# mpi4py, that fails if MPI would be initialized
+FAKE_MPI4PY = """
+class _RC(object):
+    initialize = True
+    finalize = True
+rc = _RC()
+"""
+FAKE_MPI = """
+from mpi4py import rc
+if rc.initialize:
+    raise RuntimeError('MPI_Init')
+def Is_initialized():
+    return False
+def Is_finalized():
+    return False
+"""
+
+# one small simpack, computed by the local backend with the stand-ins
+RUN = """
+import os
+import bench_ensemble, jobqueue, local, mpi, synthetic
+# mpi4py is importable, but MPI is not initialized
+assert mpi.MPI.__name__ == 'mpi4py.MPI' and not mpi.mpi
+folder = os.path.abspath('simpacks')
+bindir = os.path.join(folder, 'bin')
+bench_ensemble.create_standins(bindir)
+bench_ensemble.use_standins(bindir)
+inputs = synthetic.generate(folder, 1, template=os.path.join(
+    {0!r}, '../../simpack_templates/'
+    'simpack_template_0.05ns_15ps_2.5ps_32.5ps.tar.bz2'), steps_scale=0.)
+local.main(inputs, folder, processes=1)
+queue = jobqueue.JobQueue(os.path.join(folder, jobqueue.QUEUE_DB))
+print('DONE {{0}}'.format(queue.count(jobqueue.DONE)))
+""".format(HERE)
+
+
+def _echo(inboxes):
+    comm = local.LocalComm(1, inboxes)
+    data = comm.recv(source=0, tag=2)
+    comm.send(data + ' back', 0, tag=1)
+
+
+class MyLocalTests(unittest.TestCase):
+    def test_comm_order(self):
+        inboxes = [multiprocessing.Queue() for _ in range(2)]
+        worker = local.LocalComm(1, inboxes)
+        master = local.LocalComm(0, inboxes)
+        master.send('abort', 1, tag=11)
+        master.send(['wt_0.tar', 'wt_0.tar', None], 1, tag=2)
+        # messages of other tags wait, until they are asked for
+        self.assertEqual(worker.recv(source=0, tag=2),
+                         ['wt_0.tar', 'wt_0.tar', None])
+        self.assertTrue(worker.iprobe(source=0, tag=11))
+        self.assertFalse(worker.iprobe(source=0, tag=2))
+        self.assertEqual(worker.recv(source=0, tag=11), 'abort')
+        self.assertRaises(Queue.Empty, master.receive, timeout=0)
+
+    def test_processes(self):
+        inboxes = [multiprocessing.Queue() for _ in range(2)]
+        proc = multiprocessing.Process(target=_echo, args=(inboxes,))
+        proc.start()
+        master = local.LocalComm(0, inboxes)
+        master.send('hello', 1, tag=2)
+        self.assertEqual(master.receive(timeout=30), (1, 1, 'hello back'))
+        proc.join()
+
+    def test_ticket(self):
+        semaphore = multiprocessing.BoundedSemaphore(1)
+        with local.LocalTicket(semaphore) as ticket:
+            ticket.nbytes = 10
+            self.assertFalse(semaphore.acquire(False))
+        self.assertTrue(ticket.elapsed >= 0)
+        self.assertTrue(semaphore.acquire(False))
+
+    def test_launched(self):
+        self.assertFalse(mpi.launched({}))
+        self.assertTrue(mpi.launched({'OMPI_COMM_WORLD_SIZE': '4'}))
+        self.assertTrue(mpi.launched({'CADEE_MPI': '1'}))
+        self.assertFalse(mpi.launched({'PMI_SIZE': '4', 'CADEE_MPI': '0'}))
+
+    def test_run_with_mpi4py(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(tmp, 'mpi4py'))
+            for name, text in (('__init__.py', FAKE_MPI4PY),
+                               ('MPI.py', FAKE_MPI)):
+                with open(os.path.join(tmp, 'mpi4py', name), 'w') as fil:
+                    fil.write(text)
+            env = dict((key, value) for key, value in os.environ.items()
+                       if key not in mpi.LAUNCHER_VARS and
+                       key != 'CADEE_MPI')
+            env['PYTHONPATH'] = os.pathsep.join(
+                [tmp, HERE, os.path.join(HERE, '..', '..')])
+            env['CADEE_STANDIN_STEP_SECONDS'] = '0'
+            proc = subprocess.Popen([sys.executable, '-c', RUN], cwd=tmp,
+                                    env=env, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT)
+            out = proc.communicate()[0]
+            self.assertEqual(proc.returncode, 0, out[-2000:])
+            self.assertIn('DONE 1', out)
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+This are unittests for manifest.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import gzip
+import os
+import shutil
+import tempfile
+
+import manifest
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+
+class Unit(object):
+    """ The attributes of a trajectory.WorkUnit, the manifest uses """
+    def __init__(self, name):
+        self.inputfile = [name + '.inp', '']
+        self.logfile = [name + '.log.gz', '']
+        self.velocityfile = [name + '.re', '']
+        self.dcdfile = None
+        self.energyfile = [name + '.en', '']
+        self.status = 0
+        self.q_exitcode = 0
+        self.time = 1.5
+
+
+class MyManifestTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+        gzip.open('md_eq1.log.gz', 'wb').write('terminated normally\n')
+        with open('md_eq1.re', 'w') as fil:
+            fil.write('restart')
+        gzip.open('md_eq1.en.gz', 'wb').write('energies')
+
+    def tearDown(self):
+        os.chdir('/')
+        shutil.rmtree(self.tmp)
+
+    def test_record(self):
+        unit = Unit('md_eq1')
+        self.assertEqual(manifest.outputs(unit),
+                         ['md_eq1.log.gz', 'md_eq1.re', 'md_eq1.en.gz'])
+        manifest.Manifest(self.tmp).record(unit)
+        # a new worker loads the manifest
+        progress = manifest.Manifest(self.tmp)
+        self.assertTrue(progress.finished(unit))
+        self.assertFalse(progress.finished(Unit('md_eq2')))
+
+    def test_changed_output(self):
+        unit = Unit('md_eq1')
+        progress = manifest.Manifest(self.tmp)
+        progress.record(unit)
+        with open('md_eq1.re', 'w') as fil:
+            fil.write('other!!')  # same size
+        self.assertTrue(progress.finished(unit))
+        progress.verify = True
+        self.assertFalse(progress.finished(unit))
+        os.remove('md_eq1.log.gz')
+        progress.verify = False
+        self.assertFalse(progress.finished(unit))
+
+    def test_archived(self):
+        unit = Unit('md_eq1')
+        progress = manifest.Manifest(self.tmp)
+        progress.record(unit)
+        size = os.path.getsize('md_eq1.log.gz')
+        os.remove('md_eq1.log.gz')
+        self.assertFalse(progress.finished(unit))
+        # the log was not extracted, see extraction.py
+        progress.archived = {'md_eq1.log.gz': size}
+        self.assertTrue(progress.finished(unit))
+        progress.archived = {'md_eq1.log.gz': size + 1}
+        self.assertFalse(progress.finished(unit))
+
+    def test_failed(self):
+        unit = Unit('md_eq1')
+        unit.status = 2
+        progress = manifest.Manifest(self.tmp)
+        progress.record(unit)
+        self.assertFalse(progress.finished(unit))
+        progress.forget(unit.inputfile[0])
+        self.assertEqual(manifest.Manifest(self.tmp).units, {})
+
+    def test_broken(self):
+        with open(manifest.MANIFEST_NAME, 'w') as fil:
+            fil.write('{"version": 1, "units": ')
+        self.assertEqual(manifest.Manifest(self.tmp).units, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
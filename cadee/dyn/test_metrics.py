@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+This are unittests for metrics.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import metrics
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+
+class MyMetricsTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_ns_per_day(self):
+        # 10 steps/s of 1fs: 864000 fs per day
+        self.assertAlmostEqual(metrics.ns_per_day(10., 1.), 0.864)
+
+    def test_summary(self):
+        met = metrics.Metrics(self.tmp, max_age=100)
+        met.sample(1, '/simpacks/wt_0.tar', 10., 1., now=1000)
+        met.sample(2, '/simpacks/wt_1.tar', 20., 1., 0.05, now=1000)
+        met.sample(3, '/simpacks/wt_2.tar', 20., 1., now=800)  # too old
+        met.io_wait(2.)
+        met.io_wait(4.)
+        summary = met.summary({'busy': 3, 'idle': 1}, now=1010)
+        self.assertAlmostEqual(summary['ns_per_day'], 3 * 0.864)
+        self.assertEqual(summary['reporting_ranks'], 2)
+        self.assertEqual(summary['busy'], 3)
+        self.assertEqual(summary['io_ticket_wait_max_seconds'], 4.)
+        self.assertEqual(summary['workers']['2']['simpack'], 'wt_1.tar')
+        met.forget(2)
+        self.assertEqual(met.summary({}, now=1010)['reporting_ranks'], 1)
+
+    def test_write(self):
+        met = metrics.Metrics(self.tmp, interval=30)
+        self.assertTrue(met.due(now=1000))
+        met.sample(5, 'wt_0.tar', 10., 2., now=1000)
+        met.write({'busy': 1, 'idle': 0, 'io_queue': 2, 'pending': 7,
+                   'nodes': {'node1': {'load1': 3.5, 'iowait': None}}},
+                  now=1000)
+        self.assertFalse(met.due(now=1010))
+        with open(os.path.join(self.tmp, metrics.JSON_NAME)) as fil:
+            self.assertEqual(json.load(fil)['pending'], 7)
+        with open(os.path.join(self.tmp, metrics.PROM_NAME)) as fil:
+            prom = fil.read().splitlines()
+        self.assertIn('cadee_ns_per_day 1.728', prom)
+        self.assertIn('cadee_io_queue_depth 2.0', prom)
+        self.assertIn('cadee_ranks{state="busy"} 1.0', prom)
+        self.assertIn('cadee_worker_seconds_per_step'
+                      '{rank="5",simpack="wt_0.tar"} 0.1', prom)
+        self.assertIn('cadee_node_load1{host="node1"} 3.5', prom)
+        self.assertNotIn('cadee_node_iowait{host="node1"}', '\n'.join(prom))
+        self.assertEqual(os.listdir(self.tmp).count(metrics.PROM_NAME
+                                                    + '.tmp'), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+This are unittests for nodecache.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import os
+import shutil
+import tempfile
+
+import archive
+import nodecache
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+
+class MyNodeCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+        os.mkdir('pack')
+        for fname, data in (('mutant.top', 'topology' * 100),
+                            ('0010_eq.inp', 'steps 10\n'),
+                            ('0010_eq.dcd', 'trajectory')):
+            with open(os.path.join('pack', fname), 'w') as fil:
+                fil.write(data)
+        # two replicas with the same inputs
+        self.replicas = []
+        for replik in range(2):
+            simpack = archive.SimpackArchive(
+                os.path.join(self.tmp, 'mutant_{0}.tar'.format(replik)))
+            simpack.append(sorted(os.listdir('pack')), root='pack')
+            self.replicas.append(simpack)
+        self.cache = nodecache.NodeCache(os.path.join(self.tmp, 'cache'))
+
+    def tearDown(self):
+        os.chdir('/')
+        shutil.rmtree(self.tmp)
+
+    def stage_in(self, simpack, path):
+        """ Like ensemble.Worker._extract """
+        os.mkdir(path)
+        names = self.cache.link(simpack, None, path)
+        simpack.extract(names, path)
+        self.cache.add(simpack, names, path)
+        return sorted(names)
+
+    def test_replicas(self):
+        self.assertEqual(self.stage_in(self.replicas[0], 'w1'),
+                         ['0010_eq.dcd', '0010_eq.inp', 'mutant.top'])
+        # the second replica only extracts the trajectory
+        self.assertEqual(self.stage_in(self.replicas[1], 'w2'),
+                         ['0010_eq.dcd'])
+        self.assertEqual(self.cache.hits, 2)
+        self.assertEqual(open('w2/mutant.top').read(), 'topology' * 100)
+        self.assertEqual(os.stat('w2/mutant.top').st_ino,
+                         os.stat('w1/mutant.top').st_ino)
+        self.assertEqual(len(os.listdir(self.cache.objects)), 2)
+
+    def test_evict(self):
+        self.cache.max_bytes = 0
+        self.stage_in(self.replicas[0], 'w1')
+        # in use by w1
+        self.assertEqual(len(os.listdir(self.cache.objects)), 2)
+        shutil.rmtree('w1')
+        self.cache.evict()
+        self.assertEqual(os.listdir(self.cache.objects), [])
+
+    def test_digest_mismatch(self):
+        os.mkdir('w1')
+        self.replicas[0].extract(None, 'w1')
+        with open('w1/mutant.top', 'w') as fil:
+            fil.write('changed')
+        self.cache.add(self.replicas[0], ['mutant.top'], 'w1')
+        self.assertEqual(os.listdir(self.cache.objects), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
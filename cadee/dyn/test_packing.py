@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+This are unittests for packing.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import os
+import shutil
+import tempfile
+
+import archive
+import packing
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+
+class MyPackingTests(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(packing.parse_cores('auto'), packing.AUTO)
+        self.assertEqual(packing.parse_cores('8'), 8)
+        self.assertEqual(packing.parse_cores(None), 1)
+        self.assertRaises(ValueError, packing.parse_cores, '0')
+
+    def test_pack(self):
+        # 20 cores on node a (rank 0 is the master), 6 on node b
+        hosts = ['a'] * 20 + ['b'] * 6
+        groups = packing.pack(hosts, 8, exclude=[0])
+        self.assertEqual(groups, {1: range(2, 9), 9: range(10, 17),
+                                  17: [18, 19], 20: range(21, 26)})
+        # no rank is stranded, or in two groups
+        ranks = sorted(groups.keys() + sum(groups.values(), []))
+        self.assertEqual(ranks, range(1, 26))
+
+    def test_pack_interleaved(self):
+        hosts = ['a', 'b', 'a', 'b', 'a', 'b']
+        self.assertEqual(packing.pack(hosts, 2),
+                         {0: [2], 4: [], 1: [3], 5: []})
+
+    def test_cpus(self):
+        cpus = packing.parse_cpus('0-3,8,10-11\n')
+        self.assertEqual(cpus, set([0, 1, 2, 3, 8, 10, 11]))
+        self.assertEqual(packing.format_cpus(cpus), '0-3,8,10-11')
+
+    def test_command(self):
+        cmd = packing.command('/q/Qdyn6p', 4, launcher='srun -n {cores} {exe}')
+        self.assertEqual(cmd, ['srun', '-n', '4', '/q/Qdyn6p'])
+        own = packing.allowed_cpus()
+        if own is not None:
+            # the group has cpus, the leader may not use: taskset
+            cmd = packing.command('/q/Qdyn6p', 2,
+                                  cpus=own | set([max(own) + 1]))
+            self.assertEqual(cmd[:2], ['taskset', '-c'])
+
+    def test_launch_env(self):
+        env = packing.launch_env({'OMPI_COMM_WORLD_RANK': '3', 'PMI_RANK': '3',
+                                  'PATH': '/bin'})
+        self.assertEqual(env, {'PATH': '/bin'})
+
+    def test_auto_cores(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            os.chdir(tmp)
+            simpacks = []
+            for num, atoms in enumerate([12000, 30000, 2000]):
+                with open('wt.top', 'w') as top:
+                    top.write('Q topology\n'
+                              '{0:8d}{1:8d}    No. of atoms, no. of solute '
+                              'atoms\n'.format(atoms, 1000))
+                simpack = os.path.join(tmp, 'wt_{0}.tar'.format(num))
+                archive.SimpackArchive(simpack).append(['wt.top'])
+                simpacks.append(simpack)
+            self.assertEqual(packing.topology_atoms(simpacks[1]), 30000)
+            self.assertEqual(packing.auto_cores(simpacks, 16),
+                             12000 // packing.ATOMS_PER_CORE)
+            self.assertEqual(packing.auto_cores(simpacks, 2), 2)
+            self.assertEqual(packing.auto_cores([], 16), 1)
+        finally:
+            os.chdir('/')
+            shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+This are unittests for resources.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+import resources
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+LINUX = os.path.exists('/proc/self/status')
+
+
+class MyResourcesTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    @unittest.skipUnless(LINUX, 'needs /proc')
+    def test_sample(self):
+        proc = subprocess.Popen([sys.executable, '-c',
+                                 'import time; time.sleep(5)'])
+        try:
+            sampler = resources.Sampler(interval=10)
+            self.assertTrue(sampler.due(now=100))
+            fname = os.path.join(self.tmp, 'wt_0.tar')
+            open(fname, 'w').close()
+            sample = sampler.sample(proc.pid, self.tmp, fname, now=100)
+        finally:
+            proc.kill()
+            proc.wait()
+        self.assertFalse(sampler.due(now=105))
+        self.assertEqual(len(sample), len(resources.FIELDS) + 1)
+        values = dict(zip(resources.FIELDS, sample[1:]))
+        self.assertTrue(values['rss'] > 0)
+        self.assertTrue(values['load1'] >= 0)
+        self.assertTrue(0 <= values['scratch_fill'] <= 1)
+        self.assertTrue(values['fs_latency'] >= 0)
+        # no pid, missing files
+        sample = sampler.sample(None, None, fname + '.missing')
+        self.assertEqual(sample[1:3], [None, None])
+        self.assertEqual(sample[-1], None)
+        self.assertEqual(len(sampler.take()), 2)
+        self.assertEqual(sampler.take(), [])
+
+    def test_keep(self):
+        sampler = resources.Sampler(keep=3)
+        for now in range(5):
+            sampler.sample(now=now)
+        self.assertEqual([sample[0] for sample in sampler.take()],
+                         [2, 3, 4])
+
+    def test_aggregate(self):
+        rows = []
+        res = resources.Resources(rows.append, window=60)
+        res.last_flush = 1000
+        nones = [None] * (len(resources.FIELDS) - 3)
+        res.add(1, 'node1', [[1001, 100., 0., 500.] + nones,
+                             [1011, 300., 10., 400.] + nones])
+        res.add(2, 'node1', [[1005, None, None, 450.] + nones])
+        res.add(3, 'node2', [])
+        res.flush(now=1030)
+        self.assertEqual(rows, [])
+        res.flush(now=1060)
+        self.assertEqual(len(rows), 1)
+        row = dict(zip(resources.COLUMNS, rows[0]))
+        self.assertEqual((row['host'], row['ranks'], row['samples']),
+                         ('node1', 2, 3))
+        self.assertEqual((row['rss_mean'], row['rss_max'], row['swap_max'],
+                          row['mem_available_min'], row['load1']),
+                         (200., 300., 10., 400., None))
+        self.assertEqual(res.latest['node1']['rss_max'], 300.)
+        res.flush(now=1200, force=True)
+        self.assertEqual(len(rows), 1)
+
+    def test_table(self):
+        name = os.path.join(self.tmp, 'cadee.db')
+        db = tools.SqlDB(name, tables=[resources.TABLE])
+        res = resources.Resources(
+            lambda row: db.insert(resources.TEMPLATE, row))
+        res.add(1, 'node1', [[1001] + [1.] * len(resources.FIELDS)])
+        res.flush(force=True)
+        db.close()
+        conn = sqlite3.connect(name)
+        self.assertEqual(
+            conn.execute('SELECT host, iowait FROM resources').fetchall(),
+            [('node1', 1.)])
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+This are unittests for scratch.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import os
+import shutil
+import tempfile
+
+import archive
+import scratch
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+MB = 1024 * 1024
+
+INPUT = """[MD]
+steps 1000
+stepsize 1.0
+
+[files]
+topology  mutant.top
+{0}
+final     {1}.re
+trajectory {1}.dcd
+energy    {1}.en
+"""
+
+
+def write(fname, size):
+    with open(fname, 'w') as fil:
+        fil.write('x' * size)
+
+
+def node(host, *tiers):
+    """ A report of a worker on host, tiers are (tier, free MB, own MB) """
+    return {'host': host,
+            'tiers': [[tier, free * MB, 1000 * MB, own * MB]
+                      for tier, free, own in tiers]}
+
+
+class MyScratchTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+        self.environ = os.environ.get('CADEE_TMP')
+
+    def tearDown(self):
+        if self.environ is None:
+            os.environ.pop('CADEE_TMP', None)
+        else:
+            os.environ['CADEE_TMP'] = self.environ
+        os.chdir('/')
+        shutil.rmtree(self.tmp)
+
+    def test_tiers(self):
+        os.mkdir('fast')
+        os.environ['CADEE_TMP'] = os.pathsep.join(
+            [self.tmp + '/fast', self.tmp + '/missing', self.tmp + '/'])
+        self.assertEqual(scratch.tiers(), [self.tmp + '/fast', self.tmp])
+        self.assertEqual(scratch.workdir(self.tmp, '/tmp/cadee/123/', 4),
+                         self.tmp + '/cadee/123/4/')
+
+    def test_report(self):
+        os.makedirs('cadee/1/2')
+        write('cadee/1/2/md.dcd', 1000)
+        os.link('cadee/1/2/md.dcd', 'cadee/1/2/snapshot.dcd')
+        self.assertEqual(scratch.usage('cadee'), 1000)
+        data = scratch.report([self.tmp], [self.tmp + '/cadee/1/2/'])
+        tier, free, total, own = data['tiers'][0]
+        self.assertEqual(tier, self.tmp)
+        self.assertTrue(0 < free <= total)
+        self.assertEqual(own, 1000)
+
+    def test_estimate(self):
+        os.mkdir('pack')
+        os.chdir('pack')
+        write('mutant.top', 100)
+        with open('0000_dyn.inp', 'w') as fil:
+            fil.write(INPUT.format('', '0000_dyn'))
+        with open('0010_eq.inp', 'w') as fil:
+            fil.write(INPUT.format('restart 0000_dyn.re', '0010_eq'))
+        simpack = archive.SimpackArchive('../simpack.tar')
+        simpack.append(sorted(os.listdir('.')))
+        # nothing finished: the default per MD step
+        size, per_step = scratch.estimate('../simpack.tar', 10)
+        self.assertEqual(per_step, 10)
+        self.assertEqual(size, sum(entry['size'] for entry
+                                   in simpack.members.values()) + 2000 * 10)
+        # the outputs of the first step
+        for fname, size in (('0000_dyn.re', 100), ('0000_dyn.dcd', 4000),
+                            ('0000_dyn.en.gz', 500), ('0000_dyn.log.gz', 400)):
+            write(fname, size)
+        simpack.append(['0000_dyn.re', '0000_dyn.dcd', '0000_dyn.en.gz',
+                        '0000_dyn.log.gz'])
+        size, per_step = scratch.estimate('../simpack.tar', 10)
+        self.assertEqual(per_step, 5.)
+        self.assertTrue(size >= 1000 * 5)
+
+    def test_placement(self):
+        placement = scratch.Placement(reserve=0.1, min_reserve_mb=0)
+        placement.update(1, node('n1', ('/dev/shm', 300, 0),
+                                 ('/scratch', 900, 0)), now=10)
+        placement.update(2, node('n1', ('/dev/shm', 300, 0),
+                                 ('/scratch', 900, 0)), now=10)
+        self.assertEqual(placement.place(1, 150 * MB, now=20), '/dev/shm')
+        # 300 MB free, 100 MB reserve, 150 MB for rank 1
+        self.assertEqual(placement.place(2, 100 * MB, now=20), '/scratch')
+        # rank 1 has written its outputs: they are in the free space
+        placement.update(1, node('n1', ('/dev/shm', 150, 150),
+                                 ('/scratch', 900, 0)), now=30)
+        self.assertEqual(placement.available(2, '/dev/shm'), 50 * MB)
+        # nothing fits, rank 2 waits for rank 1
+        self.assertEqual(placement.place(2, 2000 * MB), None)
+        placement.finished(1)
+        placement.forget(1)
+        self.assertEqual(placement.place(2, 2000 * MB), '/scratch')
+        # without reports, the worker stays where it is
+        self.assertEqual(placement.place(3, MB), '')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+This are unittests for speculation.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import speculation
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+
+class MySpeculationTests(unittest.TestCase):
+    def test_straggler(self):
+        beats = speculation.Heartbeats(fraction=0.5, timeout=100,
+                                       min_ranks=4)
+        for rank in range(1, 5):
+            beats.start(rank, now=1000)
+        # no median with less than 4 rates
+        self.assertFalse(beats.beat(1, 100, 1., now=1010))
+        for rank in (2, 3, 4):
+            self.assertFalse(beats.beat(rank, 1000, 10., now=1010))
+        self.assertEqual(beats.median(), 10.)
+        self.assertTrue(beats.is_straggler(1, now=1010))
+        self.assertFalse(beats.is_straggler(2, now=1010))
+        # flagged once, with its next heartbeat
+        self.assertTrue(beats.beat(1, 100, 1., now=1015))
+        self.assertFalse(beats.beat(1, 200, 1., now=1020))
+        # silent for too long
+        self.assertTrue(beats.is_straggler(2, now=1200))
+        self.assertEqual(beats.remaining(1, 1200), 1000.)
+        beats.forget(1)
+        self.assertFalse(beats.is_straggler(1, now=1020))
+
+    def test_copy_wins(self):
+        copy = speculation.Copy('/simpacks/wt_0.tar', 3, 7)
+        self.assertEqual(copy.path, '/simpacks/wt_0.tar.spec')
+        # the copy finishes first: abort the original
+        self.assertTrue(copy.report(7, True))
+        self.assertFalse(copy.resolved())
+        self.assertFalse(copy.report(3, False))
+        self.assertTrue(copy.resolved())
+        self.assertEqual(copy.winner, 7)
+
+    def test_failed_copy(self):
+        copy = speculation.Copy('wt_0.tar', 3, 7)
+        # the copy fails, the original continues and wins
+        self.assertFalse(copy.report(7, False))
+        self.assertFalse(copy.report(3, True))
+        self.assertEqual(copy.winner, 3)
+        self.assertTrue(copy.resolved())
+
+
+if __name__ == "__main__":
+    unittest.main()
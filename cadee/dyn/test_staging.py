@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+This are unittests for staging.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import os
+import shutil
+import tempfile
+import archive
+import staging
+from test_archive import DummyTicket
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+
+class MyStagingTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp)
+        os.mkdir('work')
+        self.tar = os.path.join(self.tmp, 'wt_0.tar')
+        with open('eq1.inp', 'w') as fil:
+            fil.write('steps 10\n')
+        archive.SimpackArchive(self.tar).append(['eq1.inp'])
+        self.prefetcher = staging.Prefetcher(
+            DummyTicket, os.path.join(self.tmp, 'stage'))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
+
+    def test_take(self):
+        self.prefetcher.prefetch(self.tar)
+        self.assertTrue(self.prefetcher.take(self.tar, 'work'))
+        self.assertEqual(os.listdir('work'), ['eq1.inp'])
+        self.assertFalse(os.path.exists('stage'))
+
+    def test_other_simpack(self):
+        self.prefetcher.prefetch(self.tar)
+        self.assertFalse(self.prefetcher.take(self.tar + '.other', 'work'))
+        self.assertEqual(os.listdir('work'), [])
+        self.assertFalse(os.path.exists('stage'))
+
+    def test_modified_simpack(self):
+        self.prefetcher.prefetch(self.tar)
+        self.prefetcher._join()
+        archive.SimpackArchive(self.tar).append(['eq1.inp'])
+        self.assertFalse(self.prefetcher.take(self.tar, 'work'))
+        self.assertEqual(os.listdir('work'), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
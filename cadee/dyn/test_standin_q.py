@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+This are unittests for standin_q.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from StringIO import StringIO
+
+import standin_q
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+STANDIN = os.path.join(os.path.dirname(os.path.abspath(standin_q.__file__)),
+                       'standin_q.py')
+
+INPUT = """[MD]
+ steps                100
+ stepsize             1
+[Intervals]
+ output               10
+ energy               1
+ trajectory           50
+[Files]
+ topology             mutant.top
+ restart              eq.re
+ final                fep.re
+ trajectory           fep.dcd
+ energy               fep.en
+ fep                  mutant.fep
+[Lambdas]
+  0.45 0.55
+"""
+
+
+class MyStandinQTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+        with open('fep.inp', 'w') as fil:
+            fil.write(INPUT)
+        with open('mutant.top', 'w') as fil:
+            fil.write('Q topology\n    1000     300    No. of atoms\n')
+        os.environ['CADEE_STANDIN_STEP_SECONDS'] = '0'
+
+    def tearDown(self):
+        os.chdir('/')
+        shutil.rmtree(self.tmp)
+        del os.environ['CADEE_STANDIN_STEP_SECONDS']
+
+    def test_missing_restart(self):
+        out = StringIO()
+        self.assertEqual(standin_q.Qdyn('fep.inp', out).run(), 1)
+        self.assertIn('ABNORMAL TERMINATION', out.getvalue())
+
+    def test_qdyn(self):
+        open('eq.re', 'w').close()
+        out = StringIO()
+        self.assertEqual(standin_q.Qdyn('fep.inp', out).run(), 0)
+        log = out.getvalue().splitlines()
+        self.assertGreater(len(log), 100)
+        self.assertIn('terminated normally', log[-1])
+        self.assertEqual(len([line for line in log
+                              if 'Energy summary at step' in line]), 11)
+        self.assertEqual(os.path.getsize('fep.re'), 2 * 1000 * 24 + 64)
+        self.assertEqual(os.path.getsize('fep.en'),
+                         100 * standin_q.ENERGY_FRAME_BYTES)
+        self.assertEqual(os.path.getsize('fep.dcd'), 276 + 2 * 12008)
+
+    def test_failure(self):
+        open('eq.re', 'w').close()
+        os.environ['CADEE_STANDIN_FAIL'] = '1'
+        try:
+            out = StringIO()
+            self.assertEqual(standin_q.Qdyn('fep.inp', out).run(), 1)
+        finally:
+            del os.environ['CADEE_STANDIN_FAIL']
+        self.assertIn('Terminating due to shake failure', out.getvalue())
+
+    def test_qfep(self):
+        with open('fep.en', 'wb') as fil:
+            fil.write(' ' * 10 * standin_q.ENERGY_FRAME_BYTES)
+        link = os.path.join(self.tmp, 'Qfep6')
+        os.symlink(STANDIN, link)
+        inp = ('1\n2 0\n0.596 0\n20\n20\n0\n1\n1 2 10 0 0 0\n1 -1\n'
+               'fep.en\nstop\n')
+        proc = subprocess.Popen([sys.executable, link], stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE)
+        out = proc.communicate(inp)[0]
+        self.assertEqual(proc.returncode, 0)
+        self.assertTrue(out.startswith('# Qfep'))
+        for header in (standin_q.PART0_HEADER, standin_q.PART1_HEADER,
+                       standin_q.PART2_HEADER, standin_q.PART3_HEADER):
+            self.assertIn('\n' + header + '\n', out)
+
+    def test_well(self):
+        self.assertAlmostEqual(standin_q.well(0.25, 15, -5), 0)
+        self.assertAlmostEqual(standin_q.well(0.5, 15, -5), 15)
+        self.assertAlmostEqual(standin_q.well(0.75, 15, -5), -5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+This are unittests for synthetic.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import os
+import shutil
+import tarfile
+import tempfile
+
+import archive
+import packing
+import synthetic
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+
+class MySyntheticTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        os.chdir('/')
+        shutil.rmtree(self.tmp)
+
+    def test_scale_steps(self):
+        text = ('[MD]\n steps                1250\n stepsize 1\n'
+                '[Intervals]\n steps 7\n')
+        self.assertEqual(synthetic.scale_steps(text, 0.01),
+                         '[MD]\n steps                13\n stepsize 1\n'
+                         '[Intervals]\n steps 7\n')
+        self.assertIn('steps 1\n', synthetic.scale_steps('[MD]\nsteps 5\n',
+                                                         0.))
+
+    def test_generate(self):
+        simpacks = synthetic.generate(self.tmp, 2, replicas=2,
+                                      atoms=[1000, 2000], steps_scale=0.001)
+        self.assertEqual([os.path.basename(simpack) for simpack in simpacks],
+                         ['S0000_0.tar', 'S0000_1.tar', 'S0001_0.tar',
+                          'S0001_1.tar'])
+        self.assertEqual(packing.topology_atoms(simpacks[2]), 2000)
+        names = archive.SimpackArchive(simpacks[0]).names()
+        self.assertIn('mutant.top', names)
+        self.assertIn('mutant.fep', names)
+        with tarfile.open(synthetic.TEMPLATE) as tar:
+            inputs = [name for name in tar.getnames()
+                      if name.endswith('.inp')]
+        self.assertEqual(len([name for name in names
+                              if name.endswith('.inp')]), len(inputs))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""
+This are unittests for tools.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import tools
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+
+class _Comm(object):
+    """ Records the messages sent """
+    def __init__(self, sent):
+        self.sent = sent
+
+    def send(self, obj, dest, tag):
+        self.sent.append(obj)
+
+
+class _LockedConn(object):
+    """ Connection, that fails to commit once """
+    def __init__(self, conn):
+        self.conn = conn
+        self.locked = True
+
+    def commit(self):
+        if self.locked:
+            self.locked = False
+            raise sqlite3.OperationalError('database is locked')
+        self.conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+class MyToolsTests(unittest.TestCase):
+    def test_md5sum(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tmp, 'eq1.dcd')
+            data = os.urandom(3000)
+            with open(fname, 'wb') as fil:
+                fil.write(data)
+            self.assertEqual(tools.md5sum(fname, chunksize=1024),
+                             hashlib.md5(data).hexdigest())
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_suppress_similar(self):
+        forwarder = tools._LogForwarder()
+        limit = tools.LOG_SIMILAR[logging.INFO]
+
+        def record(msg, level=logging.INFO):
+            return logging.LogRecord('dyn', level, '', 0, msg, (1,), None)
+
+        suppressed = [forwarder.suppress(record('SHAKE %s'))
+                      for _ in range(limit + 5)]
+        self.assertEqual(suppressed.count(True), 5)
+        # other messages and errors are not affected
+        self.assertFalse(forwarder.suppress(record('other %s')))
+        self.assertFalse(forwarder.suppress(record('SHAKE %s',
+                                                   logging.ERROR)))
+
+        forwarder._summarize(logging.Formatter('%(message)s'))
+        self.assertEqual(forwarder.buffer, [
+            '5 similar messages suppressed in {0}s: SHAKE %s'.format(
+                int(tools.LOG_WINDOW))])
+        self.assertFalse(forwarder.suppress(record('SHAKE %s')))
+
+    def test_suppress_window(self):
+        forwarder = tools._LogForwarder()
+        formatter = logging.Formatter('%(message)s')
+        limit = tools.LOG_SIMILAR[logging.INFO]
+        record = logging.LogRecord('dyn', logging.INFO, '', 0, 'SHAKE', (),
+                                   None)
+        for _ in range(limit + 3):
+            forwarder.suppress(record, formatter)
+        self.assertTrue(forwarder.suppress(record, formatter))
+        # the window rolls over with the next similar message
+        forwarder.window -= tools.LOG_WINDOW + 1
+        self.assertFalse(forwarder.suppress(record, formatter))
+        self.assertEqual(forwarder.buffer, [
+            '4 similar messages suppressed in {0}s: SHAKE'.format(
+                int(tools.LOG_WINDOW))])
+
+        # the last flush sends pending summaries, but keeps the window
+        forwarder.buffer = []
+        for _ in range(limit + 1):  # one was counted at the roll over
+            forwarder.suppress(record, formatter)
+        sent = []
+        comm = tools.mpi.comm
+        try:
+            tools.mpi.comm = _Comm(sent)
+            forwarder.flush()
+            self.assertEqual(sent, [])
+            forwarder.flush(final=True)
+        finally:
+            tools.mpi.comm = comm
+        self.assertEqual(sent, [[
+            '2 similar messages suppressed in {0}s: SHAKE'.format(
+                int(tools.LOG_WINDOW))]])
+        self.assertTrue(forwarder.suppress(record, formatter))
+
+    @staticmethod
+    def _result(replik):
+        res = tools.Results('wt', replik, 'fep_000', 'us')
+        res.dg(12.5, -3.2)
+        res.temp(300.1, 299.8, 300.4, 298.9)
+        res.ene(1200.5, -5400.2, -4199.7)
+        return res
+
+    def _rows(self, name):
+        conn = sqlite3.connect(name)
+        rows = conn.execute('SELECT mutant, replik FROM results').fetchall()
+        conn.close()
+        return rows
+
+    def test_sqldb(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            for threaded in (True, False):
+                name = os.path.join(tmp, 'cadee{0}.db'.format(threaded))
+                db = tools.SqlDB(name, interval=3600, threaded=threaded,
+                                 batch=3)
+                for i in range(5):
+                    db.add_row(self._result(i))
+                # a bad row does not cost the other rows
+                db.add_row(['too', 'short'])
+                db.flush()
+                self.assertEqual(len(self._rows(name)), 5)
+                db.add_row(self._result(5).items())
+                db.close()
+                self.assertEqual([r[1] for r in self._rows(name)], range(6))
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_sqldb_locked(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            name = os.path.join(tmp, 'cadee.db')
+            db = tools.SqlDB(name, interval=3600)
+            db.conn = _LockedConn(db.conn)
+            db.add_row(self._result(0))
+            # the writer survives the failed commit, flush returns
+            db.flush()
+            self.assertEqual(len(self._rows(name)), 0)
+            db.add_row(self._result(1))
+            db.flush()
+            db.close()
+            self.assertEqual([r[1] for r in self._rows(name)], [0, 1])
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_sqldb_busy(self):
+        tmp = tempfile.mkdtemp()
+        timeout = tools.SQL_TIMEOUT
+        try:
+            tools.SQL_TIMEOUT = 0.1
+            name = os.path.join(tmp, 'cadee.db')
+            db = tools.SqlDB(name, interval=3600)
+            other = sqlite3.connect(name, isolation_level=None)
+            other.execute('BEGIN EXCLUSIVE')
+            for i in range(3):
+                db.add_row(self._result(i))
+            # database is locked: the rows are kept, not dropped as bad
+            db.flush()
+            other.execute('ROLLBACK')
+            other.close()
+            db.close()
+            self.assertEqual([r[1] for r in self._rows(name)], [0, 1, 2])
+        finally:
+            tools.SQL_TIMEOUT = timeout
+            shutil.rmtree(tmp)
+
+    def test_sqldb_tables(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            name = os.path.join(tmp, 'cadee.db')
+            db = tools.SqlDB(name, tables=[
+                'CREATE TABLE IF NOT EXISTS other (a int, b text)'])
+            db.add_row(self._result(0))
+            db.insert('INSERT INTO other VALUES (?,?)', [1, 'one'])
+            db.insert('INSERT INTO other VALUES (?,?)', [2])  # bad row
+            db.add_row(self._result(1))
+            db.close()
+            self.assertEqual(len(self._rows(name)), 2)
+            conn = sqlite3.connect(name)
+            self.assertEqual(conn.execute('SELECT * FROM other').fetchall(),
+                             [(1, 'one')])
+            conn.close()
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+This are unittests for trajectory.py
+
+Author: {0} ({1})
+
+This program is part of CADEE, the framework for
+Computer-Aided Directed Evolution of Enzymes.
+"""
+
+
+from __future__ import print_function
+import unittest
+import gzip
+import os
+import shutil
+import tempfile
+
+import compression
+import manifest
+import trajectory
+
+__author__ = "Beat Amrein"
+__email__ = "beat.amrein@gmail.com"
+
+INPUT = """[MD]
+steps 100
+stepsize 1.0
+
+[files]
+topology  mutant.top
+final     md_eq1.re
+energy    md_eq1.en
+"""
+
+
+class MyTrajectoryTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+        with open('md_eq1.inp', 'w') as fil:
+            fil.write(INPUT)
+
+    def tearDown(self):
+        os.chdir('/')
+        shutil.rmtree(self.tmp)
+
+    @staticmethod
+    def _log(lines, end):
+        with open('md_eq1.log', 'w') as fil:
+            for num in range(lines):
+                fil.write('line {0}\n'.format(num))
+                if num == 10:
+                    fil.write(trajectory.WARNING_HOT_ATOM + ' 12\n')
+            fil.write(end + '\n')
+
+    def _unit(self):
+        return trajectory.WorkUnit(1, 'md_eq1.inp', ['mutant.top', ''])
+
+    def test_tail_lines(self):
+        self._log(5000, 'the end')
+        self.assertEqual(trajectory.tail_lines('md_eq1.log', 3),
+                         ['line 4998\n', 'line 4999\n', 'the end\n'])
+        self.assertEqual(len(trajectory.tail_lines('md_eq1.log', 10000)),
+                         5002)
+
+    def test_normal_termination(self):
+        self._log(5000, 'Qdyn5 ' + trajectory.NORMALTERM)
+        with open('md_eq1.en', 'w') as fil:
+            fil.write('energies')
+        unit = self._unit()
+        self.assertEqual(unit.status, 0)
+        self.assertEqual(unit.logfile[0], 'md_eq1.log.gz')
+        self.assertFalse(os.path.exists('md_eq1.log'))
+        self.assertEqual(len(gzip.open('md_eq1.log.gz').readlines()), 5002)
+        self.assertEqual(unit.hot_atoms, 1)
+        self.assertTrue(os.path.exists('md_eq1.en.gz'))
+        # the compressed log is checked again
+        self.assertEqual(unit.checklogfile(), 0)
+        self.assertEqual(unit.hot_atoms, 1)
+
+    def test_background_compression(self):
+        self._log(5000, 'Qdyn5 ' + trajectory.NORMALTERM)
+        with open('md_eq1.en', 'w') as fil:
+            fil.write('energies')
+        progress = manifest.Manifest('.')
+        compressor = compression.Compressor()
+        unit = trajectory.WorkUnit(1, 'md_eq1.inp', ['mutant.top', ''],
+                                   manifest=progress, compressor=compressor)
+        self.assertEqual(unit.status, 0)
+        compressor.flush()
+        self.assertFalse(unit.compressing)
+        self.assertEqual(unit.logfile[0], 'md_eq1.log.gz')
+        self.assertEqual(unit.hot_atoms, 1)
+        self.assertEqual(sorted(os.listdir('.')), [
+            'cadee_progress.json', 'md_eq1.en.gz', 'md_eq1.inp',
+            'md_eq1.log.gz'])
+        # recorded, when the log was compressed
+        self.assertTrue(manifest.Manifest('.').finished(unit))
+
+    def test_failures(self):
+        self._log(5000, trajectory.SHAKE_TERM)
+        self.assertEqual(self._unit().status, trajectory.ERR_SHAKE)
+        # failed logs are not compressed
+        self.assertTrue(os.path.exists('md_eq1.log'))
+        self._log(50, trajectory.NORMALTERM)
+        self.assertEqual(self._unit().status, trajectory.ERR_LOG_TOO_SHORT)
+        self._log(5000, 'killed')
+        self.assertEqual(self._unit().status, trajectory.ERR_ABNORMAL_TERM)
+
+
+if __name__ == "__main__":
+    unittest.main()
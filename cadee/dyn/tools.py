@@ -16,6 +16,7 @@ import stat
 import gzip
 import hashlib
 import logging
+import threading
 import time
 import sqlite3
 
@@ -26,6 +27,22 @@ __email__ = "beat.amrein@gmail.com"
 
 NLC = '\n'
 
+# log messages of worker ranks are buffered and sent to rank 0 in batches
+LOG_FLUSH_INTERVAL = 5.0  # [s] max. age of a buffered message, when flushing
+LOG_FLUSH_LINES = 100     # max. number of buffered messages
+LOG_FLUSH_LEVEL = logging.WARNING  # messages >= level are sent immediately
+LOG_WINDOW = 60.0         # [s] window, in which similar messages are counted
+# max. similar messages (same logger, level and format) per window and level,
+# more are suppressed and summarized; levels not listed are never suppressed
+LOG_SIMILAR = {logging.DEBUG: 10, logging.INFO: 20, logging.WARNING: 50}
+
+# results database
+SQL_COMMIT_INTERVAL = 2   # [s] max. delay of a result, until it is committed
+SQL_BATCH = 10000         # max. rows per transaction
+SQL_JOURNAL_MODE = 'WAL'  # readers do not block the writer
+SQL_SYNCHRONOUS = 'NORMAL'  # with WAL: consistent, fsync only on checkpoint
+SQL_TIMEOUT = 60          # [s] to wait for a lock of another connection
+
 
 class cd:
     """Context manager for changing the current working directory
@@ -50,6 +67,18 @@ def filname(fil):
     return os.path.split(fil)[1]
 
 
+def md5sum(fname, chunksize=1024*1024):
+    """return md5 hexdigest of fname, read in chunks of chunksize bytes"""
+    md5 = hashlib.md5()
+    with open(fname, 'rb') as fil:
+        while True:
+            buf = fil.read(chunksize)
+            if not buf:
+                break
+            md5.update(buf)
+    return md5.hexdigest()
+
+
 class Results(object):
     """
     Very complicated object to hold information on results.
@@ -157,7 +186,7 @@ def report_results(results):
     """
     if mpi.mpi:
         if mpi.rank != mpi.root:
-            mpi.comm.send(results.items(), mpi.root, tag=mpi.Tags.RESULTS)
+            mpi.comm.send(results.items(), mpi.parent, tag=mpi.Tags.RESULTS)
             return
         else:
             logger.warning('Rank0 reports results!')
@@ -171,6 +200,104 @@ def report_results(results):
         db.close()
 
 
+class _LogForwarder(object):
+    """ Buffer and rate limit of log messages of a worker rank.
+
+    Shared by all LogFileHandlers of a rank, so messages stay in order.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.buffer = []
+        self.oldest = None  # time of the oldest buffered message
+        self.window = time.time()
+        self.similar = {}  # (name, level, msg): [count, suppressed]
+        self.formatter = None  # of the last message, for summaries
+
+    def suppress(self, record, formatter=None):
+        """ Count record, return True if it is suppressed """
+        limit = LOG_SIMILAR.get(record.levelno)
+        if limit is None:
+            return False
+        key = (record.name, record.levelno, str(record.msg))
+        with self.lock:
+            if formatter is not None:
+                self.formatter = formatter
+            if time.time() - self.window > LOG_WINDOW:
+                self._summarize(self.formatter)
+            counts = self.similar.setdefault(key, [0, 0])
+            counts[0] += 1
+            if counts[0] > limit:
+                counts[1] += 1
+                return True
+        return False
+
+    def _summarize(self, formatter, restart=True):
+        """ Buffer a summary of suppressed messages
+
+        If restart, start a new window, else only the suppressed messages
+        are reset and similar messages stay suppressed until the window ends.
+        """
+        if formatter is None:
+            formatter = logging.Formatter()
+        for (name, level, msg), counts in self.similar.items():
+            if counts[1] > 0:
+                record = logging.LogRecord(
+                    name, level, '', 0,
+                    '%s similar messages suppressed in %ss: %s',
+                    (counts[1], int(LOG_WINDOW), msg), None)
+                self.buffer.append(formatter.format(record))
+                counts[1] = 0
+        if restart:
+            self.similar = {}
+            self.window = time.time()
+
+    def add(self, msg, level, formatter):
+        """ Buffer msg, send buffer if it is full, old or msg important """
+        with self.lock:
+            self.formatter = formatter
+            now = time.time()
+            if now - self.window > LOG_WINDOW:
+                self._summarize(formatter)
+            if self.oldest is None:
+                self.oldest = now
+            self.buffer.append(msg)
+            if (level >= LOG_FLUSH_LEVEL or
+                    len(self.buffer) >= LOG_FLUSH_LINES or
+                    now - self.oldest >= LOG_FLUSH_INTERVAL):
+                self.flush()
+
+    def flush(self, final=False):
+        """ Send buffered messages to parent rank, as one message.
+        Summaries of suppressed messages are sent, when their window has
+        ended, or if final (eg. the rank stops).
+        """
+        with self.lock:
+            if time.time() - self.window > LOG_WINDOW:
+                self._summarize(self.formatter)
+            elif final:
+                self._summarize(self.formatter, restart=False)
+            if len(self.buffer) == 0:
+                return
+            if mpi.is_finalized():
+                # eg. logging.shutdown at exit
+                self.buffer = []
+                return
+            mpi.comm.send(self.buffer, mpi.parent, tag=mpi.Tags.LOG)
+            self.buffer = []
+            self.oldest = None
+
+
+_forwarder = _LogForwarder()
+
+
+def flush_logs(final=False):
+    """ Send buffered log messages of this rank to rank 0
+    @param final: also the summaries of suppressed messages
+    """
+    if mpi.mpi and mpi.rank != 0:
+        _forwarder.flush(final)
+
+
 class LogFileHandler(logging.StreamHandler):
     def __init__(self, logfile=None):
 
@@ -191,20 +318,32 @@ class LogFileHandler(logging.StreamHandler):
         #self.emit(msg % (self.logfile, mpi.mpi, mpi.rank))
 
     def emit(self, record):
+        if isinstance(record, list):
+            # batch of messages from a worker rank
+            for msg in record:
+                self.emit(msg)
+            return
+
         if isinstance(record, str):
             msg = record
         else:
             # print(record)
+            if (mpi.mpi and mpi.rank != 0 and
+                    _forwarder.suppress(record, self.formatter)):
+                return
             msg = self.format(record)
 
         if mpi.mpi:
             if mpi.rank != 0:
-                mpi.comm.send(msg, 0, tag=mpi.Tags.LOG)
+                level = getattr(record, 'levelno', logging.INFO)
+                _forwarder.add(msg, level, self.formatter)
                 return
 
         print(msg, file=self.logfile)
 
     def flush(self):
+        if mpi.mpi and mpi.rank != 0:
+            _forwarder.flush()
         if self.logfile is not None:
             if mpi.mpi:
                 if mpi.rank == 0:
@@ -532,49 +671,219 @@ class QmapfepSettings(object):
         self.bins = bins
 
 
+# errors of rows, that can not be stored
+BAD_ROW = (ValueError, sqlite3.IntegrityError, sqlite3.InterfaceError,
+           sqlite3.ProgrammingError)
+
+
 class SqlDB(object):
-    def __init__(self, name, interval=300):
+    """ results table in a SQLite database.
+
+    Rows are written by a writer thread, in batches (executemany), and
+    committed at least every interval seconds (group commit). add_row
+    does not block on the disk. This does not insert more rows per second
+    (see bench_sqldb.py), the caller just does not wait for the commits.
+    Rows of other tables (eg. the samples of resources.py) are written the
+    same way, with insert.
+    """
+    def __init__(self, name, interval=SQL_COMMIT_INTERVAL, threaded=True,
+                 journal_mode=SQL_JOURNAL_MODE, synchronous=SQL_SYNCHRONOUS,
+                 batch=SQL_BATCH, tables=()):
         """Connect to database and initialize table if not exists
         :param name: path to database
-        :param interval: interval (seconds) between committing changes
+        :param interval: max. interval (seconds) between committing changes
+        :param threaded: write in a writer thread, else in add_row
+        :param journal_mode: sqlite journal_mode, eg. WAL or DELETE
+        :param synchronous: sqlite synchronous, eg. NORMAL or FULL
+        :param batch: max. number of rows per executemany
+        :param tables: CREATE TABLE statements of other tables
         :type name: str
         :type interval: int
         """
-        self.conn = sqlite3.connect(name)
-        self.cursor = self.conn.cursor()
-        self.cursor.execute('''CREATE TABLE IF NOT EXISTS results
+        self.name = name
+        self.commit_interval = interval
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.batch = batch
+        self.tables = tables
+        self.template = 'INSERT INTO results VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)'    # NOPEP8
+        self.pending = []   # [template, row], not yet written
+        self.first = None   # time of the oldest pending row
+        self.flushes = []   # events, set when pending rows are committed
+        self.closing = False
+        self.retry = False  # the last commit failed, wait before the next
+        self.written = 0
+        self.thread = None
+        if threaded:
+            self.cond = threading.Condition(threading.Lock())
+            ready = threading.Event()
+            self.thread = threading.Thread(target=self._loop, args=(ready,),
+                                           name='sqldb')
+            self.thread.daemon = True
+            self.thread.start()
+            ready.wait()
+        else:
+            self._connect()
+
+    def _connect(self):
+        self.conn = sqlite3.connect(self.name, timeout=SQL_TIMEOUT)
+        mode = self.conn.execute(
+            'PRAGMA journal_mode={0}'.format(self.journal_mode)).fetchone()
+        if str(mode[0]).lower() != self.journal_mode.lower():
+            logger.warning('%s: journal_mode is %s', self.name, mode[0])
+        self.conn.execute('PRAGMA synchronous={0}'.format(self.synchronous))
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS results
         (time int, mutant text, replik int, name text, feptype text, barr_forw real, exo real, barr_back real, ttot real, tfree real, tfreesolute real, tfreesolvent real,  ene_kin real, ene_pot real, ene_tot real); ''')  # NOPEP8
+        for table in self.tables:
+            self.conn.execute(table)
         #self.cursor.execute('''CREATE VIEW IF NOT EXISTS avg as
         #SELECT avg(barr_forw), avg(exo), avg(barr_back), avg(ttot), avg(tfree), avg(ene_tot), avg(ene_pot), avg(ene_kin) FROM results; ''')  # NOPEP8
-        self.commit_interval = interval
-        self.commit()
-        self.template = 'INSERT INTO results VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)'    # NOPEP8
+        self.conn.commit()
+
+    def _loop(self, ready):
+        """ writer thread: write pending rows, when there are enough of
+        them, when the oldest is interval seconds old, on flush or close.
+        """
+        self._connect()
+        ready.set()
+        while True:
+            with self.cond:
+                while (len(self.pending) == 0 and not self.closing and
+                       len(self.flushes) == 0):
+                    self.cond.wait()
+                while ((len(self.pending) < self.batch or self.retry) and
+                       not self.closing and len(self.flushes) == 0):
+                    remaining = self.first + self.commit_interval - time.time()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                rows = self.pending
+                flushes = self.flushes
+                closing = self.closing
+                self.pending = []
+                self.flushes = []
+                self.first = None
+            try:
+                rows = self._write(rows)
+            finally:
+                # never leave flush() waiting
+                for done in flushes:
+                    done.set()
+            self.retry = len(rows) > 0
+            if self.retry:
+                if closing:
+                    logger.critical('Lost %s rows.', len(rows))
+                else:
+                    # retry, after interval seconds or on flush
+                    with self.cond:
+                        self.pending = rows + self.pending
+                        self.first = time.time()
+            if closing:
+                self.conn.close()
+                return
+
+    def _rollback(self):
+        """ rollback, after a failed commit """
+        try:
+            self.conn.rollback()
+        except sqlite3.Error as err:
+            logger.critical('Unable to rollback %s; %s', self.name, err)
+
+    def _write(self, rows):
+        """ write and commit rows, [template, row]
+        return the rows, that were not committed, eg. database is locked
+        """
+        if len(rows) == 0:
+            return []
+        # consecutive rows of a table in one executemany
+        start = 0
+        while start < len(rows):
+            template = rows[start][0]
+            end = start
+            while end < len(rows) and rows[end][0] == template:
+                end += 1
+            try:
+                self._execute(template, [row for _, row in rows[start:end]])
+            except sqlite3.Error as err:
+                logger.critical('Unable to commit %s rows to %s; %s',
+                                len(rows) - start, self.name, err)
+                self._rollback()
+                self.written += start
+                return rows[start:]
+            start = end
+        self.written += len(rows)
+        logger.debug('Committed %s rows to %s.', len(rows), self.name)
+        return []
+
+    def _execute(self, template, rows):
+        """ write and commit rows of a template
+        raises sqlite3.OperationalError, eg. database is locked or disk is
+        full: the rows are not bad, they are written again later
+        """
+        try:
+            self.conn.executemany(template, rows)
+        except BAD_ROW:
+            # find the bad row(s)
+            self.conn.rollback()
+            for row in rows:
+                try:
+                    self.conn.execute(template, row)
+                except BAD_ROW as e:
+                    logger.critical('Unable to store row; %s', e)
+                    logger.critical('template: %s', template)
+                    logger.critical('results:  %s', row)
+        self.conn.commit()
 
     def flush(self):
-        self.commit()
+        """ Write and commit all rows added so far """
+        if self.thread is None:
+            self.pending = self._write(self.pending)
+            self.first = None if len(self.pending) == 0 else time.time()
+            return
+        done = threading.Event()
+        with self.cond:
+            self.flushes.append(done)
+            self.cond.notify()
+        done.wait()
 
     def commit(self):
-        self.conn.commit()
-        logger.info('Committed cadee.db.')
-        self.last_commit = time.time()
+        self.flush()
 
     def add_row(self, results):
         if isinstance(results, Results):
             results = results.items()
-        try:
-            self.cursor.execute(self.template, results)
-        except ValueError as e:
-            logger = getLogger(__name__)
-            logger.critical('Unable to store rows; ValueError %s', e)
-            logger.critical('template: %s', self.template)
-            logger.critical('results:  %s', results)
-        except ProgrammingError as e:
-            getLogger(__name__).exception('ProgrammingError %s', results)
-        if self.last_commit + self.commit_interval < time.time() :
-            self.commit()
+        self.insert(self.template, results)
+
+    def insert(self, template, row):
+        """ Add row, to be written with template (an INSERT) """
+        if self.thread is None:
+            self.pending.append([template, row])
+            if self.first is None:
+                self.first = time.time()
+            if (len(self.pending) >= self.batch or
+                    time.time() - self.first >= self.commit_interval):
+                self.flush()
+            return
+        with self.cond:
+            self.pending.append([template, row])
+            if len(self.pending) == 1:
+                # the writer waits for the first row, to start the interval
+                self.first = time.time()
+                self.cond.notify()
+            elif len(self.pending) >= self.batch:
+                self.cond.notify()
 
     def close(self):
-        self.commit()
+        if self.thread is None:
+            self.flush()
+            self.conn.close()
+            return
+        with self.cond:
+            self.closing = True
+            self.cond.notify()
+        self.thread.join()
+        self.thread = None
+        logger.info('Committed %s rows to %s.', self.written, self.name)
 
 
 logger = getLogger(__name__)
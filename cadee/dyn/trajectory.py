@@ -13,12 +13,16 @@ Computer-Aided Directed Evolution of Enzymes.
 from __future__ import print_function
 from filecmp import cmp as comparefiles
 from platform import node as hostname
+import collections
 import gzip
 import os
+import re
 import subprocess
 import shutil
 import time
 import analysis
+import compression
+import manifest
 import tools
 
 from tools import File
@@ -40,7 +44,6 @@ logger = tools.getLogger('dyn.traj')
 #       4: compress/uncompress pdbfile
 #       5: compress/uncompress topology
 #       6: compress/uncompress input files
-#       7: fastforward md.QdynPackage, when loaded
 #       8: mutation starting from just a sequence
 #       9: Add flag: has_failed use instead of rising exception
 #
@@ -57,6 +60,14 @@ NORMALTERM = "terminated normally"
 NAN_INDICATOR = 'SUM                    NaN       NaN       NaN'
 SHAKE_TERM = "Terminating due to shake failure"
 WARNING_HOT_ATOM = ">>> WARNING: hot atom, i ="
+STEP_LINE = re.compile(r'at step\s+(\d+)')  # energy summaries of Qdyn
+WALLCLOCK_LINE = re.compile(r'Seconds per step \(wall-clock\):\s*([0-9.eE+-]+)')
+
+MONITOR_INTERVAL = 0.5  # [s] the monitor is called while Qdyn runs
+PROGRESS_TAIL = 64 * 1024  # [bytes] read to find the current step
+TAIL_BLOCK = 8 * 1024  # [bytes] read at once, when reading backwards
+MIN_LOG_LINES = 100  # shorter logs are incomplete
+TERM_LINES = 50  # the termination of Qdyn is in the last lines
 
 ERR_LOG_TOO_SHORT = 1
 ERR_ABNORMAL_TERM = 2
@@ -65,6 +76,38 @@ ERR_SHAKE = 8
 ERR_NAN = 16
 
 
+class ComputeError(Exception):
+    """ A step of Qdyn has failed """
+    def __init__(self, inputfile, status, exitcode):
+        """
+        @param status: bitmask of ERR_*, see WorkUnit.checklogfile
+        @param exitcode: of Qdyn
+        """
+        Exception.__init__(self, 'computation failed', inputfile, status,
+                           exitcode)
+        self.inputfile = inputfile
+        self.status = status
+        self.exitcode = exitcode
+
+
+def tail_lines(fname, count):
+    """ Return the last count lines of fname, read backwards from its end.
+
+    Only the blocks with the last lines are read.
+    """
+    with open(fname, 'rb') as fil:
+        fil.seek(0, os.SEEK_END)
+        pos = fil.tell()
+        data = ''
+        # one more line break, so the first line returned is complete
+        while pos > 0 and data.count(NLC) <= count:
+            size = min(TAIL_BLOCK, pos)
+            pos -= size
+            fil.seek(pos)
+            data = fil.read(size) + data
+    return data.splitlines(True)[-count:]
+
+
 class WorkUnit(object):
     """ container for 1 qdyn-simuluation """
     # class WorkUnitException(Exception):
@@ -88,7 +131,13 @@ class WorkUnit(object):
 
     def __init__(self, unitnumber, inputfile, topology,
                  pdbfile=None, fepfile=None, restraintfile=None,
-                 restartfile=None):
+                 restartfile=None, manifest=None, compressor=None):
+        """
+        @param manifest: manifest.Manifest of the simpack; if it records
+                         this unit as finished, its log is not checked
+        @param compressor: compression.Compressor of the log and the
+                           energies, default: compress in place
+        """
 
         if isinstance(inputfile, str):
             inputfile = [inputfile, '']
@@ -123,6 +172,14 @@ class WorkUnit(object):
         self.time = 0
         self.status = None
         self.q_exitcode = None
+        self.pid = None  # of the running Qdyn, see resources.py
+        self.trusted = False  # finished according to the manifest
+        self.compressing = False  # the log is compressed in the background
+
+        self.manifest = manifest
+        if compressor is None:
+            compressor = compression.Compressor(background=False)
+        self.compressor = compressor
 
         self._parse_inputfile()
 
@@ -140,7 +197,14 @@ class WorkUnit(object):
             else:
                 fname = log
             self.logfile = [fname, '']
-            if os.path.exists(fname):
+            # the log of a trusted unit may have been left in the archive
+            if manifest is not None and manifest.finished(self):
+                self.trusted = not manifest.verify
+            if self.trusted:
+                logger.debug('finished, according to the manifest: %s',
+                             self.inputfile[0])
+                self.status = 0
+            elif os.path.exists(fname):
                 self.checklogfile()
                 if self.status != 0:
                     logger.warning('A log file exists BUT with status: %s !', self.status)
@@ -257,8 +321,15 @@ class WorkUnit(object):
                            self.inputfile)
             raise (Exception, 'Fatal: no files section in input file')
 
-    def run(self, exe):
-        """ run simulation with executable exe """
+    def run(self, exe, env=None, monitor=None):
+        """ run simulation with executable exe
+
+        @param exe: path to the executable, or a command (list)
+        @param env: environment of the executable, default: inherited
+        @param monitor: called with this WorkUnit every MONITOR_INTERVAL
+                        while the executable runs; if it raises, the
+                        executable is terminated and the exception passed on
+        """
         if os.path.isfile(self.logfile[0]):
             self.status = self.checklogfile()
             if self.status == 0:
@@ -274,15 +345,30 @@ class WorkUnit(object):
 
         # run q
         start = time.time()
-        cmd = exe + " " + ifname
+        if isinstance(exe, list):
+            cmd = exe + [ifname]
+        else:
+            cmd = [exe, ifname]
         logger.info("%s", ifname)
-        logger.debug("%s %s", hostname(), cmd)
+        logger.debug("%s %s", hostname(), ' '.join(cmd))
+        proc = subprocess.Popen(cmd, stdout=open(ofname, 'w'), env=env)
+        self.pid = proc.pid
         try:
-            subprocess.check_call([exe, ifname], stdout=open(ofname, 'w'))
-            self.q_exitcode = 0
-        except subprocess.CalledProcessError as exitstatus:
-            logger.warning('Detected a non-zero exit status!', exitstatus)
-            self.q_exitcode = exitstatus.returncode
+            if monitor is None:
+                proc.wait()
+            while proc.poll() is None:
+                time.sleep(MONITOR_INTERVAL)
+                monitor(self)
+        except BaseException:
+            if proc.poll() is None:
+                proc.terminate()
+                proc.wait()
+            raise
+        self.pid = None
+        self.q_exitcode = proc.returncode
+        if self.q_exitcode != 0:
+            logger.warning('Detected a non-zero exit status %s!',
+                           self.q_exitcode)
 
         # check logfile
         self.checklogfile()
@@ -296,8 +382,38 @@ class WorkUnit(object):
                            'and an exitcode', self.q_exitcode)
             return self.status + self.q_exitcode
 
+    def progress(self):
+        """ Tail the logfile of the running Qdyn.
+
+        @return: (last MD step, wall-clock seconds per step or None)
+        """
+        try:
+            with open(self.logfile[0], 'rb') as fil:
+                fil.seek(0, os.SEEK_END)
+                fil.seek(max(0, fil.tell() - PROGRESS_TAIL))
+                tail = fil.read()
+        except IOError:
+            return 0, None
+        steps = STEP_LINE.findall(tail)
+        wallclock = WALLCLOCK_LINE.findall(tail)
+        step = int(steps[-1]) if steps else 0
+        try:
+            seconds = float(wallclock[-1]) if wallclock else None
+        except ValueError:
+            seconds = None
+        return step, seconds
+
     def checklogfile(self):
-        """ Check Logfile """
+        """ Check Logfile
+
+        The end of the log is read backwards, to check how Qdyn
+        terminated; then the log and the energies are compressed by
+        self.compressor, in one streaming pass, that also counts hot
+        atoms. Memory does not grow with the log.
+
+        A compressor in the background records the unit in the manifest,
+        when the log is compressed; until then, self.compressing is True.
+        """
 
         logger.debug("Checking log file ...")
 
@@ -307,25 +423,24 @@ class WorkUnit(object):
         # WARN_HOT_ATOM = 0
         self.hot_atoms = 0
 
-        log = []
-
-        logfile = self.logfile[0]
-
         if os.path.isfile(self.logfile[0]+".gz"):
             os.remove(self.logfile[0])
             self.logfile[0] = self.logfile[0]+".gz"
 
+        logfile = self.logfile[0]
+
         try:
             if logfile[-3:] == ".gz":
+                # no seeking backwards in gzip: stream, keep the tail
+                tail = collections.deque(maxlen=MIN_LOG_LINES)
                 for line in gzip.open(logfile):
-                    log.append(line)
+                    tail.append(line)
+                    if WARNING_HOT_ATOM in line:
+                        self.hot_atoms += 1
+                log = list(tail)
                 compress = False
             else:
-                with open(logfile) as fil:
-                    for line in fil:
-                        if line in DONT_LOG_LINES_WITH:
-                            continue
-                        log.append(line)
+                log = tail_lines(logfile, MIN_LOG_LINES)
                 compress = True
         except IOError:
             err = "Could not open log file!"
@@ -341,7 +456,7 @@ class WorkUnit(object):
                 self.errMsg += len('Last 5 Lines') * ' ' + ">" + logline
             self.errMsg += "/" + 'Last 5 Lines' + NLC + NLC
 
-        if len(log) < 100:
+        if len(log) < MIN_LOG_LINES:
             err = 'The log file is too short (less than 100 lines)!'
             logger.warning(err)
             self.errMsg += err
@@ -351,7 +466,7 @@ class WorkUnit(object):
             return ERR_LOG_TOO_SHORT
         else:
             # TODO: check if we have insane high energies
-            for line in log[-50:]:
+            for line in log[-TERM_LINES:]:
                 allok = 0
                 if NORMALTERM in line:
                     allok = 1
@@ -368,12 +483,6 @@ class WorkUnit(object):
                     self.errMsg += err
                     self.status = ERR_SHAKE
                     return ERR_SHAKE
-                elif WARNING_HOT_ATOM in line:
-                    if self.hot_atoms < 1:
-                        err = "Found HOT ATOM'"
-                        logger.warning(err)
-                        self.errMsg += err
-                    self.hot_atoms += 1
             if allok != 1:
                 err = 'The log file is missing ' + str(NORMALTERM) + ' string!'
                 err += ' UNKNOWN ERROR '
@@ -384,11 +493,8 @@ class WorkUnit(object):
 
                 return ERR_ABNORMAL_TERM
 
-        if compress:
-            # re-writing compressed logfile without rubbish lines
-            gzip.open(logfile+".gz", 'wb').writelines(log)
-            self.logfile[0] = logfile+".gz"
-            os.remove(logfile)
+        if self.hot_atoms > 0:
+            self._hot_atoms_found()
 
         # search and kill douplicate *rest.re files
         if self.restraintfile is not None and self.restartfile is not None:
@@ -401,19 +507,38 @@ class WorkUnit(object):
                         if comparefiles(restart, restre, False):
                             os.remove(restre)
 
+        self.status = 0
+
         # compress energyfile
         if self.energyfile is not None and len(self.energyfile) == 2:
             energy = self.energyfile[0]
             if os.path.isfile(energy) and energy[-3:] != ".gz":
-                engz = energy + ".gz"
-                with open(energy, 'rb') as fil_in:
-                    with gzip.open(engz, 'wb') as fil_out:
-                        shutil.copyfileobj(fil_in, fil_out)
-                        os.remove(energy)
+                self.compressor.submit(energy)
 
-        self.status = 0
+        if compress:
+            # re-writing compressed logfile without rubbish lines;
+            # a log.gz is always complete, see __init__
+            self.compressing = self.compressor.background
+            self.compressor.submit(logfile, DONT_LOG_LINES_WITH,
+                                   WARNING_HOT_ATOM, self._log_compressed)
         return 0
 
+    def _log_compressed(self, fname, hot_atoms):
+        """ Called by the compressor, when the log is compressed """
+        self.logfile[0] = fname
+        if hot_atoms > 0:
+            self.hot_atoms += hot_atoms
+            self._hot_atoms_found()
+        if self.compressing and self.manifest is not None:
+            self.manifest.record(self)
+        self.compressing = False
+
+    def _hot_atoms_found(self):
+        err = "Found HOT ATOM'"
+        logger.warning('%s hot atom warnings in %s', self.hot_atoms,
+                       self.logfile[0])
+        self.errMsg += err
+
     def _deploy(self):
         """ serialize data from memory-oject to disk (deploy to disk) """
         for data in (self.topology, self.pdbfile, self.fepfile,
@@ -438,6 +563,9 @@ class WorkUnit(object):
             #     continue
 
             if isinstance(fname, str) and isinstance(data, str):
+                # never write through a link into the node-local cache
+                if os.path.lexists(fname):
+                    os.remove(fname)
                 with open(fname, 'wb') as fil:
                     fil.write(data)
                 if WorkUnit.DEBUG:
@@ -457,6 +585,8 @@ class QdynPackage(object):
             logger.debug('is already mapped (skipping)!')
             return True
         elif self.mapped is False:
+            # the logs and energies are read
+            self.compressor.flush()
             with tools.cd(self.path):
                 if eqfil is None:
                     self.mapped = analysis.main(self.map_settings, eqfil)
@@ -496,18 +626,40 @@ class QdynPackage(object):
 
     def check_exe(self):
         """ check executable permissions, raises exception if not OK """
-        if (isinstance(self.q_dyn5_exe, str) and
-                os.path.isfile(self.q_dyn5_exe)):
-            if os.access(self.q_dyn5_exe, os.X_OK):
+        exe = self.q_dyn5_exe
+        if isinstance(exe, list):
+            # a launcher: the executable is the last item
+            exe = exe[-1]
+        if isinstance(exe, str) and os.path.isfile(exe):
+            if os.access(exe, os.X_OK):
                 pass
             else:
                 raise (Exception, 'executable is not executable!')
         else:
             raise (Exception, 'executable: is not file.')
 
-    def set_exe(self, exe):
-        """ set self.q_dyn5_exe to exe """
+    def set_exe(self, exe, env=None):
+        """ set self.q_dyn5_exe to exe, and its environment to env """
         self.q_dyn5_exe = exe
+        self.q_env = env
+
+    def set_monitor(self, monitor):
+        """ set the monitor of running workunits, see WorkUnit.run """
+        self.q_monitor = monitor
+
+    def set_compressor(self, compressor):
+        """ set the compression.Compressor of logs and energies """
+        self.compressor = compressor
+
+    def set_verify(self, verify):
+        """ verify=True: check the logs of finished workunits again,
+        instead of trusting the manifest """
+        self.manifest.verify = verify
+
+    def set_archived(self, archived):
+        """ archived: {fname: size} of the members of the simpack, that
+        were not extracted, see extraction.py """
+        self.manifest.archived = archived
 
     def set_temp(self, temp):
         """ cd into temp """
@@ -543,7 +695,11 @@ class QdynPackage(object):
         """
 
         self.set_temp(path)
+        self.manifest = manifest.Manifest(self.path)
 
+        self.q_env = None
+        self.q_monitor = None
+        self.compressor = compression.Compressor(background=False)
         if q_executable is not None:
             self.set_exe(q_executable)
 
@@ -673,6 +829,10 @@ class QdynPackage(object):
                             logger.debug(
                                     'skip step %s',
                                     self.inputfiles[self.if_pos][0])
+                            if not (self.cwu.trusted or
+                                    self.cwu.compressing):
+                                # checked the log, next time it is trusted
+                                self.manifest.record(self.cwu)
                             self._check_eq_and_map()
                             self.wus.append(self.cwu)
                             self.if_pos += 1
@@ -685,7 +845,11 @@ class QdynPackage(object):
                     if len(self.wus) != self.cwu.unitnumber:
                         raise (Exception, 'discrepancy in input file order')
 
-                    if self.cwu.run(exe) == 0:
+                    status = self.cwu.run(exe, self.q_env, self.q_monitor)
+                    if not self.cwu.compressing:
+                        # else recorded, when the log is compressed
+                        self.manifest.record(self.cwu)
+                    if status == 0:
                         self.wus.append(self.cwu)
                         self._check_eq_and_map()
                     else:
@@ -700,7 +864,9 @@ class QdynPackage(object):
                         err += str(self.cwu.errMsg) + NLC
                         err += 'Will Raise Exception...'
                         logger.warning(err)
-                        raise (Exception, 'computation failed')
+                        raise ComputeError(self.inputfiles[self.if_pos][0],
+                                           self.cwu.status or 0,
+                                           self.cwu.q_exitcode)
 
                     # increment for next step
                     self.if_pos += 1
@@ -756,7 +922,8 @@ class QdynPackage(object):
             # initial one, may need special input
             cwu = WorkUnit(self.if_pos, self.inputfiles[self.if_pos],
                            self.topology, self.pdbfile, self.fepfile,
-                           self.restraintfile, self.restartfile)
+                           self.restraintfile, self.restartfile,
+                           self.manifest, self.compressor)
 
         else:
             # try to locate the restart and restraint files that might be need
@@ -790,7 +957,7 @@ class QdynPackage(object):
             # TODO: multiple fep files could be taken from here as well
             cwu = WorkUnit(self.if_pos, self.inputfiles[self.if_pos],
                            self.topology, None, self.fepfile, restraint,
-                           restart)
+                           restart, self.manifest, self.compressor)
         return cwu
 
     def is_finished(self):
@@ -815,9 +982,25 @@ class MolDynSim(object):
                                 description, pdbfile, restartfile,
                                 restraintfile, fepfile, map_settings)
 
-    def set_executable(self, exe):
+    def set_executable(self, exe, env=None):
         """ set executable """
-        self.pack.set_exe(exe)
+        self.pack.set_exe(exe, env)
+
+    def set_monitor(self, monitor):
+        """ set monitor, see WorkUnit.run """
+        self.pack.set_monitor(monitor)
+
+    def set_compressor(self, compressor):
+        """ set compressor, see QdynPackage.set_compressor """
+        self.pack.set_compressor(compressor)
+
+    def set_verify(self, verify):
+        """ check finished workunits, see QdynPackage.set_verify """
+        self.pack.set_verify(verify)
+
+    def set_archived(self, archived):
+        """ outputs left in the archive, see QdynPackage.set_archived """
+        self.pack.set_archived(archived)
 
     def set_tempdir(self, temp):
         """ set temporary directory """
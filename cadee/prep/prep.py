@@ -19,7 +19,6 @@ from random import randint
 import argparse
 import os
 import shutil
-import tarfile
 import tempfile
 import time
 import qprep5 as qprep5
@@ -80,11 +79,11 @@ def pack_tarballs(parentdir, seeds=1):
         return None
 
     def _pack(tarfil):
-        """Add a files to the tarball"""
-        tar = tarfile.open(name=tarfil, mode='w')
-        for fil in os.listdir('.'):
-            tar.add(fil)
-        tar.close()
+        """Add a files to the tarball, with an index of their digests"""
+        # not at the top: the dyn modules log with tools, that imports mpi
+        from cadee.dyn import archive
+        archive.remove(tarfil)
+        archive.SimpackArchive(tarfil).append(sorted(os.listdir('.')))
 
     os.chdir(parentdir)
     for mutant in os.listdir('.'):
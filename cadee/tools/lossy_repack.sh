@@ -15,6 +15,9 @@ sleep 5
 
 set -e
 
+PYTHON=${PYTHON:-python}
+ARCHIVE="$(cd "$(dirname "$0")/../dyn"; pwd)/archive.py"
+
 wd=$PWD
 for fil in $(ls *.tar)
 do
@@ -22,9 +25,10 @@ do
     cd $wd
     mkdir -p /dev/shm/tmp/$$
     cd /dev/shm/tmp/$$
-    tar xf $wd/$fil
+    # the latest version of every member, decompressed
+    $PYTHON $ARCHIVE $wd/$fil
     echo compress
-    rm -f *dcd
+    rm -f *.dcd
     echo hash
     md5sum * > hashes.md5
     echo repack
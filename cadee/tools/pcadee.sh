@@ -13,6 +13,8 @@
 # Version: 0.1
 # 
 # Description: Iterate trough a folder with Simpacks, using Qdyn6p.
+#              NOTE: 'cadee dyn --cores_per_simpack N' runs Qdyn6p from the
+#              ensemble (multi-node, shared scheduling, see dyn/packing.py).
 #              Make sure you first test and adjust the child-script (srunq.sh).
 #              Also note, that the child-script is expected to be placed in the
 #              same folder like this script (see DIR-var need to adjust this).
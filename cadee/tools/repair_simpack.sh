@@ -33,6 +33,7 @@ echo "
 
     This script will ...
 
+    0. Search incomplete compressed files (*.gz.tmp).
     1. Search duplicate logfiles.
     2. Search duplicate energy files.
     3. Search missing restartfiles.
@@ -69,6 +70,9 @@ then
     usage
 fi
 
+PYTHON=${PYTHON:-python}
+ARCHIVE="$(cd "$(dirname "$0")/../dyn"; pwd)/archive.py"
+
 TMPFOLDER="/$TEMP/$$"
 
 if [ -d $TMPFOLDER ]
@@ -91,19 +95,36 @@ trap finish INT TERM
 
 pwd
 
+# the latest version of every member, compressed members are decompressed
 set +e
-tar xf $simpack
+$PYTHON $ARCHIVE $simpack
 tarexit=$?
 set -e
 
 
 if [ $tarexit -ne 0 ]
 then
-echo "tar exit code: $tarexit"
+echo "archive exit code: $tarexit"
 if [ "$2" == '--force' ]
 then
     echo Specified --force flag.
-    echo Will now repack the tar archive.
+    echo Will now unpack with tar and repack the tar archive.
+    # tar extracts every version, the last one wins; members compressed
+    # by cadee dyn --compress keep their suffix (eg. .dcd.gz)
+    set +e
+    tar xf $simpack
+    # the compressed version was appended last, it replaces the plain one;
+    # logs and energies are gzipped by Qdyn runs themselves
+    for file in $(/bin/ls *.gz *.bz2 *.xz 2>/dev/null || true)
+    do
+        case $file in
+            *.log.gz|*.en.gz) ;;
+            *.gz) gunzip -f $file ;;
+            *.bz2) bunzip2 -f $file ;;
+            *.xz) unxz -f $file ;;
+        esac
+    done
+    set -e
     found=1
 else
     echo There was an error unpacking.
@@ -111,7 +132,15 @@ else
     exit 2
 fi
 fi
-    
+
+echo "0. Searching incomplete compressed files:"
+for file in $(/bin/ls *.gz.tmp 2>/dev/null || true)
+do
+    echo "Compression of ${file%.gz.tmp} was interrupted. Removing $file ..."
+    /bin/rm -v $file
+    let found+=1
+done
+
 
 
 echo "1. Searching duplicate logfiles:"
@@ -176,8 +205,8 @@ do
     then
         echo "The logfile exists, but there is no restartfile. Removing outpuffiles of $file ..."
         /bin/rm -v $file
-        /bin/rm -f -v "${file%.log.gz}.dcd"
-        /bin/rm -f -v "${file%.log.gz}.en.gz"
+        /bin/rm -f -v "${file%.log.gz}".dcd*
+        /bin/rm -f -v "${file%.log.gz}".en*
         /bin/rm -f -v "${file%.log.gz}.log"
         let found+=1
     fi
@@ -194,9 +223,9 @@ do
         /bin/rm $file
         fn="${file%.*}"
         fn="${fn%.*}"
-        /bin/rm $fn.re
-        /bin/rm $fn.dcd
-        /bin/rm $fn.en
+        /bin/rm -f $fn.re*
+        /bin/rm -f $fn.dcd*
+        /bin/rm -f $fn.en*
         let found+=1
     fi
 done
@@ -258,10 +287,10 @@ then
         	noext="${fil/.en/}"
     	        echo "Energy File Size for $fil is invalid ($size). Removing $noext/en/re/log/dcd ..."
         	echo $noext
-                /bin/rm -rfv "${noext}.dcd"
+                /bin/rm -rfv "${noext}".dcd*
                 /bin/rm -rfv "${noext}.log"
                 /bin/rm -rfv "${noext}.log.gz"
-                /bin/rm -rfv "${noext}.re"
+                /bin/rm -rfv "${noext}".re*
         	/bin/rm -rfv "$fil"
             fi  
         done
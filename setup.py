@@ -116,7 +116,7 @@ setup(name='cadee',
       py_modules=['cadee'],
       package_data={'cadee': ['lib/*', 'qscripts/lib/*', 'qscripts/REAMDE.md', 'qscripts/LICENSE.txt', 'executables/q/q*', 'tools/*', 'version.py']},
       install_requires=[
-          ['mpi4py==1.3.1'],
+          ['mpi4py>=2.0.0'],
           ['numpy'],
       ],
       scripts={